@@ -5,17 +5,58 @@ from flask_wtf import CSRFProtect
 # Initialize extensions
 csrf = CSRFProtect()
 
-def create_app():
-    """Application factory"""
+def create_app(config=None):
+    """Application factory; `config` overrides settings read from the environment"""
     app = Flask(__name__)
     
     # Configuration
     app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY') or 'your-secret-key-here'
     app.config['WTF_CSRF_ENABLED'] = True
+    app.config['POSTS_PER_PAGE'] = int(os.environ.get('POSTS_PER_PAGE', 20))
+    # Storage backend: 'json' (posts.json), 'wal' (append-only log),
+    # 'split' (metadata and bodies in separate files) or 'sqlite'
+    app.config['STORAGE_BACKEND'] = os.environ.get('STORAGE_BACKEND', 'json')
+    app.config['SQLITE_PATH'] = os.environ.get('SQLITE_PATH') or os.path.join(app.root_path, 'blog.db')
+    # File backends save their search index after this many re-indexed posts (and at exit)
+    app.config['SEARCH_SAVE_EVERY'] = int(os.environ.get('SEARCH_SAVE_EVERY', 256))
+    # How long a session's identity is trusted before the account is re-checked
+    app.config['IDENTITY_RECHECK_SECONDS'] = float(os.environ.get('IDENTITY_RECHECK_SECONDS', 5))
+    # Password hashing: 'scrypt' (cost = log2 N) or 'pbkdf2_sha256' (cost = iterations)
+    app.config['PASSWORD_HASH_METHOD'] = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt')
+    app.config['PASSWORD_HASH_COST'] = os.environ.get('PASSWORD_HASH_COST')
+    # Threads that run password hashing, and how many checks may wait for them
+    app.config['PASSWORD_HASH_WORKERS'] = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+    app.config['PASSWORD_HASH_QUEUE'] = int(os.environ.get('PASSWORD_HASH_QUEUE', 32))
+    # Size cap of the rendered page cache for anonymous readers (0 disables it)
+    app.config['PAGE_CACHE_BYTES'] = int(os.environ.get('PAGE_CACHE_BYTES', 8 * 1024 * 1024))
+    # Server-Timing headers and the /metrics endpoint
+    app.config['METRICS_ENABLED'] = os.environ.get('METRICS_ENABLED', '1') != '0'
+    # Merge identical post reads made at the same time into one (on by default under asgi.py)
+    app.config['COALESCE_READS'] = os.environ.get('COALESCE_READS', '0') != '0'
+    # Threads serving requests when run through asgi.py
+    app.config['ASGI_WORKERS'] = int(os.environ.get('ASGI_WORKERS', 32))
+    # Group commit: post writes arriving within WRITE_BATCH_DELAY seconds of
+    # each other (up to WRITE_BATCH_SIZE) are stored with one durable write
+    app.config['GROUP_COMMIT'] = os.environ.get('GROUP_COMMIT', '1') != '0'
+    app.config['WRITE_BATCH_DELAY'] = float(os.environ.get('WRITE_BATCH_DELAY', 0.002))
+    app.config['WRITE_BATCH_SIZE'] = int(os.environ.get('WRITE_BATCH_SIZE', 64))
+    app.config.update(config or {})
     
     # Initialize extensions with app
     csrf.init_app(app)
     
+    # Request instrumentation first, so every other hook is measured
+    from controllers.metrics import init_app as init_metrics
+    init_metrics(app)
+    
+    # Initialize post storage
+    from storage.post_repository import init_app as init_post_storage
+    init_post_storage(app)
+    from controllers.page_cache import init_app as init_page_cache
+    init_page_cache(app)
+    from controllers.passwords import init_app as init_passwords
+    init_passwords(app)
+    
     # Custom template filter for line breaks
     @app.template_filter('nl2br')
     def nl2br_filter(text):
@@ -27,8 +68,20 @@ def create_app():
     # Register blueprints
     from routes.post_routes import post_bp
     from routes.auth_routes import auth_bp
+    from routes.api_routes import api_bp
     app.register_blueprint(post_bp)
     app.register_blueprint(auth_bp)
+    # The JSON API is used by non-browser clients without CSRF tokens
+    csrf.exempt(api_bp)
+    app.register_blueprint(api_bp)
+    from routes.metrics_routes import metrics_bp
+    app.register_blueprint(metrics_bp)
+    
+    # Register CLI commands
+    from cli.storage_commands import storage_cli
+    app.cli.add_command(storage_cli)
+    from cli.post_commands import posts_cli
+    app.cli.add_command(posts_cli)
     
     @app.route('/')
     def home():
@@ -0,0 +1,194 @@
+"""
+ASGI entry point.
+
+Serves the same Flask app as create_app() from an asyncio server, e.g.:
+
+    uvicorn --factory asgi:create_asgi_app --workers 2
+
+Each request runs in a thread pool (ASGI_WORKERS threads, default 32), so
+blocking storage reads and template rendering never stall the event loop,
+and many more requests can wait on slow reads at once than a sync worker
+has threads. Identical concurrent post reads are coalesced into one
+storage read (COALESCE_READS). Response bodies are passed on chunk by
+chunk, so streamed listings stay streamed.
+"""
+
+import os
+import sys
+import asyncio
+import threading
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+from app import create_app
+
+# Chunks buffered between a request thread and the event loop
+QUEUE_CHUNKS = 8
+
+class AsgiAdapter:
+    """
+    Minimal ASGI (HTTP and lifespan) wrapper around a WSGI application.
+    The WSGI call and the iteration of its body run in `executor`; body
+    chunks are handed to the event loop through a small bounded queue, so
+    a slow client holds back the producing thread instead of memory.
+    """
+    def __init__(self, wsgi_app, workers=32):
+        self.wsgi_app = wsgi_app
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix='asgi')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+        else:
+            raise ValueError(f'Unsupported ASGI scope type: {scope["type"]}')
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    @staticmethod
+    async def _read_body(receive):
+        chunks = []
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return None
+            chunks.append(message.get('body', b''))
+            if not message.get('more_body'):
+                return b''.join(chunks)
+
+    @staticmethod
+    def _environ(scope, body):
+        server = scope.get('server') or ('localhost', 80)
+        client = scope.get('client') or ('', 0)
+        # The ASGI path includes the root path; WSGI splits them
+        root_path, path = scope.get('root_path', '').rstrip('/'), scope['path']
+        if root_path and (path == root_path or path.startswith(root_path + '/')):
+            path = path[len(root_path):]
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': root_path.encode('utf-8').decode('latin-1'),
+            'PATH_INFO': path.encode('utf-8').decode('latin-1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': f'HTTP/{scope.get("http_version", "1.1")}',
+            'REMOTE_ADDR': client[0],
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+        }
+        for name, value in scope.get('headers', ()):
+            name = name.decode('latin-1').upper().replace('-', '_')
+            value = value.decode('latin-1')
+            if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                environ[name] = value
+                continue
+            key = 'HTTP_' + name
+            if key in environ:
+                value = environ[key] + ('; ' if key == 'HTTP_COOKIE' else ',') + value
+            environ[key] = value
+        return environ
+
+    def _run(self, environ, loop, queue, cancelled):
+        """Call the WSGI app in a worker thread and feed its output to `queue`"""
+        response = {}
+
+        def put(item):
+            asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+        def write(data):
+            # Headers go out with the first body data, whichever way it comes
+            if not data:
+                return
+            if not response.get('sent'):
+                response['sent'] = True
+                put(('start', response['status'], response['headers']))
+            put(('body', data))
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and response.get('sent'):
+                raise exc_info[1].with_traceback(exc_info[2])
+            response['status'] = status
+            response['headers'] = headers
+            return write
+
+        try:
+            iterable = self.wsgi_app(environ, start_response)
+            try:
+                for chunk in iterable:
+                    if cancelled.is_set():
+                        break
+                    write(chunk)
+            finally:
+                if hasattr(iterable, 'close'):
+                    iterable.close()
+            if not response.get('sent'):
+                put(('start', response['status'], response['headers']))
+            put(('end',))
+        except BaseException as e:
+            put(('error', e))
+
+    async def _http(self, scope, receive, send):
+        body = await self._read_body(receive)
+        if body is None:
+            return
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(QUEUE_CHUNKS)
+        cancelled = threading.Event()
+        future = loop.run_in_executor(self.executor, self._run, self._environ(scope, body),
+                                      loop, queue, cancelled)
+        started = False
+        try:
+            while True:
+                item = await queue.get()
+                if item[0] == 'start':
+                    status, headers = item[1], item[2]
+                    await send({
+                        'type': 'http.response.start',
+                        'status': int(status.split(' ', 1)[0]),
+                        'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                                    for name, value in headers]
+                    })
+                    started = True
+                elif item[0] == 'body':
+                    await send({'type': 'http.response.body', 'body': item[1], 'more_body': True})
+                elif item[0] == 'end':
+                    await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+                    break
+                else:
+                    if started:
+                        raise item[1]
+                    await send({'type': 'http.response.start', 'status': 500,
+                                'headers': [(b'content-type', b'text/plain')]})
+                    await send({'type': 'http.response.body', 'body': b'Internal Server Error'})
+                    raise item[1]
+        finally:
+            # On a client disconnect, let the worker thread finish: it sees
+            # the flag at its next chunk and the drained queue never blocks it
+            cancelled.set()
+            while not future.done():
+                try:
+                    await asyncio.wait_for(queue.get(), 0.05)
+                except asyncio.TimeoutError:
+                    pass
+
+def create_asgi_app(**config):
+    """
+    Build the Flask app, with coalesced reads unless COALESCE_READS=0 is
+    set, and wrap it for ASGI servers. Keyword arguments override settings.
+    """
+    config.setdefault('COALESCE_READS', os.environ.get('COALESCE_READS', '1') != '0')
+    app = create_app(config)
+    return AsgiAdapter(app, workers=app.config['ASGI_WORKERS'])
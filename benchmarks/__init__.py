@@ -0,0 +1,2 @@
+# Flask Blog Application
+# Benchmarks package
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Concurrent read load: sync workers against the ASGI entry point.
+
+A synthetic corpus (benchmarks/corpus.py) is served with the page cache
+off and every post read slowed down to --read-delay on a device that
+serves --read-concurrency reads at a time, standing in for a cold disk or
+a network filesystem. --clients concurrent clients then send the requests
+of a --workload, in three setups with --workers threads each:
+
+  mix       post pages (popular posts drawn with a Zipf-like skew), the
+            post list, tag listings and searches
+  hot       a burst on a few pages: the post list, the top tag's listing
+            and the most popular post
+
+  sync      threads calling the WSGI app, like a pool of sync workers:
+            a request waiting on storage holds its worker
+  asgi      asgi.AsgiAdapter
+  asgi+co   the same with COALESCE_READS, so identical concurrent reads
+            share one storage read
+
+Everything runs in-process (no sockets), so the numbers show how the
+serving model copes with slow reads rather than HTTP overhead. With the
+same number of threads, asgi alone serves no more requests than sync (the
+threads still block on reads). Coalescing pays off when the reads, not
+rendering, are the limit and many clients want the same ones at once: the
+hot workload with --read-concurrency 2, say. With 8 reads at a time both
+workloads are bound by template rendering and the three setups are even.
+
+Usage:
+    python -m benchmarks.asgi_load --posts 5000 --clients 64 --requests 20
+    python -m benchmarks.asgi_load --workload hot
+"""
+
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import threading
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import corpus
+
+SETUPS = ('sync', 'asgi', 'asgi+co')
+WORKLOADS = ('mix', 'hot')
+
+class SlowReads:
+    """
+    Repository wrapper that makes every post read take `delay` seconds on
+    a device serving at most `concurrency` reads at a time
+    """
+    SLOWED = frozenset(('get', 'page', 'page_by_tag', 'search', 'tag_counts'))
+
+    def __init__(self, repository, delay, concurrency):
+        self.repository = repository
+        self.delay = delay
+        self._device = threading.BoundedSemaphore(concurrency)
+
+    def __getattr__(self, name):
+        attribute = getattr(self.repository, name)
+        if name not in self.SLOWED:
+            return attribute
+
+        def read(*args, **kwargs):
+            with self._device:
+                time.sleep(self.delay)
+            return attribute(*args, **kwargs)
+        return read
+
+def percentile(latencies, p):
+    return latencies[min(len(latencies) - 1, int(len(latencies) * p))] if latencies else 0.0
+
+def create_app_for(data, backend, read_delay, read_concurrency, coalesce):
+    from benchmarks.routes import create_app_for as create_benchmark_app
+    from storage.coalescing import CoalescingReader
+    from storage.post_repository import create_repository, set_post_repository
+    app = create_benchmark_app(data, backend, 'pbkdf2_sha256', 1, PAGE_CACHE_BYTES=0)
+    repository = SlowReads(create_repository(app.config), read_delay, read_concurrency)
+    if coalesce:
+        repository = CoalescingReader(repository)
+    set_post_repository(repository)
+    return app
+
+def make_paths(data, count, rng, workload='mix'):
+    """
+    `count` request paths. mix: 70% post pages, 10% each list, tag and
+    search; hot: the post list, the top tag and the top post in turn.
+    """
+    published = data['published']
+    if workload == 'hot':
+        hot = ['/posts/', f'/posts/tag/{data["tags"][0]}', f'/posts/{published[0]}']
+        return [hot[n % len(hot)] for n in range(count)]
+    weights = corpus._zipf_weights(len(published))
+    words = corpus.WORDS[:20]
+    paths = []
+    for _ in range(count):
+        kind = rng.random()
+        if kind < 0.7:
+            paths.append(f'/posts/{rng.choices(published, weights)[0]}')
+        elif kind < 0.8:
+            paths.append('/posts/')
+        elif kind < 0.9:
+            paths.append(f'/posts/tag/{rng.choice(data["tags"][:5])}')
+        else:
+            paths.append(f'/posts/search?q={rng.choice(words)}')
+    return paths
+
+def _scope(path):
+    path, _, query = path.partition('?')
+    return {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+        'method': 'GET', 'scheme': 'http', 'path': path, 'root_path': '',
+        'query_string': query.encode('latin-1'), 'headers': [(b'host', b'localhost')],
+        'server': ('localhost', 80), 'client': ('127.0.0.1', 0)
+    }
+
+async def asgi_request(adapter, path):
+    """Send one GET through the ASGI adapter; return (status, body bytes)"""
+    messages = iter(({'type': 'http.request', 'body': b'', 'more_body': False},))
+    response = {'status': None, 'size': 0}
+
+    async def receive():
+        return next(messages, {'type': 'http.disconnect'})
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+        else:
+            response['size'] += len(message.get('body', b''))
+    await adapter(_scope(path), receive, send)
+    return response['status'], response['size']
+
+def wsgi_request(app, path):
+    """Call the WSGI app directly, reading the whole body, like a sync worker"""
+    from werkzeug.test import EnvironBuilder
+    environ = EnvironBuilder(path=path).get_environ()
+    status = []
+    iterable = app(environ, lambda s, headers, exc_info=None: status.append(s))
+    try:
+        size = sum(len(chunk) for chunk in iterable)
+    finally:
+        if hasattr(iterable, 'close'):
+            iterable.close()
+    return int(status[0].split(' ', 1)[0]), size
+
+async def run_clients(request, paths, clients):
+    latencies = []
+    errors = 0
+    queue = iter(paths)
+
+    async def client():
+        nonlocal errors
+        for path in queue:
+            started = time.perf_counter()
+            status, _ = await request(path)
+            latencies.append(time.perf_counter() - started)
+            if status != 200:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(clients)))
+    return time.perf_counter() - started, sorted(latencies), errors
+
+def run_setup(name, data, args, paths):
+    app = create_app_for(data, args.backend, args.read_delay, args.read_concurrency,
+                         coalesce=name == 'asgi+co')
+    if name == 'sync':
+        pool = ThreadPoolExecutor(args.workers)
+        loop_request = lambda path: asyncio.get_running_loop().run_in_executor(pool, wsgi_request, app, path)
+    else:
+        from asgi import AsgiAdapter
+        adapter = AsgiAdapter(app, workers=args.workers)
+        pool = adapter.executor
+        loop_request = lambda path: asgi_request(adapter, path)
+    try:
+        elapsed, latencies, errors = asyncio.run(run_clients(loop_request, paths, args.clients))
+    finally:
+        pool.shutdown()
+    return {
+        'setup': name,
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput_rps': len(latencies) / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(latencies, 0.5) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backend', choices=('json', 'wal', 'split', 'sqlite'), default='json')
+    parser.add_argument('--posts', type=int, default=5000, help='posts in the corpus')
+    parser.add_argument('--clients', type=int, default=64, help='concurrent clients')
+    parser.add_argument('--requests', type=int, default=20, help='requests per client')
+    parser.add_argument('--read-delay', type=float, default=0.01, help='seconds added to every post read')
+    parser.add_argument('--read-concurrency', type=int, default=8, help='reads the slow device serves at once')
+    parser.add_argument('--workers', type=int, default=32, help='request threads of every setup')
+    parser.add_argument('--setups', default=','.join(SETUPS), help='comma-separated setups to run')
+    parser.add_argument('--workload', choices=WORKLOADS, default='mix')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    setups = [name for name in args.setups.split(',') if name]
+    unknown = set(setups) - set(SETUPS)
+    if unknown:
+        parser.error(f'unknown setups: {", ".join(sorted(unknown))}')
+
+    directory = tempfile.mkdtemp(prefix='blog-asgi-load-')
+    data = corpus.build(directory, args.backend, args.posts, 10, args.seed, 'pbkdf2_sha256', 1)
+    paths = make_paths(data, args.clients * args.requests, random.Random(args.seed), args.workload)
+
+    print(f'{args.workload}: {args.posts} posts, {args.clients} clients, {args.workers} threads, '
+          f'{args.read_delay * 1000:g} ms per read, {args.read_concurrency} reads at a time')
+    print(f'{"setup":<9} {"req/s":>9} {"p50 ms":>9} {"p99 ms":>9} {"errors":>7}')
+    for name in setups:
+        row = run_setup(name, data, args, paths)
+        print(f'{name:<9} {row["throughput_rps"]:>9.1f} {row["p50_ms"]:>9.2f} '
+              f'{row["p99_ms"]:>9.2f} {row["errors"]:>7}')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,122 @@
+"""
+Synthetic blog corpora for the benchmarks.
+
+A corpus is a post store of any backend plus a user list, generated from a
+seed so every run sees the same data: titles and bodies drawn from a word
+list with a long-tailed length spread, authors and tags picked with a
+Zipf-like skew (a few prolific authors and popular tags, many rare ones),
+about 15% drafts, and creation dates spread over three years.
+"""
+
+import os
+import sys
+import json
+import random
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from controllers.passwords import hash_password
+from storage.post_repository import create_repository
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Password of every generated account
+PASSWORD = 'benchmark-password'
+# Share of generated posts left as drafts
+DRAFT_RATIO = 0.15
+# Posts written per insert_many call while filling the store
+FILL_BATCH = 5000
+
+WORDS = '''
+python flask web server request response template cache storage index query
+page post draft author editor reader publish write read memory disk latency
+thread process worker queue lock file format json table column row search
+token score rank feature release version deploy config backend frontend user
+session cookie login password hash security review test bench profile metric
+garden recipe travel music film book coffee morning evening weekend city river
+mountain ocean forest winter summer spring autumn market school family friend
+'''.split()
+
+def _zipf_weights(count, skew=1.1):
+    return [1 / (rank ** skew) for rank in range(1, count + 1)]
+
+def load_tags():
+    """The tag list the app ships with (tags.json)"""
+    with open(os.path.join(ROOT, 'tags.json'), 'r') as f:
+        return json.load(f)
+
+def make_users(count):
+    """(username, email) pairs of the generated accounts"""
+    return [(f'user{i}', f'user{i}@example.com') for i in range(count)]
+
+def make_posts(count, usernames, tags, rng):
+    """Generate `count` post dicts with ids 1..count, oldest first"""
+    authors = usernames[:max(1, min(len(usernames), 500))]
+    author_weights = _zipf_weights(len(authors))
+    tag_weights = _zipf_weights(len(tags))
+    start = datetime(2022, 1, 1)
+    step = timedelta(days=3 * 365) / max(1, count)
+    posts = []
+    for i in range(count):
+        # Log-normal body length: median ~150 words, a long tail of essays
+        length = max(10, min(3000, int(rng.lognormvariate(5.0, 0.7))))
+        created_at = (start + step * i).isoformat(timespec='seconds')
+        posts.append({
+            'id': i + 1,
+            'title': ' '.join(rng.choices(WORDS, k=rng.randint(3, 8))).capitalize(),
+            'body': ' '.join(rng.choices(WORDS, k=length)),
+            'author': rng.choices(authors, author_weights)[0],
+            'is_published': rng.random() >= DRAFT_RATIO,
+            'tags': sorted(set(rng.choices(tags, tag_weights, k=rng.choice((0, 1, 1, 2, 2, 3, 4))))),
+            'created_at': created_at,
+            'updated_at': created_at
+        })
+    return posts
+
+def make_config(backend, directory):
+    return {
+        'STORAGE_BACKEND': backend,
+        'POSTS_FILE': os.path.join(directory, 'posts.json'),
+        'SQLITE_PATH': os.path.join(directory, 'blog.db')
+    }
+
+def build(directory, backend='json', posts=1000, users=1000, seed=0,
+          hash_method='scrypt', hash_cost=None):
+    """
+    Write a corpus into `directory` and return its description: the store
+    config, the users file, the published and draft post ids and the
+    generated users. All accounts share one password hash, computed once.
+    """
+    rng = random.Random(seed)
+    tags = load_tags()
+    accounts = make_users(users)
+    stored_password = hash_password(PASSWORD, hash_method, hash_cost)
+    config = make_config(backend, directory)
+    users_file = os.path.join(directory, 'users.txt')
+
+    repository = create_repository(config)
+    try:
+        generated = make_posts(posts, [username for username, _ in accounts], tags, rng)
+        repository.allocate_ids(len(generated))
+        for start in range(0, len(generated), FILL_BATCH):
+            repository.insert_many(generated[start:start + FILL_BATCH])
+        if backend == 'sqlite':
+            database = repository.database
+            database.save_tags(tags)
+            with database.transaction() as conn:
+                conn.executemany('INSERT INTO users (email, username, password) VALUES (?, ?, ?)',
+                                 [(email, username, stored_password) for username, email in accounts])
+        else:
+            with open(users_file, 'w') as f:
+                f.writelines(f'{username},{email},{stored_password}\n' for username, email in accounts)
+    finally:
+        repository.close()
+
+    return {
+        'config': config,
+        'users_file': users_file,
+        'published': [post['id'] for post in generated if post['is_published']],
+        'drafts': [post['id'] for post in generated if not post['is_published']],
+        'users': accounts,
+        'tags': tags
+    }
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Memory and allocations of post listings.
+
+Fills a temporary store with synthetic posts, then measures one page from
+list_posts(): the bytes the page keeps alive per post, the peak memory
+used while building it (including copies thrown away on the way), the
+allocations it keeps, and the time per listing.
+
+Usage:
+    python -m benchmarks.listing_memory --backend json --posts 5000 --page 100
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage.post_repository import create_repository, set_post_repository
+
+def fill(repository, count):
+    start = datetime(2024, 1, 1)
+    first_id = repository.allocate_ids(count)
+    repository.insert_many([{
+        'id': first_id + i,
+        'title': f'Synthetic post number {i}',
+        'body': 'Lorem ipsum dolor sit amet. ' * 40,
+        'author': f'author{i % 20}',
+        'is_published': True,
+        'tags': ['Python', 'Flask'] if i % 2 else ['News'],
+        'created_at': (start + timedelta(minutes=i)).isoformat(),
+        'updated_at': (start + timedelta(minutes=i)).isoformat()
+    } for i in range(count)])
+
+def measure(page_size, repeat):
+    from controllers.post_controller import list_posts
+    list_posts(limit=page_size)  # warm up caches and imports
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    baseline = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    page = list_posts(limit=page_size)
+    peak = tracemalloc.get_traced_memory()[1] - baseline
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    stats = after.compare_to(before, 'traceback')
+    retained = sum(stat.size_diff for stat in stats)
+    allocations = sum(max(0, stat.count_diff) for stat in stats)
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        list_posts(limit=page_size)
+    elapsed = (time.perf_counter() - started) / repeat
+    return {
+        'posts': len(page),
+        'bytes_per_post': retained / max(1, len(page)),
+        'peak_bytes_per_post': peak / max(1, len(page)),
+        'allocations_per_post': allocations / max(1, len(page)),
+        'ms_per_listing': elapsed * 1000
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backend', choices=('json', 'wal', 'split', 'sqlite'), default='json')
+    parser.add_argument('--posts', type=int, default=5000, help='posts in the store')
+    parser.add_argument('--page', type=int, default=100, help='posts per listing')
+    parser.add_argument('--repeat', type=int, default=200, help='listings timed')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='blog-listing-')
+    repository = create_repository({
+        'STORAGE_BACKEND': args.backend,
+        'POSTS_FILE': os.path.join(directory, 'posts.json'),
+        'SQLITE_PATH': os.path.join(directory, 'blog.db')
+    })
+    set_post_repository(repository)
+    fill(repository, args.posts)
+    result = measure(args.page, args.repeat)
+    print(f'{args.backend}: {result["posts"]} posts per page')
+    print(f'  bytes per post       {result["bytes_per_post"]:.0f}')
+    print(f'  peak bytes per post  {result["peak_bytes_per_post"]:.0f}')
+    print(f'  allocations per post {result["allocations_per_post"]:.1f}')
+    print(f'  ms per listing       {result["ms_per_listing"]:.3f}')
+    set_post_repository(None)
+
+if __name__ == '__main__':
+    main()
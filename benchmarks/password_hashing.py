@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Login throughput at different password hashing costs.
+
+For each cost setting, many client threads verify a password at once
+through the same bounded hashing pool the app uses, and the script reports
+logins per second, median and 95th percentile latency, and how many
+attempts were turned away because the queue was full.
+
+Usage:
+    python -m benchmarks.password_hashing --method scrypt --costs 12,13,14,15
+    python -m benchmarks.password_hashing --method pbkdf2_sha256 --costs 100000,300000,600000
+"""
+
+import os
+import sys
+import time
+import argparse
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from controllers.passwords import HashingBusy, PasswordHasher, hash_password
+
+def run(method, cost, workers, queue, clients, logins):
+    hasher = PasswordHasher(method, cost, workers, queue)
+    stored = hash_password('correct horse battery staple', method, cost)
+    latencies = []
+    rejected = [0]
+    lock = threading.Lock()
+    per_client = max(1, logins // clients)
+
+    def client():
+        for _ in range(per_client):
+            started = time.perf_counter()
+            try:
+                ok = hasher.verify('correct horse battery staple', stored)
+            except HashingBusy:
+                with lock:
+                    rejected[0] += 1
+                continue
+            assert ok
+            with lock:
+                latencies.append(time.perf_counter() - started)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    hasher.pool.shutdown()
+
+    latencies.sort()
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000 if latencies else 0.0
+    return {
+        'logins_per_second': len(latencies) / elapsed,
+        'p50_ms': percentile(0.5),
+        'p95_ms': percentile(0.95),
+        'rejected': rejected[0]
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--method', choices=('scrypt', 'pbkdf2_sha256'), default='scrypt')
+    parser.add_argument('--costs', default=None,
+                        help='comma-separated costs (log2 N for scrypt, iterations for pbkdf2_sha256)')
+    parser.add_argument('--workers', type=int, default=2, help='hashing pool threads')
+    parser.add_argument('--queue', type=int, default=32, help='hashing pool queue limit')
+    parser.add_argument('--clients', type=int, default=16, help='concurrent login threads')
+    parser.add_argument('--logins', type=int, default=64, help='login attempts per cost')
+    args = parser.parse_args()
+
+    if args.costs:
+        costs = [int(cost) for cost in args.costs.split(',')]
+    elif args.method == 'scrypt':
+        costs = [12, 13, 14, 15]
+    else:
+        costs = [100000, 300000, 600000]
+
+    print(f'{args.method}: {args.workers} workers, queue {args.queue}, {args.clients} clients')
+    print(f'{"cost":>10} {"logins/s":>10} {"p50 ms":>10} {"p95 ms":>10} {"rejected":>10}')
+    for cost in costs:
+        result = run(args.method, cost, args.workers, args.queue, args.clients, args.logins)
+        print(f'{cost:>10} {result["logins_per_second"]:>10.1f} {result["p50_ms"]:>10.1f} '
+              f'{result["p95_ms"]:>10.1f} {result["rejected"]:>10}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Throughput and latency of the main pages at realistic corpus sizes.
+
+For each corpus size a synthetic store is generated (see
+benchmarks/corpus.py), the app is created on it, and each scenario sends
+sequential requests through the Flask test client: the post list, random
+post pages, the drafts list, creating and publishing posts, logging in and
+signing up. Every response body is read in full, so streamed pages are
+timed to their last byte.
+
+Results are written as JSON (--output) with the commit they were measured
+on. Pass a previous result file as --compare to list the scenarios whose
+median latency got worse by more than --tolerance; the exit status is 1
+when there are any, so this can gate a CI job.
+
+Usage:
+    python -m benchmarks.routes --sizes 1000,10000,100000 --users 100000 --output bench.json
+    python -m benchmarks.routes --sizes 1000 --requests 100 --compare bench.json
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import corpus
+
+SCENARIOS = ('show_posts', 'post_detail', 'drafts', 'create_post', 'publish_post', 'login', 'signup')
+
+def percentile(latencies, p):
+    return latencies[min(len(latencies) - 1, int(len(latencies) * p))] if latencies else 0.0
+
+def create_app_for(data, backend, hash_method, hash_cost, **config):
+    """
+    The app serving the corpus in `data`; `config` overrides further
+    settings. The settings are passed to create_app() rather than set in
+    os.environ, so the store is opened once, on the corpus files.
+    """
+    from app import create_app
+    from controllers import auth_controller
+    from storage.user_directory import UserDirectory
+    app = create_app(dict(data['config'], STORAGE_BACKEND=backend, WTF_CSRF_ENABLED=False,
+                          PASSWORD_HASH_METHOD=hash_method, PASSWORD_HASH_COST=hash_cost, **config))
+    # The accounts of the flat-file backends live in the corpus directory
+    auth_controller._user_directory = UserDirectory(data['users_file'])
+    return app
+
+def login(client, email):
+    client.post('/login', data={'email': email, 'password': corpus.PASSWORD}).close()
+
+def scenario_requests(name, app, data, count, rng):
+    """
+    Return (client, requests): `requests` yields (method, path, form,
+    expected status, untimed setup callable or None) for the scenario.
+    """
+    client = app.test_client()
+    if name not in ('login', 'signup'):
+        login(client, data['users'][0][1])
+
+    if name == 'show_posts':
+        return client, (('GET', '/posts/', None, 200, None) for _ in range(count))
+    if name == 'post_detail':
+        ids = data['published']
+        return client, (('GET', f'/posts/{rng.choice(ids)}', None, 200, None) for _ in range(count))
+    if name == 'drafts':
+        return client, (('GET', '/posts/drafts', None, 200, None) for _ in range(count))
+    if name == 'create_post':
+        def create(n):
+            form = {'title': f'Benchmark post {n}', 'body': ' '.join(rng.choices(corpus.WORDS, k=150)),
+                    'tags': rng.sample(data['tags'], 2)}
+            return ('POST', '/posts/new', form, 302, None)
+        return client, (create(n) for n in range(count))
+    if name == 'publish_post':
+        drafts = data['drafts']
+        def publish(n):
+            post_id = drafts[n % len(drafts)]
+            # Past the end of the drafts, unpublish again (untimed) first
+            setup = (lambda: client.post(f'/posts/{post_id}/unpublish').close()) if n >= len(drafts) else None
+            return ('POST', f'/posts/{post_id}/publish', None, 302, setup)
+        return client, (publish(n) for n in range(count))
+    if name == 'login':
+        users = data['users']
+        def attempt(n):
+            _, user_email = rng.choice(users)
+            return ('POST', '/login', {'email': user_email, 'password': corpus.PASSWORD}, 302,
+                    lambda: client.get('/logout').close())
+        return client, (attempt(n) for n in range(count))
+    if name == 'signup':
+        run_id = rng.getrandbits(32)
+        def signup(n):
+            name = f'bench{run_id}x{n}'
+            form = {'username': name, 'email': f'{name}@example.com',
+                    'password': corpus.PASSWORD, 'password2': corpus.PASSWORD}
+            return ('POST', '/signup', form, 302, lambda: client.get('/logout').close())
+        return client, (signup(n) for n in range(count))
+    raise ValueError(f'Unknown scenario: {name}')
+
+def run_scenario(name, app, data, count, seed):
+    rng = random.Random(seed)
+    client, requests = scenario_requests(name, app, data, count, rng)
+    latencies = []
+    errors = 0
+    for method, path, form, expected, setup in requests:
+        if setup is not None and latencies:
+            setup()
+        started = time.perf_counter()
+        response = client.open(path, method=method, data=form)
+        response.get_data()
+        response.close()
+        latencies.append(time.perf_counter() - started)
+        if response.status_code != expected:
+            errors += 1
+    elapsed = sum(latencies)
+    latencies.sort()
+    return {
+        'scenario': name,
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput_rps': len(latencies) / elapsed if elapsed else 0.0,
+        'mean_ms': elapsed / max(1, len(latencies)) * 1000,
+        'p50_ms': percentile(latencies, 0.5) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000
+    }
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=corpus.ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, baseline, tolerance):
+    """Return the (posts, scenario, old p50, new p50) rows slower than `tolerance` allows"""
+    previous = {(row['posts'], row['scenario']): row for row in baseline['results']}
+    regressions = []
+    for row in results:
+        old = previous.get((row['posts'], row['scenario']))
+        if old and old['p50_ms'] and row['p50_ms'] > old['p50_ms'] * (1 + tolerance):
+            regressions.append((row['posts'], row['scenario'], old['p50_ms'], row['p50_ms']))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backend', choices=('json', 'wal', 'split', 'sqlite'), default='json')
+    parser.add_argument('--sizes', default='1000,10000,100000', help='comma-separated corpus sizes (posts)')
+    parser.add_argument('--users', type=int, default=100000, help='accounts in every corpus')
+    parser.add_argument('--requests', type=int, default=200, help='requests per scenario')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='comma-separated scenarios to run')
+    parser.add_argument('--hash-method', choices=('scrypt', 'pbkdf2_sha256'), default='scrypt')
+    parser.add_argument('--hash-cost', type=int, default=None, help='password hash cost (app default if unset)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='previous results file to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed relative p50 slowdown before a scenario counts as a regression')
+    args = parser.parse_args()
+    scenarios = [name for name in args.scenarios.split(',') if name]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f'unknown scenarios: {", ".join(sorted(unknown))}')
+
+    results = []
+    print(f'{"posts":>8} {"scenario":<14} {"req/s":>9} {"p50 ms":>9} {"p99 ms":>9} {"errors":>7}')
+    for size in (int(size) for size in args.sizes.split(',')):
+        directory = tempfile.mkdtemp(prefix=f'blog-bench-{size}-')
+        data = corpus.build(directory, args.backend, size, args.users, args.seed,
+                            args.hash_method, args.hash_cost)
+        app = create_app_for(data, args.backend, args.hash_method, args.hash_cost)
+        for name in scenarios:
+            row = dict(posts=size, **run_scenario(name, app, data, args.requests, args.seed))
+            results.append(row)
+            print(f'{size:>8} {name:<14} {row["throughput_rps"]:>9.1f} {row["p50_ms"]:>9.2f} '
+                  f'{row["p99_ms"]:>9.2f} {row["errors"]:>7}')
+
+    report = {
+        'commit': git_commit(),
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'settings': {
+            'backend': args.backend, 'users': args.users, 'requests': args.requests,
+            'hash_method': args.hash_method, 'hash_cost': args.hash_cost, 'seed': args.seed
+        },
+        'results': results
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+        if baseline['settings'] != report['settings']:
+            print(f'Note: {args.compare} was measured with other settings: {baseline["settings"]}')
+        regressions = compare(results, baseline, args.tolerance)
+        for posts, name, old, new in regressions:
+            print(f'REGRESSION {posts} posts {name}: p50 {old:.2f} ms -> {new:.2f} ms')
+        if regressions:
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Stress test for cross-process writes to the post store.
+
+Spawns several worker processes that each create posts and then publish
+them as fast as they can, all against the same store. Afterwards it checks
+that every created post is present, that no id was handed out twice and
+that every publish was kept.
+
+Usage:
+    python -m benchmarks.stress_concurrent_writes --backend json --workers 8 --posts 50
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import multiprocessing
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage.post_repository import create_repository
+
+def make_config(backend, directory, compact_bytes=None):
+    config = {
+        'STORAGE_BACKEND': backend,
+        'POSTS_FILE': os.path.join(directory, 'posts.json'),
+        'SQLITE_PATH': os.path.join(directory, 'blog.db')
+    }
+    if compact_bytes:
+        config['WAL_COMPACT_BYTES'] = compact_bytes
+    return config
+
+def worker(worker_id, config, count, start_event, results):
+    """Create `count` posts, then publish each one"""
+    from controllers.post_controller import Post, _publish
+    repository = create_repository(config)
+    start_event.wait()
+    ids = []
+    for i in range(count):
+        post = Post(
+            id=repository.allocate_id(),
+            title=f'Worker {worker_id} post {i}',
+            body='Stress test body',
+            author=f'worker{worker_id}',
+            created_at=datetime.now().isoformat()
+        )
+        repository.insert(post.to_dict())
+        ids.append(post.id)
+    for post_id in ids:
+        repository.modify(post_id, _publish)
+    repository.close()
+    results.put(ids)
+
+def run(backend, workers, count, compact_bytes=None):
+    directory = tempfile.mkdtemp(prefix='blog-stress-')
+    config = make_config(backend, directory, compact_bytes)
+    create_repository(config).close()  # create the store up front
+
+    ctx = multiprocessing.get_context('fork')
+    start_event = ctx.Event()
+    results = ctx.Queue()
+    processes = [ctx.Process(target=worker, args=(n, config, count, start_event, results))
+                 for n in range(workers)]
+    for process in processes:
+        process.start()
+
+    started = time.perf_counter()
+    start_event.set()
+    allocated = []
+    for _ in processes:
+        allocated.extend(results.get())
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - started
+
+    repository = create_repository(config)
+    posts = repository.all()
+    repository.close()
+
+    expected = workers * count
+    stored_ids = [post['id'] for post in posts]
+    unpublished = [post['id'] for post in posts if not post['is_published']]
+    duplicate_ids = len(allocated) - len(set(allocated))
+    missing = set(allocated) - set(stored_ids)
+
+    print(f'backend={backend} workers={workers} posts/worker={count}')
+    print(f'  {expected * 2} writes in {elapsed:.2f}s ({expected * 2 / elapsed:.0f} writes/s)')
+    print(f'  stored posts:      {len(posts)} / {expected}')
+    print(f'  duplicate ids:     {duplicate_ids}')
+    print(f'  lost creates:      {len(missing)}')
+    print(f'  lost publishes:    {len(unpublished)}')
+
+    ok = len(posts) == expected and not duplicate_ids and not missing and not unpublished
+    print('  result:            ' + ('OK' if ok else 'FAILED'))
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--backend', choices=['json', 'wal', 'split', 'sqlite'], default='json')
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--posts', type=int, default=50, help='posts created per worker')
+    parser.add_argument('--wal-compact-bytes', type=int, default=None,
+                        help='compact the WAL at this size to stress compaction')
+    args = parser.parse_args()
+    return 0 if run(args.backend, args.workers, args.posts, args.wal_compact_bytes) else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,7 @@
+# Flask Blog Application
+# CLI commands package
+
+from cli.storage_commands import storage_cli
+from cli.post_commands import posts_cli
+
+__all__ = ['storage_cli', 'posts_cli']
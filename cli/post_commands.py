@@ -0,0 +1,184 @@
+import json
+import time
+import click
+from flask.cli import AppGroup
+from controllers.post_controller import validate_post_data
+from storage.post_repository import get_post_repository
+
+posts_cli = AppGroup('posts', help='Import and export posts.')
+
+# Bytes read from the input at a time
+CHUNK_SIZE = 64 * 1024
+
+def _chunks(stream, head):
+    if head:
+        yield head
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            return
+        yield chunk
+
+def _iter_ndjson(chunks):
+    """Yield (line number, parsed value or ValueError) for each non-blank line"""
+    buffer = ''
+    line_number = 0
+    for chunk in chunks:
+        buffer += chunk
+        lines = buffer.split('\n')
+        buffer = lines.pop()
+        for line in lines:
+            line_number += 1
+            if line.strip():
+                yield line_number, _loads(line)
+    if buffer.strip():
+        yield line_number + 1, _loads(buffer)
+
+def _loads(text):
+    try:
+        return json.loads(text)
+    except ValueError as e:
+        return e
+
+def _iter_json_array(chunks):
+    """
+    Yield (position, parsed element) for each element of a top-level JSON
+    array, holding only the current element and one chunk in memory.
+    """
+    decoder = json.JSONDecoder()
+    chunks = iter(chunks)
+    buffer, position = '', 0
+
+    def more():
+        nonlocal buffer, position
+        chunk = next(chunks, None)
+        if chunk is None:
+            return False
+        buffer = buffer[position:] + chunk
+        position = 0
+        return True
+
+    def skip_whitespace():
+        nonlocal position
+        while True:
+            while position < len(buffer) and buffer[position].isspace():
+                position += 1
+            if position < len(buffer) or not more():
+                return
+
+    skip_whitespace()
+    if position >= len(buffer) or buffer[position] != '[':
+        raise click.ClickException('Input is not a JSON array')
+    position += 1
+    index = 0
+    while True:
+        skip_whitespace()
+        if position >= len(buffer):
+            raise click.ClickException('Unexpected end of input inside the JSON array')
+        if buffer[position] == ']':
+            return
+        if index:
+            if buffer[position] != ',':
+                raise click.ClickException(f'Expected "," after element {index}')
+            position += 1
+            skip_whitespace()
+        while True:
+            try:
+                value, end = decoder.raw_decode(buffer, position)
+                break
+            except ValueError as e:
+                # The element may just be cut off at the end of the buffer.
+                # Read until the buffer doubles so a huge element is not
+                # re-parsed once per chunk.
+                pending = len(buffer) - position
+                if not more():
+                    raise click.ClickException(f'Invalid JSON in element {index + 1}: {e}')
+                while len(buffer) - position < 2 * pending and more():
+                    pass
+        index += 1
+        position = end
+        yield index, value
+
+@posts_cli.command('import')
+@click.argument('source', type=click.File('r', encoding='utf-8'))
+@click.option('--format', 'file_format', type=click.Choice(['auto', 'ndjson', 'json']), default='auto',
+              show_default=True, help='NDJSON (one post per line) or a JSON array of posts.')
+@click.option('--batch-size', default=1000, show_default=True, help='Posts written per commit.')
+@click.option('--keep-ids', is_flag=True, help='Keep the ids in the file instead of assigning new ones.')
+@click.option('--strict', is_flag=True, help='Stop at the first invalid record instead of skipping it.')
+def import_posts(source, file_format, batch_size, keep_ids, strict):
+    """Stream posts from SOURCE (a file or - for stdin) into the store."""
+    repository = get_post_repository()
+    head = source.read(CHUNK_SIZE)
+    if file_format == 'auto':
+        file_format = 'json' if head.lstrip().startswith('[') else 'ndjson'
+    records = (_iter_json_array if file_format == 'json' else _iter_ndjson)(_chunks(source, head))
+
+    imported = skipped = 0
+    batch = []
+    started = time.perf_counter()
+
+    def commit():
+        nonlocal imported
+        if not keep_ids:
+            # insert_many() numbers posts without an id in the same write
+            for post in batch:
+                post['id'] = None
+        try:
+            repository.insert_many(batch)
+        except ValueError as e:
+            raise click.ClickException(f'{e}; {imported} posts were imported before it')
+        imported += len(batch)
+        batch.clear()
+
+    for position, record in records:
+        try:
+            if isinstance(record, ValueError):
+                raise record
+            batch.append(validate_post_data(record))
+        except ValueError as e:
+            if strict:
+                raise click.ClickException(f'Record {position}: {e}')
+            click.echo(f'Skipping record {position}: {e}', err=True)
+            skipped += 1
+            continue
+        if len(batch) >= batch_size:
+            commit()
+    if batch:
+        commit()
+
+    elapsed = time.perf_counter() - started
+    click.echo(f'Imported {imported} posts ({skipped} skipped) in {elapsed:.2f}s '
+               f'({imported / elapsed if elapsed else 0:.0f} posts/s)', err=True)
+
+@posts_cli.command('export')
+@click.argument('destination', type=click.File('w', encoding='utf-8'), default='-')
+@click.option('--format', 'file_format', type=click.Choice(['ndjson', 'json']), default='ndjson',
+              show_default=True, help='NDJSON (one post per line) or a JSON array of posts.')
+@click.option('--batch-size', default=1000, show_default=True, help='Posts read from the store at a time.')
+def export_posts(destination, file_format, batch_size):
+    """Stream every post, by id, to DESTINATION (a file or - for stdout)."""
+    repository = get_post_repository()
+    exported = 0
+    after_id = 0
+    started = time.perf_counter()
+    if file_format == 'json':
+        destination.write('[')
+    while True:
+        posts = repository.scan(after_id, batch_size)
+        if not posts:
+            break
+        for post in posts:
+            line = json.dumps(post, ensure_ascii=False)
+            if file_format == 'json':
+                destination.write(('\n  ' if exported == 0 else ',\n  ') + line)
+            else:
+                destination.write(line + '\n')
+            exported += 1
+        after_id = posts[-1]['id']
+    if file_format == 'json':
+        destination.write('\n]\n' if exported else ']\n')
+    destination.flush()
+    elapsed = time.perf_counter() - started
+    click.echo(f'Exported {exported} posts in {elapsed:.2f}s '
+               f'({exported / elapsed if elapsed else 0:.0f} posts/s)', err=True)
@@ -0,0 +1,36 @@
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from controllers.auth_controller import USERS_FILE, hash_plaintext_passwords
+from controllers.passwords import hash_password
+from controllers.post_controller import TAGS_FILE
+from storage.post_repository import POSTS_FILE, SQLITE_FILE
+from storage.sqlite_store import SqliteDatabase, import_flat_files
+
+storage_cli = AppGroup('storage', help='Manage the blog data store.')
+
+@storage_cli.command('migrate-sqlite')
+@click.option('--database', 'database_path', default=None,
+              help='SQLite database file (defaults to SQLITE_PATH).')
+@click.option('--posts', 'posts_file', default=POSTS_FILE, show_default=True, help='posts.json to import.')
+@click.option('--tags', 'tags_file', default=TAGS_FILE, show_default=True, help='tags.json to import.')
+@click.option('--users', 'users_file', default=USERS_FILE, show_default=True, help='users.txt to import.')
+def migrate_sqlite(database_path, posts_file, tags_file, users_file):
+    """Import posts.json, tags.json and users.txt into SQLite."""
+    database_path = database_path or current_app.config.get('SQLITE_PATH', SQLITE_FILE)
+    database = SqliteDatabase(database_path)
+    try:
+        counts = import_flat_files(database, posts_file, tags_file, users_file)
+    finally:
+        database.close()
+    click.echo(f"Imported {counts['posts']} posts, {counts['tags']} tags and "
+               f"{counts['users']} users into {database_path}")
+    click.echo('Set STORAGE_BACKEND=sqlite to serve from the database.')
+
+@storage_cli.command('hash-passwords')
+def hash_passwords():
+    """Hash every password still stored in plaintext (one-time migration)."""
+    method = current_app.config.get('PASSWORD_HASH_METHOD', 'scrypt')
+    cost = current_app.config.get('PASSWORD_HASH_COST')
+    changed = hash_plaintext_passwords(lambda password: hash_password(password, method, cost))
+    click.echo(f'Hashed {changed} plaintext passwords.')
@@ -0,0 +1,235 @@
+import json
+from flask import current_app
+from controllers.auth_controller import get_current_user
+from controllers.page_cache import page_cache
+from controllers.post_controller import POST_FIELDS, validate_post_data, encode_cursor, decode_cursor, now_like
+from storage.derived import DERIVED_FIELDS
+from storage.post_repository import get_post_repository
+
+# Page size limits for GET /api/posts
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+# Most posts looked at for one page when a filter has no index (tag with
+# published=false); past it the page is cut short and next_cursor continues
+MAX_SCAN = 1000
+# Most operations accepted in one POST /api/posts/batch
+MAX_BATCH = 500
+# Fields a batch "update" may change
+UPDATABLE_FIELDS = ('title', 'body', 'is_published', 'tags')
+
+class ApiError(Exception):
+    """An error answered as {"error": message} with the given HTTP status"""
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+def json_response(payload, status=200):
+    """
+    Serialize straight from the stored post dicts, without building Post
+    objects or sorting keys the way jsonify does.
+    """
+    return current_app.response_class(
+        json.dumps(payload, ensure_ascii=False, separators=(',', ':')),
+        status=status, mimetype='application/json')
+
+def parse_fields(value):
+    """Turn ?fields=id,title into a tuple of post fields (None means all)"""
+    if not value:
+        return None
+    fields = tuple(dict.fromkeys(field.strip() for field in value.split(',') if field.strip()))
+    unknown = [field for field in fields if field not in POST_FIELDS and field not in DERIVED_FIELDS]
+    if unknown:
+        raise ApiError(f'Unknown fields: {", ".join(unknown)}')
+    return fields or None
+
+def project(post, fields):
+    """The requested fields of a stored post (a dict or read-only view)"""
+    if fields is None:
+        return dict(post)
+    return {field: post[field] for field in fields}
+
+def _parse_bool(name, value):
+    if value in ('true', '1'):
+        return True
+    if value in ('false', '0'):
+        return False
+    raise ApiError(f'{name} must be true or false')
+
+def _parse_limit(value):
+    if value is None:
+        return DEFAULT_LIMIT
+    try:
+        limit = int(value)
+    except ValueError:
+        raise ApiError('limit must be an integer')
+    return max(1, min(limit, MAX_LIMIT))
+
+def _require_user():
+    user = get_current_user()
+    if user is None:
+        raise ApiError('Authentication required', 401)
+    return user
+
+def list_posts(args):
+    """
+    One page of posts, newest first, filtered by `published` (default
+    true; drafts need a login), `tag` and `author`. Returns
+    {"posts": [...], "next_cursor": ...}; pass next_cursor back as
+    `cursor` for the following page. A page may hold fewer than `limit`
+    posts even when next_cursor is set.
+    """
+    published = _parse_bool('published', args.get('published', 'true'))
+    if not published:
+        _require_user()
+    tag = args.get('tag')
+    author = args.get('author')
+    limit = _parse_limit(args.get('limit'))
+    fields = parse_fields(args.get('fields'))
+    repository = get_post_repository()
+    # Skip reading bodies left on disk unless they are returned
+    summary = fields is not None and not {'body', 'body_html'} & set(fields)
+
+    if tag is not None and published and author is None:
+        # Published posts by tag come from the tag index, keyed by id
+        try:
+            cursor = int(args['cursor']) if args.get('cursor') else None
+        except ValueError:
+            raise ApiError('Invalid cursor')
+        fetch = lambda size, key: repository.page_by_tag(tag, size, key, summary=summary)
+        key_of = lambda post: post['id']
+        encode = str
+    else:
+        cursor = decode_cursor(args.get('cursor'))
+        if args.get('cursor') and cursor is None:
+            raise ApiError('Invalid cursor')
+        fetch = lambda size, key: repository.page(published, size, key, summary=summary, author=author)
+        key_of = lambda post: (post['created_at'], post['id'])
+        encode = encode_cursor
+
+    def matches(post):
+        return tag is None or tag in (post.get('tags') or ())
+
+    # A tag the index cannot answer (drafts, or alongside an author) is
+    # applied while walking the keyset pages, at most MAX_SCAN posts
+    indexed = tag is None or (published and author is None)
+    posts, key, more, scanned = [], cursor, True, 0
+    while len(posts) < limit and more and scanned < MAX_SCAN:
+        batch, next_key = fetch(limit if indexed else min(MAX_LIMIT, MAX_SCAN - scanned), key)
+        more = next_key is not None
+        scanned += len(batch)
+        for post in batch:
+            key = key_of(post)
+            if matches(post):
+                posts.append(project(post, fields))
+                if len(posts) == limit:
+                    # Stopped inside the batch: more may follow even if it was the last
+                    more = more or post is not batch[-1]
+                    break
+    return json_response({
+        'posts': posts,
+        'next_cursor': encode(key) if more and key is not None else None
+    })
+
+def get_post(post_id, args):
+    """One post; drafts are only visible when logged in"""
+    fields = parse_fields(args.get('fields'))
+    post = get_post_repository().get(post_id)
+    if post is None or (not post['is_published'] and get_current_user() is None):
+        raise ApiError('Post not found', 404)
+    return json_response(project(post, fields))
+
+def _update(fields):
+    def change(post):
+        post.update(fields)
+        post['updated_at'] = now_like(post['created_at']).isoformat()
+        try:
+            return validate_post_data(post)
+        except ValueError as e:
+            raise ValueError(f"Post {post['id']}: {e}")
+    return change
+
+def _set_published(published):
+    def change(post):
+        if post['is_published'] != published:
+            post['is_published'] = published
+            post['updated_at'] = now_like(post['created_at']).isoformat()
+        return post
+    return change
+
+def batch(payload, args):
+    """
+    Apply many operations in one storage write, all or nothing:
+
+        {"operations": [
+            {"op": "create", "post": {"title": ..., "body": ..., "tags": [...]}},
+            {"op": "update", "id": 3, "post": {"title": ...}},
+            {"op": "publish", "id": 4},
+            {"op": "unpublish", "id": 5}
+        ]}
+
+    Returns {"results": [post, ...]} in operation order (null for a post
+    deleted by someone else while the batch was being applied).
+    """
+    user = _require_user()
+    fields = parse_fields(args.get('fields'))
+    operations = payload.get('operations') if isinstance(payload, dict) else None
+    if not isinstance(operations, list) or not operations:
+        raise ApiError('Expected {"operations": [...]}')
+    if len(operations) > MAX_BATCH:
+        raise ApiError(f'At most {MAX_BATCH} operations per batch', 413)
+
+    repository = get_post_repository()
+    creates, changes, order = [], [], []
+    for number, operation in enumerate(operations, 1):
+        op = operation.get('op') if isinstance(operation, dict) else None
+        try:
+            if op == 'create':
+                data = operation.get('post')
+                if not isinstance(data, dict):
+                    raise ValueError('post must be an object')
+                data = {key: value for key, value in data.items() if key not in ('id', 'author')}
+                creates.append(validate_post_data(dict(data, author=user['username'])))
+                order.append(('create', len(creates) - 1))
+                continue
+            if op not in ('update', 'publish', 'unpublish'):
+                raise ValueError('op must be create, update, publish or unpublish')
+            post_id = operation.get('id')
+            if not isinstance(post_id, int) or isinstance(post_id, bool):
+                raise ValueError('id must be an integer')
+            if op == 'update':
+                data = operation.get('post')
+                if not isinstance(data, dict) or not data:
+                    raise ValueError('post must be an object')
+                unknown = set(data) - set(UPDATABLE_FIELDS)
+                if unknown:
+                    raise ValueError(f'cannot update {", ".join(sorted(unknown))}')
+                changes.append((post_id, _update(data)))
+            else:
+                changes.append((post_id, _set_published(op == 'publish')))
+            order.append(('change', len(changes) - 1))
+        except ValueError as e:
+            raise ApiError(f'Operation {number}: {e}')
+
+    missing = sorted({post_id for post_id, _ in changes if repository.get(post_id) is None})
+    if missing:
+        raise ApiError(f'Posts not found: {", ".join(map(str, missing))}', 404)
+    try:
+        # Through the group-commit writer when enabled; the sync then finds
+        # nothing left to do, otherwise it makes a lazily synced write durable
+        created, changed = repository.write_batch(creates, changes)
+        repository.sync()
+    except ValueError as e:
+        raise ApiError(str(e), 422)
+    except OSError as e:
+        current_app.logger.error(f'Error saving posts: {str(e)}')
+        raise ApiError('Error saving posts. Please try again.', 503)
+    if creates:
+        page_cache.invalidate_listings()
+    for post in changed:
+        if post is not None:
+            page_cache.invalidate_post(post['id'])
+    results = [project(created[index] if kind == 'create' else changed[index], fields)
+               if kind == 'create' or changed[index] is not None else None
+               for kind, index in order]
+    return json_response({'results': results}, 201 if creates else 200)
@@ -1,40 +1,158 @@
 import os
+import time
+import threading
 from flask import flash, redirect, url_for, current_app, session, request
+from itsdangerous import BadSignature, URLSafeSerializer
+from storage.sqlite_store import get_database
+from storage.user_directory import UserDirectory
+from controllers.passwords import HashingBusy, get_password_hasher, is_hashed
 
 # File path for storing user data
 USERS_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'users.txt')
+_user_directory = UserDirectory(USERS_FILE)
+
+# Identity claims carried in the session are checked against these
+# in-memory account versions: {email: (version, monotonic time checked)}
+_identity_versions = {}
+_identity_versions_lock = threading.Lock()
 
 def load_users():
-    """Load users from text file"""
-    users = {}
+    """Load users from text file (or the SQLite database when configured)"""
     try:
-        if os.path.exists(USERS_FILE):
-            with open(USERS_FILE, 'r') as f:
-                for line in f:
-                    line = line.strip()
-                    if line and ',' in line:
-                        parts = line.split(',')
-                        if len(parts) >= 3:
-                            username, email, password = parts[0], parts[1], parts[2]
-                            users[email] = {
-                                'username': username,
-                                'email': email,
-                                'password': password
-                            }
+        database = get_database()
+        if database is not None:
+            return database.load_users()
+        return _user_directory.all()
     except Exception as e:
         current_app.logger.error(f'Error loading users: {str(e)}')
-    return users
+    return {}
+
+def get_user(email):
+    """Look up one user by email without loading the others"""
+    database = get_database()
+    if database is not None:
+        return database.get_user(email)
+    return _user_directory.get(email)
+
+def get_user_by_username(username):
+    """Look up one user by username without loading the others"""
+    database = get_database()
+    if database is not None:
+        return database.get_user_by_username(username)
+    return _user_directory.get_by_username(username)
+
+def get_user_version(email):
+    """
+    Version of an account, which changes when its password is changed;
+    None if the account does not exist.
+    """
+    database = get_database()
+    if database is not None:
+        return database.get_user_version(email)
+    return _user_directory.version(email)
+
+def _identity_serializer():
+    return URLSafeSerializer(current_app.config['SECRET_KEY'], salt='identity')
+
+def _current_version(email):
+    """
+    Account version from memory, re-read from storage at most every
+    IDENTITY_RECHECK_SECONDS so changed or deleted accounts lose their
+    sessions promptly.
+    """
+    now = time.monotonic()
+    with _identity_versions_lock:
+        cached = _identity_versions.get(email)
+    if cached is not None and now - cached[1] < current_app.config.get('IDENTITY_RECHECK_SECONDS', 5):
+        return cached[0]
+    version = get_user_version(email)
+    with _identity_versions_lock:
+        _identity_versions[email] = (version, now)
+    return version
+
+def revoke_user_sessions(email):
+    """
+    Forget the remembered version of an account so its existing sessions
+    are re-checked on their next request (call after changing or
+    deleting the account).
+    """
+    with _identity_versions_lock:
+        _identity_versions.pop(email, None)
+
+def _issue_identity(user):
+    """Store a signed, versioned identity claim for `user` in the session"""
+    session['identity'] = _identity_serializer().dumps({
+        'email': user['email'],
+        'username': user['username'],
+        'version': _current_version(user['email'])
+    })
+
+def _read_identity():
+    """Return the session's identity claim if it is authentic and current"""
+    token = session.get('identity')
+    if not token:
+        return None
+    try:
+        claim = _identity_serializer().loads(token)
+    except BadSignature:
+        return None
+    if claim.get('email') != session.get('user_id'):
+        return None
+    if claim.get('version') is None or claim['version'] != _current_version(claim['email']):
+        return None
+    return claim
 
 def save_user(username, email, password):
-    """Save new user to text file"""
+    """Save new user to text file (or the SQLite database when configured)"""
     try:
-        with open(USERS_FILE, 'a') as f:
-            f.write(f'{username},{email},{password}\n')
+        database = get_database()
+        if database is not None:
+            database.save_user(username, email, password)
+            return True
+        _user_directory.add(username, email, password)
         return True
     except Exception as e:
         current_app.logger.error(f'Error saving user: {str(e)}')
         return False
 
+def update_password(email, password_hash, rehash=False):
+    """
+    Store a new password hash for an existing account, which ends its
+    other sessions. With `rehash` (the same password hashed with new
+    settings) the account's version and so its sessions are kept.
+    """
+    try:
+        database = get_database()
+        if database is not None:
+            updated = database.update_password(email, password_hash, rehash=rehash)
+        else:
+            updated = _user_directory.set_password(email, password_hash, rehash=rehash)
+        if not rehash:
+            revoke_user_sessions(email)
+        return updated
+    except Exception as e:
+        current_app.logger.error(f'Error updating password: {str(e)}')
+        return False
+
+def hash_plaintext_passwords(hash_function):
+    """
+    Replace every password still stored in plaintext (accounts that have
+    not logged in since hashing was introduced) with hash_function(it).
+    Sessions are kept, and a password changed meanwhile is left alone.
+    Returns the number of accounts changed.
+    """
+    plaintext = {email: user['password'] for email, user in load_users().items()
+                 if not is_hashed(user['password'])}
+    hashed = {email: hash_function(password) for email, password in plaintext.items()}
+    database = get_database()
+    if database is None:
+        return _user_directory.set_passwords(hashed, rehash=True, expected=plaintext)
+    changed = 0
+    with database.transaction():
+        for email, password in hashed.items():
+            changed += database.update_password(email, password, rehash=True, expected=plaintext[email])
+    return changed
+
 def login_user(form_data):
     """
     Authenticate user with email and password.
@@ -45,17 +163,21 @@ def login_user(form_data):
         password = form_data.get('password', '')
         remember_me = form_data.get('remember_me', False)
         
-        users = load_users()
-        
         # Find user by email
-        user = users.get(email)
+        user = get_user(email)
+        hasher = get_password_hasher()
         
-        if user and user['password'] == password:
+        if hasher.verify(password, user['password'] if user else None):
+            # Upgrade plaintext or outdated hashes while the password is at hand
+            if hasher.needs_rehash(user['password']):
+                update_password(email, hasher.hash(password), rehash=True)
+            
             # Set user session
             session['user_id'] = email  # Use email as ID
             session['username'] = user['username']
             session['email'] = user['email']
             session.permanent = bool(remember_me)
+            _issue_identity(user)
             
             flash(f'Welcome back, {user["username"]}!', 'success')
             
@@ -68,6 +190,9 @@ def login_user(form_data):
             flash('Invalid email or password. Please try again.', 'error')
             return redirect(url_for('auth.login'))
             
+    except HashingBusy:
+        flash('Too many sign-ins right now. Please try again in a moment.', 'warning')
+        return redirect(url_for('auth.login'))
     except Exception as e:
         current_app.logger.error(f'Error during login: {str(e)}')
         flash('An error occurred during login. Please try again.', 'error')
@@ -82,27 +207,27 @@ def register_user(form_data):
         email = form_data.get('email', '').strip().lower()
         password = form_data.get('password', '')
         
-        users = load_users()
-        
         # Check if user already exists
-        if email in users:
+        if get_user(email) is not None:
             flash('Email already registered. Please use a different email.', 'error')
             return redirect(url_for('auth.signup'))
         
         # Check if username already exists
-        for user_data in users.values():
-            if user_data['username'] == username:
-                flash('Username already exists. Please choose a different one.', 'error')
-                return redirect(url_for('auth.signup'))
+        if get_user_by_username(username) is not None:
+            flash('Username already exists. Please choose a different one.', 'error')
+            return redirect(url_for('auth.signup'))
         
         # Save new user
-        if save_user(username, email, password):
+        if save_user(username, email, get_password_hasher().hash(password)):
             flash('Account created successfully! Please log in.', 'success')
             return redirect(url_for('auth.login'))
         else:
             flash('An error occurred while creating your account. Please try again.', 'error')
             return redirect(url_for('auth.signup'))
         
+    except HashingBusy:
+        flash('Too many sign-ups right now. Please try again in a moment.', 'warning')
+        return redirect(url_for('auth.signup'))
     except Exception as e:
         current_app.logger.error(f'Error creating user account: {str(e)}')
         flash('An error occurred while creating your account. Please try again.', 'error')
@@ -127,15 +252,29 @@ def logout_user():
 def get_current_user():
     """
     Get current user from session.
-    Returns user dict or None if not logged in.
+    Returns user dict (username and email) or None if not logged in.
+    The signed identity claim in the session is trusted as long as the
+    account's version is unchanged, so this does not read the user store.
     """
     user_id = session.get('user_id')
     if not user_id:
         return None
     
     try:
-        users = load_users()
-        return users.get(user_id)
+        claim = _read_identity()
+        if claim is not None:
+            return {'username': claim['username'], 'email': claim['email']}
+        if 'identity' in session:
+            # Forged, or issued before the account changed: log out
+            session.clear()
+            return None
+        # Session from before identity claims: look the user up once
+        user = get_user(user_id)
+        if user is None:
+            session.clear()
+            return None
+        _issue_identity(user)
+        return {'username': user['username'], 'email': user['email']}
     except Exception:
         return None
 
@@ -143,7 +282,7 @@ def is_logged_in():
     """
     Check if user is currently logged in.
     """
-    return 'user_id' in session
+    return 'user_id' in session and get_current_user() is not None
 
 def require_login():
     """
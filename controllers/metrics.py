@@ -0,0 +1,154 @@
+import time
+import threading
+from bisect import bisect_left
+from flask import g, request, before_render_template, template_rendered
+from storage import instrumentation
+
+# Upper bounds (seconds) of the request latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Per-endpoint totals exported next to the latency histogram:
+# (IoStats field, metric name, help text)
+TOTALS = (
+    ('read_time', 'blog_storage_read_seconds_total', 'Time spent in storage reads'),
+    ('write_time', 'blog_storage_write_seconds_total', 'Time spent in storage writes'),
+    ('bytes_read', 'blog_storage_read_bytes_total', 'Bytes read from storage files'),
+    ('bytes_written', 'blog_storage_written_bytes_total', 'Bytes written to storage files'),
+    ('posts_loaded', 'blog_posts_deserialized_total', 'Posts deserialized from storage'),
+    ('render_time', 'blog_template_render_seconds_total', 'Time spent rendering templates'),
+)
+
+class EndpointMetrics:
+    """Latency histogram and storage totals of one endpoint"""
+    __slots__ = ('buckets', 'count', 'sum', 'totals')
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)  # last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.totals = [0] * len(TOTALS)
+
+class MetricsRegistry:
+    """
+    Request metrics of this process, by endpoint. Recording a request is
+    one bisect and a few additions under a lock; the Prometheus text is
+    only built when /metrics is scraped.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+        self._flights = {}
+
+    def track_flight(self, name, flight):
+        """Export the leader and coalesced call counts of a SingleFlight"""
+        with self._lock:
+            self._flights[name] = flight
+
+    def observe(self, endpoint, seconds, stats):
+        with self._lock:
+            metrics = self._endpoints.get(endpoint)
+            if metrics is None:
+                metrics = self._endpoints[endpoint] = EndpointMetrics()
+            metrics.buckets[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            metrics.count += 1
+            metrics.sum += seconds
+            totals = metrics.totals
+            for position, (field, _, _) in enumerate(TOTALS):
+                totals[position] += getattr(stats, field)
+
+    def clear(self):
+        with self._lock:
+            self._endpoints = {}
+
+    def render(self):
+        """The metrics in the Prometheus text exposition format"""
+        with self._lock:
+            endpoints = sorted((endpoint, metrics.buckets[:], metrics.count, metrics.sum, metrics.totals[:])
+                               for endpoint, metrics in self._endpoints.items())
+            flights = sorted((name, flight.leaders, flight.coalesced) for name, flight in self._flights.items())
+        lines = ['# HELP blog_request_duration_seconds Request latency by endpoint',
+                 '# TYPE blog_request_duration_seconds histogram']
+        for endpoint, buckets, count, total, _ in endpoints:
+            label = f'endpoint="{endpoint}"'
+            cumulative = 0
+            for bound, bucket in zip(LATENCY_BUCKETS + ('+Inf',), buckets):
+                cumulative += bucket
+                lines.append(f'blog_request_duration_seconds_bucket{{{label},le="{bound}"}} {cumulative}')
+            lines.append(f'blog_request_duration_seconds_sum{{{label}}} {total}')
+            lines.append(f'blog_request_duration_seconds_count{{{label}}} {count}')
+        for position, (_, name, help_text) in enumerate(TOTALS):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} counter')
+            for endpoint, _, _, _, totals in endpoints:
+                lines.append(f'{name}{{endpoint="{endpoint}"}} {totals[position]}')
+        lines.append('# HELP blog_singleflight_leader_total Calls that did the work themselves')
+        lines.append('# TYPE blog_singleflight_leader_total counter')
+        lines.extend(f'blog_singleflight_leader_total{{flight="{name}"}} {leaders}'
+                     for name, leaders, _ in flights)
+        lines.append('# HELP blog_singleflight_coalesced_total Calls that shared the result of a call in flight')
+        lines.append('# TYPE blog_singleflight_coalesced_total counter')
+        lines.extend(f'blog_singleflight_coalesced_total{{flight="{name}"}} {coalesced}'
+                     for name, _, coalesced in flights)
+        return '\n'.join(lines) + '\n'
+
+metrics_registry = MetricsRegistry()
+
+def server_timing(stats, elapsed):
+    """Server-Timing header value for a request's numbers so far"""
+    return (f'app;dur={elapsed * 1000:.2f}, '
+            f'storage-read;dur={stats.read_time * 1000:.2f}, '
+            f'storage-write;dur={stats.write_time * 1000:.2f}, '
+            f'render;dur={stats.render_time * 1000:.2f}, '
+            f'bytes-read;desc="{stats.bytes_read}", '
+            f'bytes-written;desc="{stats.bytes_written}", '
+            f'posts-loaded;desc="{stats.posts_loaded}"')
+
+def _begin_request():
+    g.metrics_started = time.perf_counter()
+    g.io_stats = instrumentation.begin()
+
+def _add_server_timing(response):
+    stats = g.get('io_stats')
+    if stats is None:
+        return response
+    started = g.metrics_started
+    endpoint = request.endpoint or 'unmatched'
+    response.headers['Server-Timing'] = server_timing(stats, time.perf_counter() - started)
+
+    def finish():
+        # Runs once the body has been sent, so streamed pages are timed
+        # (and their storage reads counted) in full
+        metrics_registry.observe(endpoint, time.perf_counter() - started, stats)
+        instrumentation.end(stats)
+    response.call_on_close(finish)
+    return response
+
+def _render_started(sender, template, context, **extra):
+    stats = instrumentation.current()
+    if stats is not None:
+        g.render_started = time.perf_counter()
+
+def _render_finished(sender, template, context, **extra):
+    stats = instrumentation.current()
+    started = g.pop('render_started', None)
+    if stats is not None and started is not None:
+        stats.render_time += time.perf_counter() - started
+
+def init_app(app):
+    """
+    Record per-request storage and render numbers, sent back as a
+    Server-Timing header and aggregated by endpoint for /metrics
+    (METRICS_ENABLED turns both off), along with the single-flight
+    counters of page renders and post loads. Registered before any other
+    request hook so that their storage work is included.
+    """
+    if not app.config.get('METRICS_ENABLED', True):
+        return
+    from controllers.page_cache import page_builds
+    from controllers.post_controller import post_loads
+    metrics_registry.track_flight('page_render', page_builds)
+    metrics_registry.track_flight('post_load', post_loads)
+    app.before_request(_begin_request)
+    app.after_request(_add_server_timing)
+    before_render_template.connect(_render_started, app)
+    template_rendered.connect(_render_finished, app)
@@ -0,0 +1,214 @@
+import hashlib
+import secrets
+import threading
+from collections import OrderedDict
+from flask import request, session, g, make_response, get_flashed_messages, Response
+from flask_wtf.csrf import generate_csrf
+from storage.coalescing import SingleFlight
+
+# Stand-in rendered in place of csrf_token() in cached pages. Random per
+# process so post content can never contain it by accident.
+CSRF_PLACEHOLDER = f'__csrf_{secrets.token_hex(16)}__'.encode()
+
+# Streamed pages are sent in chunks of about this many characters
+STREAM_CHUNK_SIZE = 8 * 1024
+
+class PageCache:
+    """
+    LRU cache of rendered pages, bounded by total size in bytes.
+
+    Entries are tagged with the post they show (detail pages) or marked as
+    listings, so a write to one post drops exactly the pages that can show
+    it. Keys include a data version as well, so pages rendered before a
+    write made by another process are never served either.
+    """
+    def __init__(self, max_bytes=8 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (page bytes, post id or None)
+        self._by_post = {}             # post id -> keys of its detail pages
+        self._listings = set()         # keys of listing pages
+        self._size = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, page, post_id=None):
+        """Store a rendered page; post_id None marks it as a listing"""
+        if len(page) > self.max_bytes:
+            return
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = (page, post_id)
+            self._size += len(page)
+            if post_id is None:
+                self._listings.add(key)
+            else:
+                self._by_post.setdefault(post_id, set()).add(key)
+            while self._size > self.max_bytes:
+                self._discard(next(iter(self._entries)))
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        page, post_id = entry
+        self._size -= len(page)
+        if post_id is None:
+            self._listings.discard(key)
+        else:
+            keys = self._by_post.get(post_id)
+            keys.discard(key)
+            if not keys:
+                del self._by_post[post_id]
+
+    def invalidate_listings(self):
+        """Drop every listing page (e.g. after a post is created)"""
+        with self._lock:
+            for key in list(self._listings):
+                self._discard(key)
+
+    def invalidate_post(self, post_id):
+        """Drop the pages of one post and every listing that may show it"""
+        with self._lock:
+            for key in list(self._by_post.get(post_id, ())):
+                self._discard(key)
+            for key in list(self._listings):
+                self._discard(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_post.clear()
+            self._listings.clear()
+            self._size = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def size(self):
+        """Total bytes of cached pages"""
+        return self._size
+
+page_cache = PageCache()
+# Cache misses on the same page (key, which includes the data version)
+# rendered at the same time share one render
+page_builds = SingleFlight()
+
+def init_app(app):
+    """Size the page cache from PAGE_CACHE_BYTES (0 disables it)"""
+    page_cache.max_bytes = app.config.get('PAGE_CACHE_BYTES', page_cache.max_bytes)
+    page_cache.clear()
+    app.add_template_global(flush_stream)
+
+def _cacheable():
+    """Only anonymous visitors with no pending flash messages share pages"""
+    return page_cache.max_bytes > 0 and 'user_id' not in session and '_flashes' not in session
+
+def _viewer_tag():
+    """
+    Short hash of what makes a page differ between visitors (the login and
+    the session's CSRF secret), so ETags are never shared across sessions.
+    """
+    viewer = f"{session.get('user_id')}:{session.get('csrf_token')}"
+    return hashlib.sha1(viewer.encode()).hexdigest()[:16]
+
+def _not_modified(etag, last_modified):
+    """Evaluate If-None-Match, or failing that If-Modified-Since"""
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if request.if_modified_since and last_modified is not None:
+        return request.if_modified_since >= last_modified.replace(microsecond=0)
+    return False
+
+def flush_stream():
+    """
+    Template global: in a streamed page, send what is rendered so far right
+    away instead of waiting for a full chunk, e.g. the top of the page just
+    before the template starts reading posts. Renders nothing.
+    """
+    g.flush_stream = True
+    return ''
+
+def _coalesce(chunks):
+    """Join the many small pieces a template stream yields into larger writes"""
+    buffer, size = [], 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        size += len(chunk)
+        if g.pop('flush_stream', False) or size >= STREAM_CHUNK_SIZE:
+            yield ''.join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+def stream_page(chunks):
+    """
+    Response that sends a streamed template (e.g. from stream_template) as
+    it renders, so the top of the page goes out before the rest is built:
+    everything up to the template's flush_stream() at once, the rest in
+    chunks of STREAM_CHUNK_SIZE.
+
+    The session is saved before the body is generated, so anything the
+    template would change in it happens here first: flashed messages are
+    popped (the template gets the same list) and the CSRF token is created.
+    """
+    get_flashed_messages()
+    generate_csrf()
+    return Response(_coalesce(chunks), mimetype='text/html')
+
+def _render(body):
+    return make_response(body) if isinstance(body, str) else stream_page(body)
+
+def _build(key, render, post_id):
+    # Checked again: the page may have been stored since this request missed
+    page = page_cache.get(key)
+    if page is None:
+        body = render(lambda: CSRF_PLACEHOLDER.decode())
+        page = (body if isinstance(body, str) else ''.join(body)).encode('utf-8')
+        page_cache.put(key, page, post_id)
+    return page
+
+def _page(key, render, post_id):
+    if not _cacheable():
+        return _render(render(generate_csrf))
+    page = page_cache.get(key)
+    if page is None:
+        page, _ = page_builds.do(key, lambda: _build(key, render, post_id))
+    if CSRF_PLACEHOLDER in page:
+        page = page.replace(CSRF_PLACEHOLDER, generate_csrf().encode())
+    return make_response(page)
+
+def cached_page(key, render, post_id=None, etag=None, last_modified=None):
+    """
+    Return the response for a page, rendering it with `render` (which is
+    given the csrf_token callable to use) only on a cache miss. Each
+    visitor's own CSRF token is swapped into the cached HTML on the way out.
+    `render` may return a template stream instead of a string; pages that
+    are not cached are then streamed to the client as they render.
+
+    With an `etag` (and optionally a `last_modified` datetime) the response
+    carries validators, and a matching conditional GET is answered with
+    304 before anything is rendered.
+    """
+    if etag is None or '_flashes' in session:
+        return _page(key, render, post_id)
+    if _not_modified(f'{etag}-{_viewer_tag()}', last_modified):
+        response = make_response('', 304)
+    else:
+        response = _page(key, render, post_id)
+    # Tagged after rendering, which may have started the session's CSRF secret
+    response.set_etag(f'{etag}-{_viewer_tag()}')
+    if last_modified is not None:
+        response.last_modified = last_modified
+    # Let browsers and the CDN keep the page but revalidate it each time
+    response.cache_control.no_cache = True
+    if 'user_id' in session:
+        response.cache_control.private = True
+    return response
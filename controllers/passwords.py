@@ -0,0 +1,155 @@
+import hmac
+import base64
+import hashlib
+import secrets
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Stored format (no commas, so it fits a users.txt field):
+#   scrypt$<log2 N>$<salt>$<hash>
+#   pbkdf2_sha256$<iterations>$<salt>$<hash>
+# Anything else is a plaintext password from before hashing was introduced
+METHODS = ('scrypt', 'pbkdf2_sha256')
+DEFAULT_COST = {'scrypt': 14, 'pbkdf2_sha256': 600000}
+SCRYPT_R, SCRYPT_P = 8, 1
+
+class HashingBusy(Exception):
+    """Raised when too many password checks are already waiting"""
+
+def _b64(data):
+    return base64.b64encode(data).decode('ascii').rstrip('=')
+
+def _unb64(text):
+    return base64.b64decode(text + '=' * (-len(text) % 4))
+
+def _derive(method, cost, password, salt):
+    if method == 'scrypt':
+        n = 1 << cost
+        return hashlib.scrypt(password.encode('utf-8'), salt=salt, n=n, r=SCRYPT_R, p=SCRYPT_P,
+                              maxmem=256 * SCRYPT_R * n, dklen=32)
+    if method == 'pbkdf2_sha256':
+        return hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, cost)
+    raise ValueError(f'Unknown password hash method: {method}')
+
+def hash_password(password, method='scrypt', cost=None):
+    """Hash `password` with a fresh random salt"""
+    cost = DEFAULT_COST[method] if cost is None else int(cost)
+    salt = secrets.token_bytes(16)
+    return f'{method}${cost}${_b64(salt)}${_b64(_derive(method, cost, password, salt))}'
+
+def _parse(stored):
+    parts = stored.split('$')
+    if len(parts) == 4 and parts[0] in METHODS:
+        return parts[0], int(parts[1]), _unb64(parts[2]), _unb64(parts[3])
+    return None
+
+def is_hashed(stored):
+    """False for a legacy plaintext password"""
+    try:
+        return _parse(stored) is not None
+    except ValueError:
+        return False
+
+def verify_password(password, stored):
+    """Check `password` against a stored hash (or legacy plaintext) in constant time"""
+    try:
+        parsed = _parse(stored)
+    except ValueError:
+        return False
+    if parsed is None:
+        return hmac.compare_digest(password.encode('utf-8'), stored.encode('utf-8'))
+    method, cost, salt, expected = parsed
+    return hmac.compare_digest(_derive(method, cost, password, salt), expected)
+
+def needs_rehash(stored, method='scrypt', cost=None):
+    """True if `stored` is plaintext or was hashed with other settings"""
+    cost = DEFAULT_COST[method] if cost is None else int(cost)
+    try:
+        parsed = _parse(stored)
+    except ValueError:
+        return True
+    return parsed is None or parsed[:2] != (method, cost)
+
+class HashingPool:
+    """
+    Bounded thread pool for password hashing.
+
+    hashlib releases the GIL while deriving keys, so running the KDF on a
+    few dedicated threads keeps a burst of logins from taking every CPU
+    away from page-serving threads. At most `max_queue` calls may be
+    running or waiting; beyond that run() fails fast with HashingBusy.
+    """
+    def __init__(self, workers=2, max_queue=32):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor = None
+        self._slots = threading.BoundedSemaphore(max_queue)
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers,
+                                                    thread_name_prefix='password-hash')
+            return self._executor
+
+    def run(self, fn, *args):
+        """Run fn(*args) on the pool and wait for the result"""
+        if not self._slots.acquire(blocking=False):
+            raise HashingBusy('Too many password checks in progress')
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future.result()
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+class PasswordHasher:
+    """Hashing settings from the app config plus the pool they run on"""
+    def __init__(self, method='scrypt', cost=None, workers=2, max_queue=32):
+        self.method = method
+        self.cost = DEFAULT_COST[method] if cost is None else int(cost)
+        self.pool = HashingPool(workers, max_queue)
+        self._dummy = None
+
+    def hash(self, password):
+        return self.pool.run(hash_password, password, self.method, self.cost)
+
+    def verify(self, password, stored):
+        """
+        Check a password on the pool. `stored` None (no such account) is
+        checked against a throwaway hash, so a missing account takes as
+        long to reject as a wrong password.
+        """
+        if stored is None:
+            if self._dummy is None:
+                self._dummy = self.hash(secrets.token_hex(8))
+            self.pool.run(verify_password, password, self._dummy)
+            return False
+        return self.pool.run(verify_password, password, stored)
+
+    def needs_rehash(self, stored):
+        return needs_rehash(stored, self.method, self.cost)
+
+password_hasher = PasswordHasher()
+
+def init_app(app):
+    """Configure password hashing from PASSWORD_HASH_* settings"""
+    global password_hasher
+    password_hasher.pool.shutdown()
+    password_hasher = PasswordHasher(
+        method=app.config.get('PASSWORD_HASH_METHOD', 'scrypt'),
+        cost=app.config.get('PASSWORD_HASH_COST'),
+        workers=app.config.get('PASSWORD_HASH_WORKERS', 2),
+        max_queue=app.config.get('PASSWORD_HASH_QUEUE', 32)
+    )
+
+def get_password_hasher():
+    return password_hasher
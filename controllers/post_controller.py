@@ -1,48 +1,72 @@
 import os
 import json
-from datetime import datetime
+import base64
+import binascii
+from collections import deque
+from datetime import datetime, timezone
 from flask import flash, redirect, url_for, abort, current_app
 from controllers.auth_controller import get_current_user
+from controllers.page_cache import page_cache
+from storage.derived import DERIVED_FIELDS, derive_fields
+from storage.coalescing import SingleFlight
+from storage.instrumentation import storage_read, storage_write
+from storage.post_repository import POSTS_FILE, get_post_repository
+from storage.sqlite_store import get_database
+from storage.locking import FileLock, atomic_write
 
 # File paths for storing data
-POSTS_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'posts.json')
 TAGS_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'tags.json')
+# Posts fetched from the store at a time while a listing is streamed,
+# a fraction of a page so the first cards are not held back by the last
+STREAM_BATCH_SIZE = 5
+_tags_lock = FileLock(TAGS_FILE)
+# Concurrent loads of the same post version, e.g. readers of a popular
+# post just after it was edited, share one read
+post_loads = SingleFlight()
 
 def load_posts():
-    """Load posts from JSON file"""
+    """Load posts from the post repository"""
     try:
-        if os.path.exists(POSTS_FILE):
-            with open(POSTS_FILE, 'r') as f:
-                return json.load(f)
+        return get_post_repository().all()
     except Exception as e:
         current_app.logger.error(f'Error loading posts: {str(e)}')
     return []
 
 def save_posts(posts):
-    """Save posts to JSON file"""
+    """Replace all posts in the post repository"""
     try:
-        with open(POSTS_FILE, 'w') as f:
-            json.dump(posts, f, indent=2)
+        get_post_repository().replace_all(posts)
+        page_cache.clear()
         return True
     except Exception as e:
         current_app.logger.error(f'Error saving posts: {str(e)}')
         return False
 
+@storage_read
 def load_tags():
-    """Load tags from JSON file"""
+    """Load tags from JSON file (or the SQLite database when configured)"""
     try:
-        if os.path.exists(TAGS_FILE):
-            with open(TAGS_FILE, 'r') as f:
-                return json.load(f)
+        database = get_database()
+        if database is not None:
+            return database.load_tags()
+        with _tags_lock.shared():
+            if os.path.exists(TAGS_FILE):
+                with open(TAGS_FILE, 'r') as f:
+                    return json.load(f)
     except Exception as e:
         current_app.logger.error(f'Error loading tags: {str(e)}')
     return []
 
+@storage_write
 def save_tags(tags):
-    """Save tags to JSON file"""
+    """Save tags to JSON file (or the SQLite database when configured)"""
     try:
-        with open(TAGS_FILE, 'w') as f:
-            json.dump(tags, f, indent=2)
+        database = get_database()
+        if database is not None:
+            database.save_tags(tags)
+            return True
+        with _tags_lock.exclusive():
+            atomic_write(TAGS_FILE, json.dumps(tags, indent=2))
         return True
     except Exception as e:
         current_app.logger.error(f'Error saving tags: {str(e)}')
@@ -50,23 +74,75 @@ def save_tags(tags):
 
 def get_next_post_id():
     """Get next available post ID"""
-    posts = load_posts()
-    if not posts:
-        return 1
-    return max(post['id'] for post in posts) + 1
+    return get_post_repository().next_id()
+
+def _timestamp(value):
+    """ISO 8601 string for a stored timestamp (a datetime or already a string)"""
+    return value if isinstance(value, str) else value.isoformat()
+
+def now_like(timestamp):
+    """
+    The current time, with the local timezone only if `timestamp` (a
+    datetime or ISO string) has one, so a post never mixes the two
+    """
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp)
+    return datetime.now().astimezone() if timestamp.tzinfo else datetime.now()
 
 class Post:
-    """Simple Post class for file-based storage"""
-    def __init__(self, id, title, body, author, is_published=False, tags=None, created_at=None, updated_at=None):
+    """
+    Compact post record for file-based storage.
+
+    Built straight from a store row (a dict or read-only view) without
+    copying it. created_at/updated_at are datetimes; a stored ISO string is
+    parsed the first time it is read and kept, and to_dict() writes an
+    untouched string back exactly as it was stored.
+
+    body_html, excerpt, word_count and reading_time are computed by the
+    store when the post is written (see storage/derived.py) and are read
+    only. Listing rows may leave out body and body_html.
+    """
+    __slots__ = ('id', 'title', 'body', 'author', 'is_published', 'tags', '_created_at', '_updated_at',
+                 'body_html', 'excerpt', 'word_count', 'reading_time')
+
+    def __init__(self, id, title, body, author, is_published=False, tags=None, created_at=None, updated_at=None,
+                 body_html=None, excerpt=None, word_count=None, reading_time=None):
         self.id = id
         self.title = title
         self.body = body
         self.author = author
         self.is_published = is_published
         self.tags = tags or []
-        self.created_at = created_at or datetime.now().isoformat()
-        self.updated_at = updated_at or datetime.now().isoformat()
-    
+        self._created_at = created_at or datetime.now()
+        self._updated_at = updated_at or datetime.now()
+        if excerpt is None and body is not None:
+            # Stored before these fields existed
+            body_html, excerpt, word_count, reading_time = derive_fields(body).values()
+        self.body_html = body_html
+        self.excerpt = excerpt
+        self.word_count = word_count
+        self.reading_time = reading_time
+
+    @property
+    def created_at(self):
+        if isinstance(self._created_at, str):
+            self._created_at = datetime.fromisoformat(self._created_at)
+        return self._created_at
+
+    @created_at.setter
+    def created_at(self, value):
+        self._created_at = value
+
+    @property
+    def updated_at(self):
+        if isinstance(self._updated_at, str):
+            self._updated_at = datetime.fromisoformat(self._updated_at)
+        return self._updated_at
+
+    @updated_at.setter
+    def updated_at(self, value):
+        self._updated_at = value
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -74,54 +150,252 @@ class Post:
             'body': self.body,
             'author': self.author,
             'is_published': self.is_published,
-            'tags': self.tags,
-            'created_at': self.created_at,
-            'updated_at': self.updated_at
+            'tags': list(self.tags),
+            'created_at': _timestamp(self._created_at),
+            'updated_at': _timestamp(self._updated_at)
         }
     
     @classmethod
     def from_dict(cls, data):
-        return cls(**data)
+        get = data.get
+        return cls(data['id'], data['title'], get('body'), data['author'], get('is_published', False),
+                   get('tags'), get('created_at'), get('updated_at'),
+                   get('body_html'), get('excerpt'), get('word_count'), get('reading_time'))
     
     def publish(self):
         if self.is_published:
             raise ValueError("Post is already published")
         self.is_published = True
-        self.updated_at = datetime.now().isoformat()
+        self.updated_at = now_like(self.created_at)
     
     def unpublish(self):
         if not self.is_published:
             raise ValueError("Post is already unpublished")
         self.is_published = False
-        self.updated_at = datetime.now().isoformat()
+        self.updated_at = now_like(self.created_at)
+
+POST_FIELDS = ('id', 'title', 'body', 'author', 'is_published', 'tags', 'created_at', 'updated_at')
+
+def validate_post_data(data):
+    """
+    Check a post record from outside the app (e.g. an import file) against
+    the Post fields and return it as a complete post dict. A missing id is
+    left as None for the caller to assign. Derived fields (as in an export)
+    are accepted but dropped; the store computes them again. Timestamps
+    are stored in the form datetime.isoformat() gives them, and must both
+    have a timezone or both lack one. Raises ValueError on bad data.
+    """
+    if not isinstance(data, dict):
+        raise ValueError('record is not an object')
+    unknown = set(data) - set(POST_FIELDS) - set(DERIVED_FIELDS)
+    if unknown:
+        raise ValueError(f'unknown fields: {", ".join(sorted(unknown))}')
+    post_id = data.get('id')
+    if post_id is not None and (not isinstance(post_id, int) or isinstance(post_id, bool) or post_id < 1):
+        raise ValueError('id must be a positive integer')
+    for field in ('title', 'body', 'author'):
+        if not isinstance(data.get(field), str) or not data[field].strip():
+            raise ValueError(f'{field} must be a non-empty string')
+    if len(data['title']) > 200:
+        raise ValueError('title must be at most 200 characters')
+    if not isinstance(data.get('is_published', False), bool):
+        raise ValueError('is_published must be true or false')
+    tags = data.get('tags') or []
+    if not isinstance(tags, list) or not all(isinstance(tag, str) for tag in tags):
+        raise ValueError('tags must be a list of strings')
+    timestamps = {}
+    for field in ('created_at', 'updated_at'):
+        value = data.get(field)
+        if value is not None:
+            try:
+                timestamps[field] = datetime.fromisoformat(value)
+            except (TypeError, ValueError):
+                raise ValueError(f'{field} must be an ISO 8601 timestamp')
+    if len({timestamp.tzinfo is None for timestamp in timestamps.values()}) > 1:
+        raise ValueError('created_at and updated_at must both have a timezone or both lack one')
+    created_at = timestamps.get('created_at')
+    created_at = created_at and created_at.isoformat()
+    updated_at = timestamps.get('updated_at')
+    updated_at = updated_at.isoformat() if updated_at else created_at
+    return Post(
+        id=post_id,
+        title=data['title'].strip(),
+        body=data['body'].strip(),
+        author=data['author'],
+        is_published=data.get('is_published', False),
+        tags=tags,
+        created_at=created_at,
+        updated_at=updated_at
+    ).to_dict()
+
+class PostPage(list):
+    """
+    A page of posts plus the cursor for the page after it (None if last)
+    and, where known, the total number of matching posts.
+    """
+    def __init__(self, posts, next_cursor=None, total=None):
+        super().__init__(posts)
+        self.next_cursor = next_cursor
+        self.total = total
 
-def list_posts(published=True):
+class PostStream:
+    """
+    One page of posts fetched lazily while a streamed template iterates it.
+
+    Posts are read from the store STREAM_BATCH_SIZE at a time with the same
+    keyset cursors as list_posts(), so only one batch is held in memory.
+    next_cursor is filled in once iteration reaches the end of the page.
+    A stream can be iterated once.
+    """
+    total = None
+
+    def __init__(self, published=True, limit=20, cursor=None):
+        self.published = published
+        self.next_cursor = None
+        self._key = decode_cursor(cursor)
+        self._remaining = limit
+        self._batch = deque()
+        self._exhausted = False
+
+    def _fetch(self):
+        if self._exhausted or self._remaining <= 0:
+            return False
+        posts_data, next_key = get_post_repository().page(
+            self.published, min(STREAM_BATCH_SIZE, self._remaining), self._key, summary=True)
+        self._remaining -= len(posts_data)
+        self._batch.extend(Post.from_dict(data) for data in posts_data)
+        if next_key is None:
+            self._exhausted = True
+        else:
+            self._key = next_key
+            if self._remaining <= 0:
+                self.next_cursor = encode_cursor(next_key)
+        return bool(posts_data)
+
+    def __bool__(self):
+        return bool(self._batch) or self._fetch()
+
+    def __iter__(self):
+        while self._batch or self._fetch():
+            yield self._batch.popleft()
+
+def encode_cursor(key):
+    """Encode a (created_at, id) keyset position for use in a URL"""
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """Decode a URL cursor back to (created_at, id); None if missing or invalid"""
+    if not cursor:
+        return None
+    try:
+        created_at, post_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        return (str(created_at), int(post_id))
+    except (ValueError, TypeError, binascii.Error):
+        return None
+
+def list_posts(published=True, limit=None, cursor=None):
     """
     Get posts filtered by is_published status.
     Return a list of posts ordered by creation date (newest first).
+    With a limit, return one page starting after `cursor` (as produced by
+    a previous page's next_cursor).
     """
-    posts_data = load_posts()
-    posts = [Post.from_dict(data) for data in posts_data]
-    
-    # Filter by published status
-    filtered_posts = [post for post in posts if post.is_published == published]
-    
-    # Sort by created_at (newest first)
-    filtered_posts.sort(key=lambda x: x.created_at, reverse=True)
-    
-    return filtered_posts
+    repository = get_post_repository()
+    if limit is None:
+        return PostPage([Post.from_dict(data) for data in repository.list_by_status(published)])
+    posts_data, next_key = repository.page(published, limit, decode_cursor(cursor), summary=True)
+    return PostPage(
+        [Post.from_dict(data) for data in posts_data],
+        encode_cursor(next_key) if next_key else None
+    )
+
+def stream_posts(published=True, limit=20, cursor=None):
+    """
+    Like list_posts() with a limit, but return a PostStream that reads the
+    page from the store in batches as it is iterated.
+    """
+    return PostStream(published, limit, cursor)
+
+def list_posts_by_tag(tag, limit=20, cursor=None):
+    """
+    Get one page of published posts carrying `tag`, newest first.
+    The cursor is the id of the last post on the previous page.
+    """
+    try:
+        cursor_id = int(cursor) if cursor else None
+    except ValueError:
+        cursor_id = None
+    posts_data, next_id = get_post_repository().page_by_tag(tag, limit, cursor_id, summary=True)
+    return PostPage(
+        [Post.from_dict(data) for data in posts_data],
+        str(next_id) if next_id else None
+    )
+
+def search_posts(query, limit=20, cursor=None):
+    """
+    Full-text search over published posts, best match first.
+    The cursor is the number of results already shown.
+    """
+    try:
+        offset = max(0, int(cursor)) if cursor else 0
+    except ValueError:
+        offset = 0
+    posts_data, total = get_post_repository().search(query, limit, offset, summary=True)
+    shown = offset + len(posts_data)
+    return PostPage(
+        [Post.from_dict(data) for data in posts_data],
+        str(shown) if shown < total else None,
+        total
+    )
+
+def get_tag_counts():
+    """
+    Get (tag, published post count) pairs for the tag cloud, by tag name.
+    """
+    try:
+        return sorted(get_post_repository().tag_counts().items())
+    except Exception as e:
+        current_app.logger.error(f'Error loading tag counts: {str(e)}')
+        return []
 
-def get_post(post_id):
+def get_posts_version():
+    """
+    Return (store version, last modified datetime) for the post store. The
+    version increases on every write by any process.
+    """
+    repository = get_post_repository()
+    modified_at = repository.modified_at()
+    return (repository.version(),
+            datetime.fromtimestamp(modified_at, timezone.utc) if modified_at else None)
+
+def get_post_version(post_id):
+    """
+    Return (updated_at, last modified datetime) for one post without
+    loading it, or None if it does not exist.
+    """
+    updated_at = get_post_repository().updated_at(post_id)
+    if updated_at is None:
+        return None
+    try:
+        last_modified = datetime.fromisoformat(updated_at).astimezone(timezone.utc)
+    except (TypeError, ValueError):
+        last_modified = None
+    return updated_at, last_modified
+
+def get_post(post_id, version=None):
     """
     Retrieve a post by its ID or abort with 404 if not found.
+    With `version` (the post's updated_at), concurrent calls for the same
+    post and version share a single load.
     """
-    posts_data = load_posts()
-    
-    for data in posts_data:
-        if data['id'] == int(post_id):
-            return Post.from_dict(data)
-    
-    abort(404)
+    repository = get_post_repository()
+    if version is None:
+        data = repository.get(post_id)
+    else:
+        data, _ = post_loads.do((post_id, version), lambda: repository.get(post_id))
+    if data is None:
+        abort(404)
+    return Post.from_dict(data)
 
 def create_post(form_data):
     """
@@ -135,12 +409,11 @@ def create_post(form_data):
             flash('You must be logged in to create a post.', 'error')
             return redirect(url_for('auth.login'))
         
-        # Load existing posts
-        posts_data = load_posts()
+        repository = get_post_repository()
         
-        # Create new post
+        # Create new post; the store assigns its id when it is written
         new_post = Post(
-            id=get_next_post_id(),
+            id=None,
             title=form_data.get('title', '').strip(),
             body=form_data.get('body', '').strip(),
             author=user['username'],
@@ -148,19 +421,20 @@ def create_post(form_data):
             tags=form_data.getlist('tags') if hasattr(form_data, 'getlist') else form_data.get('tags', [])
         )
         
-        # Add to posts list
-        posts_data.append(new_post.to_dict())
-        
-        # Save posts
-        if save_posts(posts_data):
-            flash('Post created successfully!', 'success')
-            if new_post.is_published:
-                return redirect(url_for('posts.show_posts'))
-            else:
-                return redirect(url_for('posts.drafts'))
-        else:
+        # Save post
+        try:
+            repository.insert(new_post.to_dict())
+        except OSError as e:
+            current_app.logger.error(f'Error saving posts: {str(e)}')
             flash('Error creating post. Please try again.', 'error')
             return redirect(url_for('posts.new_post'))
+        page_cache.invalidate_listings()
+        
+        flash('Post created successfully!', 'success')
+        if new_post.is_published:
+            return redirect(url_for('posts.show_posts'))
+        else:
+            return redirect(url_for('posts.drafts'))
             
     except Exception as e:
         current_app.logger.error(f'Error creating post: {str(e)}')
@@ -173,36 +447,35 @@ def update_post(post_id, form_data):
     validate, save changes, flash messages, and redirect.
     """
     try:
-        posts_data = load_posts()
+        def apply_form(data):
+            post = Post.from_dict(data)
+            
+            # Update post fields
+            post.title = form_data.get('title', '').strip()
+            post.body = form_data.get('body', '').strip()
+            post.is_published = bool(form_data.get('is_published'))
+            post.tags = form_data.getlist('tags') if hasattr(form_data, 'getlist') else form_data.get('tags', [])
+            post.updated_at = now_like(post.created_at)
+            return post.to_dict()
         
-        # Find and update post
-        for i, data in enumerate(posts_data):
-            if data['id'] == int(post_id):
-                post = Post.from_dict(data)
-                
-                # Update post fields
-                post.title = form_data.get('title', '').strip()
-                post.body = form_data.get('body', '').strip()
-                post.is_published = bool(form_data.get('is_published'))
-                post.tags = form_data.getlist('tags') if hasattr(form_data, 'getlist') else form_data.get('tags', [])
-                post.updated_at = datetime.now().isoformat()
-                
-                # Replace in list
-                posts_data[i] = post.to_dict()
-                
-                # Save posts
-                if save_posts(posts_data):
-                    flash('Post updated successfully!', 'success')
-                    if post.is_published:
-                        return redirect(url_for('posts.show_posts'))
-                    else:
-                        return redirect(url_for('posts.drafts'))
-                else:
-                    flash('Error updating post. Please try again.', 'error')
-                    return redirect(url_for('posts.edit_post', post_id=post_id))
+        # Save post
+        try:
+            data = get_post_repository().modify(post_id, apply_form)
+        except OSError as e:
+            current_app.logger.error(f'Error saving posts: {str(e)}')
+            flash('Error updating post. Please try again.', 'error')
+            return redirect(url_for('posts.edit_post', post_id=post_id))
         
         # Post not found
-        abort(404)
+        if data is None:
+            abort(404)
+        page_cache.invalidate_post(data['id'])
+        
+        flash('Post updated successfully!', 'success')
+        if data['is_published']:
+            return redirect(url_for('posts.show_posts'))
+        else:
+            return redirect(url_for('posts.drafts'))
             
     except Exception as e:
         current_app.logger.error(f'Error updating post: {str(e)}')
@@ -214,55 +487,61 @@ def delete_post(post_id):
     Delete a post by ID.
     """
     try:
-        posts_data = load_posts()
-        
-        # Find and remove post
-        for i, data in enumerate(posts_data):
-            if data['id'] == int(post_id):
-                posts_data.pop(i)
-                
-                if save_posts(posts_data):
-                    flash('Post deleted successfully!', 'success')
-                else:
-                    flash('Error deleting post. Please try again.', 'error')
-                return redirect(url_for('posts.show_posts'))
+        try:
+            deleted = get_post_repository().delete(post_id)
+        except OSError as e:
+            current_app.logger.error(f'Error saving posts: {str(e)}')
+            flash('Error deleting post. Please try again.', 'error')
+            return redirect(url_for('posts.show_posts'))
         
         # Post not found
-        abort(404)
+        if not deleted:
+            abort(404)
+        page_cache.invalidate_post(int(post_id))
+        
+        flash('Post deleted successfully!', 'success')
+        return redirect(url_for('posts.show_posts'))
         
     except Exception as e:
         current_app.logger.error(f'Error deleting post: {str(e)}')
         flash(f'Error deleting post: {str(e)}', 'error')
         return redirect(url_for('posts.show_posts'))
 
-def list_drafts():
+def list_drafts(limit=None, cursor=None):
     """
     Reuse list_posts to fetch unpublished posts.
     """
-    return list_posts(published=False)
+    return list_posts(published=False, limit=limit, cursor=cursor)
+
+def _publish(data):
+    post = Post.from_dict(data)
+    post.publish()
+    return post.to_dict()
+
+def _unpublish(data):
+    post = Post.from_dict(data)
+    post.unpublish()
+    return post.to_dict()
 
 def publish_post(post_id):
     """
     Publish a post using the post's publish method.
     """
     try:
-        posts_data = load_posts()
-        
-        # Find and publish post
-        for i, data in enumerate(posts_data):
-            if data['id'] == int(post_id):
-                post = Post.from_dict(data)
-                post.publish()
-                posts_data[i] = post.to_dict()
-                
-                if save_posts(posts_data):
-                    flash(f'Post "{post.title}" published successfully!', 'success')
-                else:
-                    flash('Error publishing post. Please try again.', 'error')
-                return redirect(url_for('posts.show_posts'))
+        try:
+            data = get_post_repository().modify(post_id, _publish)
+        except OSError as e:
+            current_app.logger.error(f'Error saving posts: {str(e)}')
+            flash('Error publishing post. Please try again.', 'error')
+            return redirect(url_for('posts.show_posts'))
         
         # Post not found
-        abort(404)
+        if data is None:
+            abort(404)
+        page_cache.invalidate_post(data['id'])
+        
+        flash(f'Post "{data["title"]}" published successfully!', 'success')
+        return redirect(url_for('posts.show_posts'))
         
     except ValueError as e:
         flash(str(e), 'error')
@@ -277,23 +556,20 @@ def unpublish_post(post_id):
     Unpublish a post using the post's unpublish method.
     """
     try:
-        posts_data = load_posts()
-        
-        # Find and unpublish post
-        for i, data in enumerate(posts_data):
-            if data['id'] == int(post_id):
-                post = Post.from_dict(data)
-                post.unpublish()
-                posts_data[i] = post.to_dict()
-                
-                if save_posts(posts_data):
-                    flash(f'Post "{post.title}" moved to drafts!', 'success')
-                else:
-                    flash('Error unpublishing post. Please try again.', 'error')
-                return redirect(url_for('posts.drafts'))
+        try:
+            data = get_post_repository().modify(post_id, _unpublish)
+        except OSError as e:
+            current_app.logger.error(f'Error saving posts: {str(e)}')
+            flash('Error unpublishing post. Please try again.', 'error')
+            return redirect(url_for('posts.drafts'))
         
         # Post not found
-        abort(404)
+        if data is None:
+            abort(404)
+        page_cache.invalidate_post(data['id'])
+        
+        flash(f'Post "{data["title"]}" moved to drafts!', 'success')
+        return redirect(url_for('posts.drafts'))
         
     except ValueError as e:
         flash(str(e), 'error')
@@ -3,5 +3,7 @@
 
 from routes.post_routes import post_bp
 from routes.auth_routes import auth_bp
+from routes.api_routes import api_bp
+from routes.metrics_routes import metrics_bp
 
-__all__ = ['post_bp', 'auth_bp']
\ No newline at end of file
+__all__ = ['post_bp', 'auth_bp', 'api_bp', 'metrics_bp']
\ No newline at end of file
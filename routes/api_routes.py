@@ -0,0 +1,39 @@
+from flask import Blueprint, request
+from controllers import api_controller
+from controllers.api_controller import ApiError, json_response
+
+# JSON API for non-browser clients. It is exempt from CSRF tokens (see
+# create_app); writes only accept application/json bodies, which a
+# cross-site form cannot send.
+api_bp = Blueprint('api', __name__, url_prefix='/api')
+
+@api_bp.errorhandler(ApiError)
+def api_error(error):
+    return json_response({'error': error.message}, error.status)
+
+@api_bp.errorhandler(404)
+def not_found(error):
+    return json_response({'error': 'Not found'}, 404)
+
+@api_bp.route('/posts', methods=['GET'])
+def list_posts():
+    """
+    List posts: ?published=, ?tag=, ?author=, ?limit=, ?cursor= and
+    ?fields= (comma-separated) to return only some fields.
+    """
+    return api_controller.list_posts(request.args)
+
+@api_bp.route('/posts/<int:post_id>', methods=['GET'])
+def get_post(post_id):
+    """Get one post, optionally projected with ?fields="""
+    return api_controller.get_post(post_id, request.args)
+
+@api_bp.route('/posts/batch', methods=['POST'])
+def batch():
+    """Create, update, publish or unpublish many posts in one write"""
+    if not request.is_json:
+        raise ApiError('Expected an application/json body', 415)
+    payload = request.get_json(silent=True)
+    if payload is None:
+        raise ApiError('Invalid JSON body')
+    return api_controller.batch(payload, request.args)
@@ -0,0 +1,11 @@
+from flask import Blueprint, Response, abort, current_app
+from controllers.metrics import metrics_registry
+
+metrics_bp = Blueprint('metrics', __name__)
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def metrics():
+    """Request metrics of this process in the Prometheus text format"""
+    if not current_app.config.get('METRICS_ENABLED', True):
+        abort(404)
+    return Response(metrics_registry.render(), mimetype='text/plain; version=0.0.4')
@@ -1,8 +1,11 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash
+from flask import Blueprint, render_template, stream_template, request, redirect, url_for, flash, current_app, abort
 from controllers.post_controller import (
-    list_posts, get_post, create_post, update_post, list_drafts, 
-    delete_post, publish_post, unpublish_post, get_all_tags
+    get_post, create_post, update_post,
+    delete_post, publish_post, unpublish_post, get_all_tags,
+    list_posts_by_tag, get_tag_counts, search_posts, get_post_version, get_posts_version,
+    stream_posts
 )
+from controllers.page_cache import cached_page, stream_page
 from controllers.auth_controller import require_login, is_logged_in
 from forms.post_form import PostForm
 from forms.email_form import EmailForm
@@ -12,18 +15,58 @@ post_bp = Blueprint('posts', __name__, url_prefix='/posts')
 @post_bp.route('/', methods=['GET'])
 def show_posts():
     """
-    Retrieve published posts and render 'posts.html' with the posts list.
+    Retrieve one page of published posts and render 'posts.html' with the posts list.
+    Pages that are not served from the cache are streamed as the posts are read.
+    """
+    cursor = request.args.get('cursor')
+    def render(csrf_token):
+        posts = stream_posts(published=True, limit=current_app.config['POSTS_PER_PAGE'], cursor=cursor)
+        return stream_template('posts.html', posts=posts, tag_counts=get_tag_counts(),
+                               page_title="Published Posts", csrf_token=csrf_token)
+    version, last_modified = get_posts_version()
+    return cached_page(('show_posts', cursor, version), render,
+                       etag=f'posts-{version}', last_modified=last_modified)
+
+@post_bp.route('/tag/<name>', methods=['GET'])
+def tag_posts(name):
+    """
+    Retrieve one page of published posts with the given tag and render 'posts.html'.
+    """
+    cursor = request.args.get('cursor')
+    def render(csrf_token):
+        posts = list_posts_by_tag(name, limit=current_app.config['POSTS_PER_PAGE'], cursor=cursor)
+        return render_template('posts.html', posts=posts,
+                               tag_counts=get_tag_counts(), page_title=f"Posts tagged #{name}",
+                               csrf_token=csrf_token)
+    version, last_modified = get_posts_version()
+    return cached_page(('tag_posts', name, cursor, version), render,
+                       etag=f'posts-{version}', last_modified=last_modified)
+
+@post_bp.route('/search', methods=['GET'])
+def search():
     """
-    posts = list_posts(published=True)
-    return render_template('posts.html', posts=posts, page_title="Published Posts")
+    Full-text search over published posts and render 'posts.html' with one page of results.
+    """
+    query = request.args.get('q', '').strip()
+    posts = search_posts(query, limit=current_app.config['POSTS_PER_PAGE'],
+                         cursor=request.args.get('cursor'))
+    return render_template('posts.html', posts=posts,
+                           query=query, page_title=f'Search results for "{query}"' if query else "Search")
 
 @post_bp.route('/<int:post_id>', methods=['GET'])
 def post_detail(post_id):
     """
     Fetch a single post by ID and render 'post_detail.html' with the post.
     """
-    post = get_post(post_id)
-    return render_template('post_detail.html', post=post)
+    version = get_post_version(post_id)
+    if version is None:
+        abort(404)
+    updated_at, last_modified = version
+    def render(csrf_token):
+        return render_template('post_detail.html', post=get_post(post_id, updated_at),
+                               csrf_token=csrf_token)
+    return cached_page(('post_detail', post_id, updated_at), render, post_id=post_id,
+                       etag=f'post-{post_id}-{updated_at}', last_modified=last_modified)
 
 @post_bp.route('/new', methods=['GET', 'POST'])
 def new_post():
@@ -83,7 +126,7 @@ def edit_post(post_id):
     
     # Pre-select current tags
     if request.method == 'GET':
-        form.tags.data = [tag.name for tag in post.tags]
+        form.tags.data = list(post.tags)
     
     if form.validate_on_submit():
         # Convert form data to dict-like object for controller
@@ -114,8 +157,9 @@ def drafts():
     if auth_check:
         return auth_check
     
-    drafts = list_drafts()
-    return render_template('posts.html', posts=drafts, page_title="Draft Posts")
+    drafts = stream_posts(published=False, limit=current_app.config['POSTS_PER_PAGE'],
+                          cursor=request.args.get('cursor'))
+    return stream_page(stream_template('posts.html', posts=drafts, page_title="Draft Posts"))
 
 @post_bp.route('/<int:post_id>/delete', methods=['POST'])
 def delete_post_route(post_id):
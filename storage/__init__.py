@@ -0,0 +1,6 @@
+# Flask Blog Application
+# Storage package
+
+from storage.post_repository import PostRepository, get_post_repository, set_post_repository
+
+__all__ = ['PostRepository', 'get_post_repository', 'set_post_repository']
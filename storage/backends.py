@@ -0,0 +1,154 @@
+import os
+import json
+from storage.instrumentation import count_read, count_written
+from storage.locking import FileLock, atomic_write
+
+# Change record operations written by the repository
+CREATE, UPDATE, DELETE, PUBLISH, UNPUBLISH = 'create', 'update', 'delete', 'publish', 'unpublish'
+
+# Key of a loaded post dict whose body and body_html were left on disk; it
+# holds a reference whose read() returns {'body': ..., 'body_html': ...}
+BODY_REF = '_body'
+
+def make_update_record(old, new):
+    """
+    Build the change record turning post dict `old` into `new`.
+    Publish state flips are recorded as their own small operations.
+    """
+    fields = {key: value for key, value in new.items() if old.get(key) != value}
+    if set(fields) <= {'is_published', 'updated_at'} and 'is_published' in fields:
+        op = PUBLISH if new['is_published'] else UNPUBLISH
+        return {'op': op, 'id': new['id'], 'updated_at': new['updated_at']}
+    return {'op': UPDATE, 'id': new['id'], 'fields': fields}
+
+def apply_record(current, record):
+    """
+    Return the post dict that results from applying a change record to
+    `current` (which may be None). Returns None when the post is deleted.
+    Records fully describe the fields they touch, so replaying one twice
+    is harmless.
+    """
+    op = record['op']
+    if op == CREATE:
+        return dict(record['post'])
+    if op == DELETE or current is None:
+        return None
+    post = dict(current)
+    if op == UPDATE:
+        post.update(record['fields'])
+    elif op in (PUBLISH, UNPUBLISH):
+        post['is_published'] = op == PUBLISH
+        post['updated_at'] = record['updated_at']
+    return post
+
+def stat_signature(path):
+    """Cheap change-detection token for a file: (inode, size, mtime)"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+class StorageBackend:
+    """
+    Persistence interface used by PostRepository.
+
+    The repository owns the in-memory state and hands every write to
+    commit() both as the full post list and as a list of change records,
+    so each backend can persist whichever is cheaper for it. A backend
+    may swap entries of that list for equivalent posts (never mutate them),
+    e.g. to leave bodies it has just stored on disk.
+    """
+    # Path of the id counter file kept next to the store
+    sequence_path = None
+    # Path where the search index is saved between runs
+    search_path = None
+    # Cross-process FileLock: shared for reloads, exclusive for writes
+    lock = None
+
+    def signature(self):
+        """Return a token that changes whenever the store changes on disk"""
+        raise NotImplementedError
+
+    def version(self):
+        """Number that increases with every write, as of the last load/commit"""
+        raise NotImplementedError
+
+    def modified_at(self):
+        """Unix time of the last write, or None for an empty store"""
+        raise NotImplementedError
+
+    def load(self):
+        """Read the full list of post dicts"""
+        raise NotImplementedError
+
+    def read_changes(self):
+        """
+        Return change records written by other processes since the last
+        load/commit, or None if a full reload is required.
+        """
+        return None
+
+    def commit(self, posts, records):
+        """Persist a write. `posts` is the full list after the change."""
+        raise NotImplementedError
+
+    def replace(self, posts):
+        """Replace the whole store"""
+        self.commit(posts, None)
+
+    def sync(self):
+        """Make every commit so far durable (commits that already are need nothing)"""
+
+    def close(self):
+        self.lock.close()
+
+class JsonFileBackend(StorageBackend):
+    """
+    The original posts.json format: the whole list rewritten on every
+    commit. A commit counter is kept in posts.version, written before the
+    posts, so a crash in between only costs a needless version change.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.sequence_path = os.path.splitext(path)[0] + '.seq'
+        self.search_path = os.path.splitext(path)[0] + '.search.json'
+        self.version_path = os.path.splitext(path)[0] + '.version'
+        self.lock = FileLock(path)
+        self._version = 0
+
+    def _read_version(self):
+        try:
+            with open(self.version_path, 'r') as f:
+                return int(json.load(f)['version'])
+        except (FileNotFoundError, ValueError, KeyError, TypeError):
+            return 0
+
+    def signature(self):
+        return stat_signature(self.path)
+
+    def version(self):
+        return self._version
+
+    def modified_at(self):
+        signature = stat_signature(self.path)
+        return signature[2] / 1e9 if signature else None
+
+    def load(self):
+        self._version = self._read_version()
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return []
+        posts = json.loads(data)
+        count_read(len(data), len(posts))
+        return posts
+
+    def commit(self, posts, records):
+        data = json.dumps(posts, indent=2)
+        version = max(self._read_version(), self._version) + 1
+        atomic_write(self.version_path, json.dumps({'version': version}))
+        self._version = version
+        atomic_write(self.path, data)
+        count_written(len(data))
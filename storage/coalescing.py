@@ -0,0 +1,87 @@
+import threading
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """
+    Run at most one call per key at a time. Threads asking for a key that
+    is already being computed wait for that call and share its result (or
+    its exception) instead of repeating the work. `leaders` and
+    `coalesced` count the calls that did the work and those that waited.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def do(self, key, function):
+        """Return (result of function(), True if this thread ran it)"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, False
+        try:
+            call.result = function()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, True
+
+def _share(result):
+    # Posts are read-only views; only the containers around them are
+    # copied so no two callers hold the same list
+    if isinstance(result, tuple):
+        return tuple(_share(item) for item in result)
+    if isinstance(result, list):
+        return list(result)
+    return result
+
+class CoalescingReader:
+    """
+    Wraps a post repository so that identical reads made at the same time
+    by different threads (the same method with the same arguments, e.g. a
+    burst of requests for one page) are answered by a single storage read.
+    The store version is part of the key, so a read that starts after a
+    write never gets the result of one that started before it.
+    Everything else is passed through unchanged.
+    """
+    COALESCED = frozenset(('get', 'list_by_status', 'page', 'page_by_tag', 'search', 'tag_counts'))
+
+    def __init__(self, repository):
+        self.repository = repository
+        self._flight = SingleFlight()
+
+    def __getattr__(self, name):
+        attribute = getattr(self.repository, name)
+        if name not in self.COALESCED:
+            return attribute
+
+        def read(*args, **kwargs):
+            key = (name, args, tuple(sorted(kwargs.items())), self.repository.version())
+            try:
+                hash(key)
+            except TypeError:
+                return attribute(*args, **kwargs)
+            result, leader = self._flight.do(key, lambda: attribute(*args, **kwargs))
+            return result if leader else _share(result)
+        return read
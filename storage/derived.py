@@ -0,0 +1,36 @@
+import math
+from markupsafe import escape
+
+# Characters of body text shown on post cards
+EXCERPT_LENGTH = 150
+# Reading speed behind the reading time estimate
+WORDS_PER_MINUTE = 200
+# Fields computed from the body and stored with each post
+DERIVED_FIELDS = ('body_html', 'excerpt', 'word_count', 'reading_time')
+
+def derive_fields(body):
+    """
+    Compute the stored fields that pages show instead of the raw body: the
+    HTML-escaped body with line breaks, the card excerpt, the word count
+    and the reading time in minutes.
+    """
+    word_count = len(body.split())
+    return {
+        'body_html': str(escape(body)).replace('\n', '<br>'),
+        'excerpt': body[:EXCERPT_LENGTH] + ('...' if len(body) > EXCERPT_LENGTH else ''),
+        'word_count': word_count,
+        'reading_time': max(1, math.ceil(word_count / WORDS_PER_MINUTE))
+    }
+
+def ensure_derived(post, previous=None):
+    """
+    Fill in the derived fields of a post dict about to be written (in
+    place) and return it. They are copied from `previous`, the stored
+    version, when the body has not changed, and recomputed otherwise.
+    """
+    if previous is not None and previous.get('body') == post['body'] and previous.get('body_html') is not None:
+        for field in DERIVED_FIELDS:
+            post[field] = previous[field]
+    else:
+        post.update(derive_fields(post['body']))
+    return post
@@ -0,0 +1,176 @@
+import os
+import time
+import logging
+import threading
+from collections import deque
+from storage import instrumentation
+from storage.instrumentation import storage_write
+
+logger = logging.getLogger(__name__)
+
+class _Mutation:
+    __slots__ = ('creates', 'changes', 'done', 'result', 'error', 'stats')
+
+    def __init__(self, creates=(), changes=()):
+        self.creates = list(creates)
+        self.changes = list(changes)
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        # IoStats of the request that queued it, credited with its share
+        self.stats = instrumentation.current()
+
+class GroupCommitWriter:
+    """
+    Wraps a post repository so that post creations, read-modify-writes and
+    whole write_batch() calls coming from many threads are committed
+    together. A writer thread takes the mutations queued within
+    `max_delay` seconds of the first one (at most `max_batch`) and applies
+    them with one write_batch() call, then one sync() for backends that
+    sync lazily (the WAL). Each caller returns only after the write
+    holding its mutation is durable, with that mutation's own result or
+    error. New posts may leave out their id; it is allocated inside the
+    batch.
+
+    The storage I/O of a batch is spread evenly over the requests it
+    served, so per-request numbers and /metrics totals still add up.
+
+    Mutations queued while a batch is being written go into the next one,
+    so even with max_delay 0 a burst of writers shares few writes. If a
+    batch is rejected before anything is written (ValueError: a taken id,
+    a change that fails validation), its mutations are retried one by one
+    so only the faulty one sees the error. Any other failure may come
+    after the data reached disk (e.g. the directory fsync after the
+    rename), so it is never retried: every mutation of the batch gets the
+    error and the repository is reloaded from disk before the next batch.
+    Everything else is passed through to the repository unchanged.
+    """
+    def __init__(self, repository, max_delay=0.002, max_batch=64):
+        self.repository = repository
+        self.max_delay = max_delay
+        self.max_batch = max(1, max_batch)
+        self._cond = threading.Condition()
+        self._queue = deque()
+        self._closed = False
+        self._thread = None
+        self._pid = None
+
+    def __getattr__(self, name):
+        return getattr(self.repository, name)
+
+    def _submit(self, mutation):
+        with self._cond:
+            if self._closed:
+                raise RuntimeError('Post writer is closed')
+            if self._pid != os.getpid():
+                # Started on first use, and again in each forked worker
+                self._thread = threading.Thread(target=self._run, name='group-commit', daemon=True)
+                self._thread.start()
+                self._pid = os.getpid()
+            self._queue.append(mutation)
+            self._cond.notify()
+        mutation.done.wait()
+        if mutation.error is not None:
+            raise mutation.error
+        return mutation.result
+
+    def insert(self, post):
+        """Add a new post dict and return the stored dict"""
+        return self.insert_many([post])[0]
+
+    @storage_write
+    def insert_many(self, posts):
+        """Add several new post dicts, committed with other queued writes"""
+        return self._submit(_Mutation(creates=posts))[0]
+
+    @storage_write
+    def modify(self, post_id, change):
+        """Read-modify-write one post (see PostRepository.modify), batched"""
+        return self._submit(_Mutation(changes=[(post_id, change)]))[1][0]
+
+    @storage_write
+    def write_batch(self, creates=(), changes=()):
+        """PostRepository.write_batch, committed with other queued writes"""
+        return self._submit(_Mutation(creates, changes))
+
+    def _next_batch(self):
+        """Wait for queued mutations and return a batch, or None once closed"""
+        with self._cond:
+            while not self._queue:
+                if self._closed:
+                    return None
+                self._cond.wait()
+            deadline = time.monotonic() + self.max_delay
+            while len(self._queue) < self.max_batch and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            count = min(len(self._queue), self.max_batch)
+            return [self._queue.popleft() for _ in range(count)]
+
+    def _write(self, batch):
+        creates = [post for mutation in batch for post in mutation.creates]
+        changes = [change for mutation in batch for change in mutation.changes]
+        created, changed = self.repository.write_batch(creates, changes)
+        created, changed = iter(created), iter(changed)
+        for mutation in batch:
+            mutation.result = ([next(created) for _ in mutation.creates],
+                               [next(changed) for _ in mutation.changes])
+
+    def _write_batch(self, batch):
+        try:
+            self._write(batch)
+        except ValueError:
+            # Rejected before anything was stored: retry each on its own
+            for mutation in batch:
+                try:
+                    self._write([mutation])
+                except ValueError as e:
+                    mutation.error = e
+
+    def _reload(self):
+        try:
+            self.repository.reload()
+        except Exception as e:
+            # The repository is left stale and reloads on its next use
+            logger.error('Error reloading posts after a failed write: %s', e)
+
+    @staticmethod
+    def _credit(batch, stats):
+        share = len(batch)
+        for mutation in batch:
+            if mutation.stats is not None:
+                mutation.stats.bytes_read += stats.bytes_read // share
+                mutation.stats.bytes_written += stats.bytes_written // share
+                mutation.stats.posts_loaded += stats.posts_loaded // share
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            stats = instrumentation.begin()
+            try:
+                self._write_batch(batch)
+                self.repository.sync()
+            except Exception as e:
+                # Maybe on disk already: report it, never write it again
+                for mutation in batch:
+                    mutation.error = mutation.error or e
+                self._reload()
+            finally:
+                instrumentation.end(stats)
+            self._credit(batch, stats)
+            for mutation in batch:
+                mutation.done.set()
+
+    def close(self):
+        """Commit what is queued, stop the writer thread and close the repository"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+            thread = self._thread if self._pid == os.getpid() else None
+        if thread is not None:
+            thread.join()
+        self.repository.close()
@@ -0,0 +1,78 @@
+import time
+import functools
+from contextvars import ContextVar
+
+class IoStats:
+    """
+    Storage work done on behalf of one request: time spent in storage
+    reads and writes, bytes read from and written to files, and posts
+    deserialized from disk. Template render time is kept here too, so a
+    request's numbers live in one place.
+    """
+    __slots__ = ('read_time', 'write_time', 'bytes_read', 'bytes_written',
+                 'posts_loaded', 'render_time', '_depth')
+
+    def __init__(self):
+        self.read_time = 0.0
+        self.write_time = 0.0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.posts_loaded = 0
+        self.render_time = 0.0
+        self._depth = 0
+
+_current = ContextVar('io_stats', default=None)
+
+def begin():
+    """Start collecting IoStats for the current request and return them"""
+    stats = IoStats()
+    _current.set(stats)
+    return stats
+
+def end(stats):
+    """Stop collecting `stats`; storage calls outside a request are not counted"""
+    if _current.get() is stats:
+        _current.set(None)
+
+def current():
+    """The IoStats being collected, or None"""
+    return _current.get()
+
+def count_read(nbytes, posts=0):
+    stats = _current.get()
+    if stats is not None:
+        stats.bytes_read += nbytes
+        stats.posts_loaded += posts
+
+def count_written(nbytes):
+    stats = _current.get()
+    if stats is not None:
+        stats.bytes_written += nbytes
+
+def count_posts(posts):
+    stats = _current.get()
+    if stats is not None:
+        stats.posts_loaded += posts
+
+def _timed(field):
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            stats = _current.get()
+            if stats is None or stats._depth:
+                # Not in a request, or already timed by an outer storage call
+                return function(*args, **kwargs)
+            stats._depth = 1
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                setattr(stats, field, getattr(stats, field) + time.perf_counter() - started)
+                stats._depth = 0
+        return wrapper
+    return decorate
+
+# Decorators for public storage methods: the time spent in them counts as
+# storage read or write time of the current request
+storage_read = _timed('read_time')
+storage_write = _timed('write_time')
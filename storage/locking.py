@@ -0,0 +1,94 @@
+import os
+import fcntl
+import threading
+from contextlib import contextmanager
+
+class FileLock:
+    """
+    Cross-process reader/writer lock backed by fcntl.flock on `<path>.lock`.
+
+    shared() may be held by many processes at once; exclusive() by one.
+    Inside a process the lock is re-entrant per thread, and an inner
+    acquisition never downgrades an outer exclusive hold.
+    """
+    def __init__(self, path):
+        self.path = path + '.lock'
+        self._thread_lock = threading.RLock()
+        self._fd = None
+        self._depth = 0
+        self._mode = None
+
+    def _acquire(self, mode):
+        self._thread_lock.acquire()
+        try:
+            if self._fd is None:
+                self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            if self._depth == 0:
+                fcntl.flock(self._fd, mode)
+                self._mode = mode
+            elif mode == fcntl.LOCK_EX and self._mode == fcntl.LOCK_SH:
+                raise RuntimeError('Cannot upgrade a shared lock to exclusive')
+            self._depth += 1
+        except BaseException:
+            self._thread_lock.release()
+            raise
+
+    def _release(self):
+        try:
+            self._depth -= 1
+            if self._depth == 0:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+                self._mode = None
+        finally:
+            self._thread_lock.release()
+
+    @contextmanager
+    def shared(self):
+        """Hold the lock for reading"""
+        self._acquire(fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            self._release()
+
+    @contextmanager
+    def exclusive(self):
+        """Hold the lock for writing"""
+        self._acquire(fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            self._release()
+
+    def close(self):
+        with self._thread_lock:
+            if self._fd is not None and self._depth == 0:
+                os.close(self._fd)
+                self._fd = None
+
+def fsync_directory(path):
+    """Make a rename inside `path` durable"""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def atomic_write(path, data, mode='w'):
+    """
+    Replace `path` with `data` without ever exposing a partial file:
+    write a temp file in the same directory, fsync it, then os.replace.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    tmp_path = os.path.join(directory, f'.{os.path.basename(path)}.{os.getpid()}.{threading.get_ident()}.tmp')
+    try:
+        with open(tmp_path, mode) as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    fsync_directory(directory)
@@ -0,0 +1,254 @@
+import os
+import re
+import json
+import math
+import heapq
+from bisect import bisect_left, insort
+from storage.locking import atomic_write
+
+# Extra weight of a title token over a body token when ranking
+TITLE_WEIGHT = 3.0
+
+# Common English words that carry no ranking signal; dropping them keeps
+# posting lists short and query time flat
+STOP_WORDS = frozenset('''
+a an and are as at be but by for from has have he in is it its of on or
+she that the their they this to was were will with you your
+'''.split())
+
+# Relative drift of the average document length that triggers re-scoring
+AVERAGE_DRIFT = 0.1
+
+_TOKEN = re.compile(r'\w+')
+
+def tokenize(text):
+    """Case-folded word tokens of `text`, without stop words"""
+    return [token for token in _TOKEN.findall(text.casefold()) if token not in STOP_WORDS]
+
+class SearchIndex:
+    """
+    In-memory inverted index over published post titles and bodies, ranked
+    with BM25.
+
+    Title and body are scored as one document in which every title token
+    counts `title_weight` times (a simple BM25F). Each term maps to
+    {post id: weighted term frequency}; the document lengths are kept
+    alongside for length normalisation. The index is updated incrementally
+    by PostRepository and can be saved to and restored from a JSON file,
+    tagged with the store signature it was built from.
+
+    Queries avoid scoring every matching post: for each queried term a list
+    of postings ordered by their BM25 contribution is built on first use
+    and kept up to date on writes, and the top results are found with the
+    threshold algorithm, stopping once no unseen post can outrank them.
+    Scores use an average document length that is only refreshed when it
+    drifts by more than AVERAGE_DRIFT, so those lists stay valid.
+    """
+    def __init__(self, path=None, title_weight=TITLE_WEIGHT, k1=1.2, b=0.75):
+        self.path = path
+        self.title_weight = title_weight
+        self.k1 = k1
+        self.b = b
+        self._postings = {}
+        self._lengths = {}
+        self._total_length = 0.0
+        self._average = None
+        # {term: [(-impact, -post id), ...]} sorted, built for queried terms
+        self._impacts = {}
+        # Posts added or removed since the index was last saved or restored
+        self._changes = 0
+
+    def __len__(self):
+        return len(self._lengths)
+
+    @property
+    def dirty(self):
+        """True when the index has changed since it was last saved or restored"""
+        return self._changes > 0
+
+    @property
+    def changes(self):
+        """How many posts were added or removed since the last save or restore"""
+        return self._changes
+
+    def _terms(self, post):
+        """Return ({term: weighted frequency}, weighted length) for a post"""
+        frequencies = {}
+        for term in tokenize(post.get('title') or ''):
+            frequencies[term] = frequencies.get(term, 0) + self.title_weight
+        for term in tokenize(post.get('body') or ''):
+            frequencies[term] = frequencies.get(term, 0) + 1
+        return frequencies, sum(frequencies.values())
+
+    def _impact(self, frequency, length):
+        """BM25 contribution of one term occurrence count, before idf"""
+        return frequency * (self.k1 + 1) / (frequency + self._norm + self._scale * length)
+
+    def _update_average(self):
+        """Refresh the scoring average length once it has drifted too far"""
+        if not self._lengths:
+            self._average = None
+            self._impacts = {}
+            return
+        average = self._total_length / len(self._lengths) or 1.0
+        if self._average is None or abs(average - self._average) > AVERAGE_DRIFT * self._average:
+            self._average = average
+            self._norm = self.k1 * (1 - self.b)
+            self._scale = self.k1 * self.b / average
+            self._impacts = {}
+
+    def _impact_list(self, term):
+        impacts = self._impacts.get(term)
+        if impacts is None:
+            lengths = self._lengths
+            impacts = sorted((-self._impact(frequency, lengths[post_id]), -post_id)
+                             for post_id, frequency in self._postings[term].items())
+            self._impacts[term] = impacts
+        return impacts
+
+    def add(self, post):
+        """Index a post (callers remove any previous version first)"""
+        frequencies, length = self._terms(post)
+        post_id = post['id']
+        self._lengths[post_id] = length
+        self._total_length += length
+        self._update_average()
+        for term, frequency in frequencies.items():
+            self._postings.setdefault(term, {})[post_id] = frequency
+            impacts = self._impacts.get(term)
+            if impacts is not None:
+                insort(impacts, (-self._impact(frequency, length), -post_id))
+        self._changes += 1
+
+    def remove(self, post):
+        """Drop a post, given the version of it that was indexed"""
+        post_id = post['id']
+        length = self._lengths.get(post_id)
+        if length is None:
+            return
+        for term in self._terms(post)[0]:
+            postings = self._postings.get(term)
+            if postings is None or post_id not in postings:
+                continue
+            frequency = postings.pop(post_id)
+            impacts = self._impacts.get(term)
+            if impacts is not None:
+                key = (-self._impact(frequency, length), -post_id)
+                position = bisect_left(impacts, key)
+                if position < len(impacts) and impacts[position] == key:
+                    del impacts[position]
+            if not postings:
+                del self._postings[term]
+                self._impacts.pop(term, None)
+        del self._lengths[post_id]
+        self._total_length -= length
+        self._update_average()
+        self._changes += 1
+
+    def rebuild(self, posts):
+        """Index `posts` from scratch"""
+        self._postings = {}
+        self._lengths = {}
+        self._total_length = 0.0
+        self._average = None
+        self._impacts = {}
+        for post in posts:
+            self.add(post)
+
+    def search(self, query, limit=20, offset=0):
+        """
+        Return (post ids, total matches) for one page of results, best
+        first. Posts matching any query term are ranked by BM25.
+        """
+        terms = [term for term in set(tokenize(query)) if term in self._postings]
+        if not terms:
+            return [], 0
+        count = len(self._lengths)
+        wanted = offset + limit
+        lists = []
+        for term in terms:
+            postings = self._postings[term]
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            lists.append((idf, self._impact_list(term), postings))
+        if len(lists) == 1:
+            # A single term's list is already in result order
+            impacts = lists[0][1]
+            return [-negative_id for _, negative_id in impacts[offset:wanted]], len(impacts)
+        total = len(set().union(*(postings for _, _, postings in lists)))
+
+        # Threshold algorithm: walk all lists in step, fully scoring each
+        # newly seen post, until the k-th best score beats the best score
+        # any post not seen yet could still reach
+        lengths = self._lengths
+        k1_plus_one, norm, scale = self.k1 + 1, self._norm, self._scale
+        best = []  # min-heap of (score, post id); ties go to the newer post
+        seen = set()
+        depth = 0
+        while True:
+            threshold = 0.0
+            exhausted = True
+            for idf, impacts, _ in lists:
+                if depth >= len(impacts):
+                    continue
+                exhausted = False
+                negative_impact, negative_id = impacts[depth]
+                threshold -= idf * negative_impact
+                post_id = -negative_id
+                if post_id in seen:
+                    continue
+                seen.add(post_id)
+                score = 0.0
+                length = lengths[post_id]
+                for term_idf, _, postings in lists:
+                    frequency = postings.get(post_id)
+                    if frequency is not None:
+                        # Inlined _impact()
+                        score += term_idf * (frequency * k1_plus_one / (frequency + norm + scale * length))
+                if len(best) < wanted:
+                    heapq.heappush(best, (score, post_id))
+                elif (score, post_id) > best[0]:
+                    heapq.heapreplace(best, (score, post_id))
+            depth += 1
+            if exhausted or (len(best) == wanted and best[0][0] > threshold):
+                break
+        ranked = sorted(best, reverse=True)
+        return [post_id for _, post_id in ranked[offset:]], total
+
+    def save(self, signature):
+        """Persist the index, tagged with the store signature it reflects"""
+        if not self.path:
+            return
+        postings = {term: [list(ids), list(ids.values())] for term, ids in self._postings.items()}
+        atomic_write(self.path, json.dumps({
+            'signature': signature,
+            'title_weight': self.title_weight,
+            'lengths': [list(self._lengths), list(self._lengths.values())],
+            'postings': postings
+        }, separators=(',', ':')))
+        self._changes = 0
+
+    def restore(self, signature):
+        """
+        Load the persisted index if it was saved for `signature`.
+        Returns False (leaving the index untouched) when it is missing or stale.
+        """
+        if not self.path or not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+            if (data['signature'] != json.loads(json.dumps(signature))
+                    or data['title_weight'] != self.title_weight):
+                return False
+            lengths = dict(zip(*data['lengths']))
+            postings = {term: dict(zip(ids, frequencies))
+                        for term, (ids, frequencies) in data['postings'].items()}
+        except (ValueError, KeyError, TypeError):
+            return False
+        self._lengths = lengths
+        self._postings = postings
+        self._total_length = float(sum(lengths.values()))
+        self._average = None
+        self._update_average()
+        self._changes = 0
+        return True
@@ -0,0 +1,272 @@
+import os
+import json
+import mmap
+import logging
+import threading
+from storage.backends import BODY_REF, StorageBackend, stat_signature
+from storage.derived import ensure_derived
+from storage.instrumentation import count_read, count_written
+from storage.locking import FileLock, atomic_write, fsync_directory
+
+logger = logging.getLogger(__name__)
+
+# Fields kept in the body file instead of the metadata file
+BODY_FIELDS = ('body', 'body_html')
+
+class BodyFile:
+    """
+    One append-only file of post bodies, read through mmap.
+
+    The file stays open until closed, so bodies can still be read after a
+    compaction has replaced and removed it. The mapping is widened in
+    place when a body beyond its end is read.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'a+b')
+        self._lock = threading.Lock()
+        self._map = None
+        self._size = 0
+
+    def read(self, offset, length):
+        """Return `length` bytes from `offset`"""
+        end = offset + length
+        with self._lock:
+            if end > self._size:
+                self._remap(end)
+            return self._map[offset:end] if length else b''
+
+    def _remap(self, end):
+        size = os.fstat(self._file.fileno()).st_size
+        if size < end:
+            raise OSError(f'{self.path} is shorter than its metadata says')
+        new_map = mmap.mmap(self._file.fileno(), size, access=mmap.ACCESS_READ)
+        if self._map is not None:
+            self._map.close()
+        self._map, self._size = new_map, size
+
+    def append(self, chunks, offset):
+        """Write `chunks` at `offset`, dropping anything after it, and fsync"""
+        with self._lock:
+            # A tail past `offset` was left by a writer that crashed before
+            # saving its metadata; nothing refers to it
+            self._file.truncate(offset)
+            self._file.writelines(chunks)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        """Unmap and close the file; its bodies can no longer be read"""
+        with self._lock:
+            if self._map is not None:
+                self._map.close()
+                self._map, self._size = None, 0
+            self._file.close()
+
+class BodyRef:
+    """
+    Where a post's text is stored: `length` bytes of body at `offset` in a
+    BodyFile, directly followed by `html_length` bytes of body_html.
+    """
+    __slots__ = ('file', 'offset', 'length', 'html_length')
+
+    def __init__(self, file, offset, length, html_length):
+        self.file = file
+        self.offset = offset
+        self.length = length
+        self.html_length = html_length
+
+    @property
+    def size(self):
+        return self.length + self.html_length
+
+    def read(self):
+        """Return {'body': ..., 'body_html': ...}"""
+        data = self.file.read(self.offset, self.size)
+        count_read(len(data))
+        return {'body': data[:self.length].decode('utf-8'),
+                'body_html': data[self.length:].decode('utf-8')}
+
+    def _key(self):
+        return (self.file.path, self.offset, self.length, self.html_length)
+
+    def __eq__(self, other):
+        return isinstance(other, BodyRef) and self._key() == other._key()
+
+    def __hash__(self):
+        return hash(self._key())
+
+class SplitFileBackend(StorageBackend):
+    """
+    Post metadata and post bodies in separate files, so loading the store
+    and serving listings never parses body text.
+
+    `<base>.meta.json` holds every post without body and body_html, plus
+    where both are stored in the body file `<base>.<generation>.bodies`.
+    Loaded posts carry a BodyRef under BODY_REF instead of the text, and
+    PostRepository reads the body through it (an mmap slice) only for the
+    reads that need the full post. On commit the bodies of new and edited
+    posts are appended to the body file, then the metadata is rewritten.
+    Once replaced and deleted bodies take more than `compact_bytes` of the
+    body file, and more than the live ones, the live bodies are copied to
+    the next generation's file. The replaced file is closed once the
+    repository no longer holds posts that refer to it. The metadata also
+    counts commits, which is the store version. An existing posts.json is
+    imported on first start, under the exclusive lock.
+    """
+    def __init__(self, base_path, import_path=None, compact_bytes=4 * 1024 * 1024):
+        self.base_path = base_path
+        self.meta_path = base_path + '.meta.json'
+        self.sequence_path = base_path + '.seq'
+        self.search_path = base_path + '.search.json'
+        self.lock = FileLock(base_path)
+        self.import_path = import_path
+        self.compact_bytes = compact_bytes
+
+        self._lock = threading.RLock()
+        self._generation = 0
+        self._file = None       # BodyFile of the current generation
+        self._size = 0          # bytes of the body file covered by the metadata
+        self._version = 0       # commits counted in the metadata
+        self._retired = []      # BodyFiles of earlier generations, still open
+        self._import()
+
+    def signature(self):
+        return stat_signature(self.meta_path)
+
+    def version(self):
+        return self._version
+
+    def modified_at(self):
+        signature = stat_signature(self.meta_path)
+        return signature[2] / 1e9 if signature else None
+
+    def _use_generation(self, generation):
+        path = f'{self.base_path}.{generation}.bodies'
+        if self._file is None or self._file.path != path:
+            if self._file is not None:
+                # Posts loaded before may still read it; closed by the next
+                # load or commit, once the repository has replaced them
+                self._retired.append(self._file)
+            self._file = BodyFile(path)
+        self._generation = generation
+
+    def _close_retired(self):
+        for body_file in self._retired:
+            body_file.close()
+        self._retired = []
+
+    def load(self):
+        with self._lock:
+            self._close_retired()
+            try:
+                with open(self.meta_path, 'rb') as f:
+                    data = f.read()
+            except FileNotFoundError:
+                self._use_generation(0)
+                self._size = 0
+                self._version = 0
+                return []
+            meta = json.loads(data)
+            count_read(len(data), len(meta['posts']))
+            self._use_generation(meta['generation'])
+            self._size = meta['size']
+            self._version = meta.get('version', 0)
+            posts = meta['posts']
+            for post in posts:
+                post[BODY_REF] = BodyRef(self._file, *post[BODY_REF])
+            return posts
+
+    def _import(self):
+        """First start on an existing posts.json: split it into the two files"""
+        if not (self.import_path and os.path.exists(self.import_path)):
+            return
+        # Readers only take the shared lock, so the import must not run in load()
+        with self.lock.exclusive(), self._lock:
+            if os.path.exists(self.meta_path):
+                return
+            with open(self.import_path, 'r') as f:
+                posts = [post if post.get('body_html') is not None else ensure_derived(post)
+                         for post in json.load(f)]
+            self._use_generation(0)
+            self._size = 0
+            self.commit(posts, None)
+            logger.info('Imported %d posts from %s', len(posts), self.import_path)
+
+    def _append(self, posts, offset):
+        """
+        Write the bodies of the posts that hold them in memory to the body
+        file from `offset` on, and swap those entries of `posts` for copies
+        that refer to the file instead. Returns the new end offset.
+        """
+        chunks = []
+        end = offset
+        for position, post in enumerate(posts):
+            if BODY_REF in post:
+                continue
+            body = post['body'].encode('utf-8')
+            html = post['body_html'].encode('utf-8')
+            stored = {key: value for key, value in post.items() if key not in BODY_FIELDS}
+            stored[BODY_REF] = BodyRef(self._file, end, len(body), len(html))
+            posts[position] = stored
+            chunks += (body, html)
+            end += len(body) + len(html)
+        if chunks:
+            self._file.append(chunks, offset)
+            count_written(end - offset)
+        return end
+
+    def commit(self, posts, records):
+        # The change records are not needed: posts loaded from disk hold a
+        # BodyRef and posts written since hold their text, so the list
+        # alone says which bodies to append
+        with self._lock:
+            self._size = self._append(posts, self._size)
+            live = sum(post[BODY_REF].size for post in posts)
+            obsolete = None
+            if self._size - live > max(self.compact_bytes, live):
+                obsolete = self._compact(posts)
+            meta = {
+                'version': self._version + 1,
+                'generation': self._generation,
+                'size': self._size,
+                'posts': [dict(post, **{BODY_REF: self._ref_json(post[BODY_REF])}) for post in posts]
+            }
+            data = json.dumps(meta, separators=(',', ':'))
+            atomic_write(self.meta_path, data)
+            count_written(len(data))
+            self._version = meta['version']
+            if obsolete is not None:
+                os.remove(obsolete)
+            # `posts` no longer refers to earlier files
+            self._close_retired()
+
+    def close(self):
+        with self._lock:
+            self._close_retired()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+        super().close()
+
+    @staticmethod
+    def _ref_json(ref):
+        return [ref.offset, ref.length, ref.html_length]
+
+    def _compact(self, posts):
+        """
+        Copy the live bodies into the next generation's file. Returns the
+        path of the old file, to remove once the metadata is saved.
+        """
+        old_path = self._file.path
+        full = []
+        for post in posts:
+            post = {**post, **post[BODY_REF].read()}
+            del post[BODY_REF]
+            full.append(post)
+        self._use_generation(self._generation + 1)
+        self._size = self._append(full, 0)
+        fsync_directory(os.path.dirname(os.path.abspath(old_path)))
+        posts[:] = full
+        logger.info('Compacted post bodies into %s', self._file.path)
+        return old_path
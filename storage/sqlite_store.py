@@ -0,0 +1,577 @@
+import os
+import json
+import sqlite3
+import threading
+from storage.derived import DERIVED_FIELDS, derive_fields, ensure_derived
+from storage.instrumentation import count_posts, storage_read, storage_write
+from storage.search import TITLE_WEIGHT, tokenize
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS posts (
+    id INTEGER PRIMARY KEY,
+    title TEXT NOT NULL,
+    body TEXT NOT NULL,
+    author TEXT NOT NULL,
+    is_published INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    -- Computed from body on write (storage/derived.py)
+    body_html TEXT,
+    excerpt TEXT,
+    word_count INTEGER,
+    reading_time INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_posts_published_created ON posts (is_published, created_at);
+-- Posts of one author by status and date; replaces the earlier (author) index
+CREATE INDEX IF NOT EXISTS idx_posts_author_created ON posts (author, is_published, created_at);
+DROP INDEX IF EXISTS idx_posts_author;
+
+-- Full-text index over title and body, kept in sync with posts by triggers
+CREATE VIRTUAL TABLE IF NOT EXISTS posts_fts USING fts5 (title, body, content='posts', content_rowid='id');
+CREATE TRIGGER IF NOT EXISTS posts_fts_insert AFTER INSERT ON posts BEGIN
+    INSERT INTO posts_fts (rowid, title, body) VALUES (new.id, new.title, new.body);
+END;
+CREATE TRIGGER IF NOT EXISTS posts_fts_delete AFTER DELETE ON posts BEGIN
+    INSERT INTO posts_fts (posts_fts, rowid, title, body) VALUES ('delete', old.id, old.title, old.body);
+END;
+CREATE TRIGGER IF NOT EXISTS posts_fts_update AFTER UPDATE OF title, body ON posts BEGIN
+    INSERT INTO posts_fts (posts_fts, rowid, title, body) VALUES ('delete', old.id, old.title, old.body);
+    INSERT INTO posts_fts (rowid, title, body) VALUES (new.id, new.title, new.body);
+END;
+
+CREATE TABLE IF NOT EXISTS tags (
+    name TEXT PRIMARY KEY
+);
+
+CREATE TABLE IF NOT EXISTS post_tags (
+    post_id INTEGER NOT NULL REFERENCES posts (id) ON DELETE CASCADE,
+    tag TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (post_id, tag)
+);
+CREATE INDEX IF NOT EXISTS idx_post_tags_tag ON post_tags (tag, post_id);
+
+CREATE TABLE IF NOT EXISTS users (
+    email TEXT PRIMARY KEY,
+    username TEXT NOT NULL UNIQUE,
+    password TEXT NOT NULL,
+    -- Session version: a fresh 'user_version' sequence value whenever the
+    -- account is created or its password changed, so never reused
+    version INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS sequences (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+
+-- Data version of the posts and time of the last write, bumped on every write
+CREATE TRIGGER IF NOT EXISTS posts_version_insert AFTER INSERT ON posts BEGIN
+    INSERT INTO sequences (name, value) VALUES ('version', 1)
+        ON CONFLICT (name) DO UPDATE SET value = value + 1;
+    INSERT INTO sequences (name, value) VALUES ('modified_at', CAST(strftime('%s', 'now') AS INTEGER))
+        ON CONFLICT (name) DO UPDATE SET value = excluded.value;
+END;
+CREATE TRIGGER IF NOT EXISTS posts_version_update AFTER UPDATE ON posts BEGIN
+    INSERT INTO sequences (name, value) VALUES ('version', 1)
+        ON CONFLICT (name) DO UPDATE SET value = value + 1;
+    INSERT INTO sequences (name, value) VALUES ('modified_at', CAST(strftime('%s', 'now') AS INTEGER))
+        ON CONFLICT (name) DO UPDATE SET value = excluded.value;
+END;
+CREATE TRIGGER IF NOT EXISTS posts_version_delete AFTER DELETE ON posts BEGIN
+    INSERT INTO sequences (name, value) VALUES ('version', 1)
+        ON CONFLICT (name) DO UPDATE SET value = value + 1;
+    INSERT INTO sequences (name, value) VALUES ('modified_at', CAST(strftime('%s', 'now') AS INTEGER))
+        ON CONFLICT (name) DO UPDATE SET value = excluded.value;
+END;
+'''
+
+# Post columns plus the tags aggregated in their original order
+POST_COLUMNS = ('id', 'title', 'body', 'author', 'is_published', 'created_at', 'updated_at') + DERIVED_FIELDS
+# Listings show the excerpt, so their rows leave out the full body
+SUMMARY_COLUMNS = tuple(column for column in POST_COLUMNS if column not in ('body', 'body_html'))
+
+def _post_select(columns):
+    return f'''
+SELECT {', '.join('posts.' + column for column in columns)},
+       (SELECT json_group_array(tag)
+          FROM (SELECT tag FROM post_tags WHERE post_id = posts.id ORDER BY position)) AS tags
+  FROM posts
+'''
+
+POST_SELECT = _post_select(POST_COLUMNS)
+SUMMARY_SELECT = _post_select(SUMMARY_COLUMNS)
+
+def _row_to_post(row):
+    count_posts(1)
+    post = dict(row)
+    post['is_published'] = bool(post['is_published'])
+    post['tags'] = json.loads(post['tags']) if post['tags'] else []
+    return post
+
+class SqliteDatabase:
+    """
+    SQLite database holding posts, tags and users.
+
+    Each thread gets its own connection (SQLite connections must not be
+    shared across threads), opened lazily and reused for the life of the
+    thread. Connections of threads that have exited are closed whenever a
+    new one is opened, so short-lived threads do not pile them up. The
+    database runs in WAL mode so readers never block the writer.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        # [(owning thread, connection)] of every open connection
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        conn = self.connection()
+        has_fts = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'posts_fts'").fetchone()
+        conn.executescript(SCHEMA)
+        if not has_fts:
+            # Databases created before full-text search: index existing posts
+            conn.execute("INSERT INTO posts_fts (posts_fts) VALUES ('rebuild')")
+        self._add_derived_columns(conn)
+        self._add_user_version_column(conn)
+
+    def _add_derived_columns(self, conn):
+        """Add and fill the derived body columns in databases created without them"""
+        columns = {row['name'] for row in conn.execute('PRAGMA table_info(posts)')}
+        for column, kind in zip(DERIVED_FIELDS, ('TEXT', 'TEXT', 'INTEGER', 'INTEGER')):
+            if column not in columns:
+                conn.execute(f'ALTER TABLE posts ADD COLUMN {column} {kind}')
+        rows = conn.execute('SELECT id, body FROM posts WHERE body_html IS NULL').fetchall()
+        if rows:
+            with self.transaction():
+                conn.executemany(
+                    'UPDATE posts SET body_html = :body_html, excerpt = :excerpt, word_count = :word_count, '
+                    'reading_time = :reading_time WHERE id = :id',
+                    [dict(derive_fields(row['body']), id=row['id']) for row in rows])
+
+    @staticmethod
+    def _add_user_version_column(conn):
+        """Add the session version column to databases created without it"""
+        columns = {row['name'] for row in conn.execute('PRAGMA table_info(users)')}
+        if 'version' not in columns:
+            conn.execute('ALTER TABLE users ADD COLUMN version INTEGER NOT NULL DEFAULT 0')
+
+    def connection(self):
+        """Return this thread's connection, opening it on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # Only used by its own thread, but closed by others once it exits
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            # Every commit fsyncs the WAL, so a committed write is durable;
+            # read-only connections never pay for it
+            conn.execute('PRAGMA synchronous=FULL')
+            conn.execute('PRAGMA foreign_keys=ON')
+            self._local.conn = conn
+            with self._connections_lock:
+                self._close_orphans()
+                self._connections.append((threading.current_thread(), conn))
+        return conn
+
+    def _close_orphans(self):
+        # Under _connections_lock
+        alive = []
+        for thread, conn in self._connections:
+            if thread.is_alive():
+                alive.append((thread, conn))
+            else:
+                conn.close()
+        self._connections = alive
+
+    def transaction(self):
+        """Context manager for a write transaction on this thread's connection"""
+        return _Transaction(self.connection())
+
+    def close(self):
+        with self._connections_lock:
+            for _, conn in self._connections:
+                conn.close()
+            self._connections = []
+        self._local = threading.local()
+
+    @storage_read
+    def load_tags(self):
+        rows = self.connection().execute('SELECT name FROM tags ORDER BY rowid').fetchall()
+        return [row['name'] for row in rows]
+
+    @storage_write
+    def save_tags(self, tags):
+        with self.transaction() as conn:
+            conn.execute('DELETE FROM tags')
+            conn.executemany('INSERT OR IGNORE INTO tags (name) VALUES (?)', [(tag,) for tag in tags])
+
+    @storage_read
+    def load_users(self):
+        rows = self.connection().execute('SELECT username, email, password FROM users').fetchall()
+        return {row['email']: dict(row) for row in rows}
+
+    @storage_read
+    def get_user(self, email):
+        row = self.connection().execute(
+            'SELECT username, email, password FROM users WHERE email = ?', (email,)).fetchone()
+        return dict(row) if row else None
+
+    @storage_read
+    def get_user_by_username(self, username):
+        row = self.connection().execute(
+            'SELECT username, email, password FROM users WHERE username = ?', (username,)).fetchone()
+        return dict(row) if row else None
+
+    @storage_write
+    def update_password(self, email, password, rehash=False, expected=None):
+        """
+        Store a new password. A rehash (the same password under new hash
+        settings) keeps the account's version, so its sessions stay valid.
+        With `expected`, only a password still equal to it is replaced.
+        """
+        with self.transaction() as conn:
+            condition, params = 'email = ?', [email]
+            if expected is not None:
+                condition += ' AND password = ?'
+                params.append(expected)
+            if rehash:
+                cursor = conn.execute(f'UPDATE users SET password = ? WHERE {condition}', [password] + params)
+            else:
+                cursor = conn.execute(f'UPDATE users SET password = ?, version = ? WHERE {condition}',
+                                      [password, _next_user_version(conn)] + params)
+            return cursor.rowcount > 0
+
+    @storage_read
+    def get_user_version(self, email):
+        """Session version of the account, or None if there is none"""
+        row = self.connection().execute('SELECT version FROM users WHERE email = ?', (email,)).fetchone()
+        return row[0] if row else None
+
+    @storage_write
+    def save_user(self, username, email, password):
+        with self.transaction() as conn:
+            conn.execute('INSERT INTO users (username, email, password, version) VALUES (?, ?, ?, ?)',
+                         (username, email, password, _next_user_version(conn)))
+
+def _next_user_version(conn):
+    """Take the next account version; must run inside a write transaction"""
+    conn.execute("INSERT INTO sequences (name, value) VALUES ('user_version', 1) "
+                 "ON CONFLICT (name) DO UPDATE SET value = value + 1")
+    return conn.execute("SELECT value FROM sequences WHERE name = 'user_version'").fetchone()[0]
+
+class _Transaction:
+    """
+    BEGIN IMMEDIATE ... COMMIT/ROLLBACK around a block. Nested blocks join
+    the outer transaction.
+    """
+    def __init__(self, conn):
+        self.conn = conn
+        self.nested = False
+
+    def __enter__(self):
+        self.nested = self.conn.in_transaction
+        if not self.nested:
+            self.conn.execute('BEGIN IMMEDIATE')
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        if not self.nested:
+            self.conn.execute('COMMIT' if exc_type is None else 'ROLLBACK')
+        return False
+
+class SqlitePostRepository:
+    """
+    PostRepository implementation on top of SqliteDatabase.
+
+    Exposes the same operations as the file-based PostRepository, but
+    answers them with indexed queries instead of an in-memory copy.
+    """
+    def __init__(self, database):
+        self.database = database
+
+    def _insert(self, conn, post):
+        post = ensure_derived(dict(post))
+        conn.execute(
+            'INSERT INTO posts (id, title, body, author, is_published, created_at, updated_at, '
+            'body_html, excerpt, word_count, reading_time) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (post['id'], post['title'], post['body'], post['author'],
+             int(bool(post['is_published'])), post['created_at'], post['updated_at'],
+             post['body_html'], post['excerpt'], post['word_count'], post['reading_time']))
+        self._set_tags(conn, post['id'], post.get('tags') or [])
+        return post
+
+    @staticmethod
+    def _set_tags(conn, post_id, tags):
+        conn.execute('DELETE FROM post_tags WHERE post_id = ?', (post_id,))
+        conn.executemany(
+            'INSERT OR IGNORE INTO post_tags (post_id, tag, position) VALUES (?, ?, ?)',
+            [(post_id, tag, position) for position, tag in enumerate(tags)])
+
+    @staticmethod
+    def _bump_sequence(conn, post_id):
+        conn.execute(
+            "INSERT INTO sequences (name, value) VALUES ('posts', ?) "
+            "ON CONFLICT (name) DO UPDATE SET value = MAX(value, excluded.value)",
+            (post_id + 1,))
+
+    @storage_read
+    def all(self):
+        rows = self.database.connection().execute(POST_SELECT + ' ORDER BY id').fetchall()
+        return [_row_to_post(row) for row in rows]
+
+    @storage_read
+    def get(self, post_id):
+        row = self.database.connection().execute(
+            POST_SELECT + ' WHERE id = ?', (int(post_id),)).fetchone()
+        return _row_to_post(row) if row else None
+
+    @storage_read
+    def list_by_status(self, published=True):
+        """Indexed range scan over (is_published, created_at), newest first"""
+        rows = self.database.connection().execute(
+            POST_SELECT + ' WHERE is_published = ? ORDER BY created_at DESC, id DESC',
+            (int(bool(published)),)).fetchall()
+        return [_row_to_post(row) for row in rows]
+
+    @storage_read
+    def page(self, published=True, limit=20, cursor=None, summary=False, author=None):
+        """
+        Keyset page over (is_published, created_at, id), newest first; with
+        `author`, over (author, is_published, created_at, id)
+        """
+        sql = (SUMMARY_SELECT if summary else POST_SELECT) + ' WHERE is_published = ?'
+        params = [int(bool(published))]
+        if author is not None:
+            sql += ' AND author = ?'
+            params.append(author)
+        if cursor is not None:
+            sql += ' AND (created_at, id) < (?, ?)'
+            params.extend(cursor)
+        sql += ' ORDER BY created_at DESC, id DESC LIMIT ?'
+        params.append(limit + 1)
+        posts = [_row_to_post(row) for row in self.database.connection().execute(sql, params)]
+        if len(posts) > limit:
+            last = posts[limit - 1]
+            return posts[:limit], (last['created_at'], last['id'])
+        return posts, None
+
+    @storage_read
+    def page_by_tag(self, tag, limit=20, cursor=None, summary=False):
+        """Published posts with `tag` via the (tag, post_id) index, newest id first"""
+        sql = ((SUMMARY_SELECT if summary else POST_SELECT) + ' JOIN post_tags AS pt ON pt.post_id = posts.id'
+               ' WHERE pt.tag = ? AND posts.is_published = 1')
+        params = [tag]
+        if cursor is not None:
+            sql += ' AND pt.post_id < ?'
+            params.append(cursor)
+        sql += ' ORDER BY pt.post_id DESC LIMIT ?'
+        params.append(limit + 1)
+        posts = [_row_to_post(row) for row in self.database.connection().execute(sql, params)]
+        if len(posts) > limit:
+            return posts[:limit], posts[limit - 1]['id']
+        return posts, None
+
+    @storage_read
+    def tag_counts(self):
+        rows = self.database.connection().execute(
+            'SELECT pt.tag, COUNT(*) AS count FROM post_tags AS pt '
+            'JOIN posts ON posts.id = pt.post_id WHERE posts.is_published = 1 GROUP BY pt.tag').fetchall()
+        return {row['tag']: row['count'] for row in rows}
+
+    @storage_read
+    def search(self, query, limit=20, offset=0, summary=False):
+        """FTS5 match ranked by bm25 with title weighting, best first"""
+        terms = sorted(set(tokenize(query)))
+        if not terms:
+            return [], 0
+        # Quote every term so user input is never parsed as FTS5 syntax
+        match = ' OR '.join(f'"{term}"' for term in terms)
+        conn = self.database.connection()
+        sql = (' JOIN posts_fts ON posts_fts.rowid = posts.id'
+               ' WHERE posts_fts MATCH ? AND posts.is_published = 1')
+        total = conn.execute('SELECT COUNT(*) FROM posts' + sql, (match,)).fetchone()[0]
+        select = SUMMARY_SELECT if summary else POST_SELECT
+        rows = conn.execute(
+            select + sql + ' ORDER BY bm25(posts_fts, ?, 1.0), posts.id DESC LIMIT ? OFFSET ?',
+            (match, TITLE_WEIGHT, limit, offset)).fetchall()
+        return [_row_to_post(row) for row in rows], total
+
+    def _sequence_value(self, name):
+        row = self.database.connection().execute(
+            'SELECT value FROM sequences WHERE name = ?', (name,)).fetchone()
+        return row['value'] if row else None
+
+    @storage_read
+    def version(self):
+        """Data version maintained by the posts triggers"""
+        return self._sequence_value('version') or 0
+
+    @storage_read
+    def modified_at(self):
+        return self._sequence_value('modified_at')
+
+    @storage_read
+    def updated_at(self, post_id):
+        row = self.database.connection().execute(
+            'SELECT updated_at FROM posts WHERE id = ?', (int(post_id),)).fetchone()
+        return row['updated_at'] if row else None
+
+    @storage_read
+    def next_id(self):
+        row = self.database.connection().execute(
+            "SELECT MAX(IFNULL((SELECT value FROM sequences WHERE name = 'posts'), 1), "
+            "(SELECT IFNULL(MAX(id), 0) + 1 FROM posts)) AS next_id").fetchone()
+        return row['next_id'] or 1
+
+    def allocate_id(self):
+        return self.allocate_ids(1)
+
+    @storage_write
+    def allocate_ids(self, count):
+        with self.database.transaction() as conn:
+            post_id = self.next_id()
+            self._bump_sequence(conn, post_id + count - 1)
+            return post_id
+
+    @storage_read
+    def scan(self, after_id=0, limit=1000):
+        rows = self.database.connection().execute(
+            POST_SELECT + ' WHERE posts.id > ? ORDER BY posts.id LIMIT ?', (after_id, limit)).fetchall()
+        return [_row_to_post(row) for row in rows]
+
+    @storage_write
+    def replace_all(self, posts):
+        with self.database.transaction() as conn:
+            conn.execute('DELETE FROM post_tags')
+            conn.execute('DELETE FROM posts')
+            for post in posts:
+                self._insert(conn, post)
+                self._bump_sequence(conn, post['id'])
+
+    def insert(self, post):
+        return self.insert_many([post])[0]
+
+    @storage_write
+    def insert_many(self, posts):
+        """
+        Insert in one transaction and return the stored dicts; a duplicate
+        id rolls back the whole batch. Posts without an id get one
+        allocated in the transaction.
+        """
+        with self.database.transaction() as conn:
+            unnumbered = [index for index, post in enumerate(posts) if post.get('id') is None]
+            if unnumbered:
+                posts = list(posts)
+                first_id = self.allocate_ids(len(unnumbered))
+                for offset, index in enumerate(unnumbered):
+                    posts[index] = dict(posts[index], id=first_id + offset)
+            created = []
+            for post in posts:
+                try:
+                    created.append(self._insert(conn, post))
+                except sqlite3.IntegrityError:
+                    raise ValueError(f"Post {post['id']} already exists")
+            if posts:
+                self._bump_sequence(conn, max(post['id'] for post in posts))
+            return created
+
+    @storage_write
+    def write_batch(self, creates=(), changes=()):
+        """Inserts and read-modify-writes in one transaction, as PostRepository.write_batch"""
+        with self.database.transaction():
+            created = self.insert_many(list(creates))
+            return created, [self.modify(post_id, change) for post_id, change in changes]
+
+    def sync(self):
+        """
+        Nothing to do: with synchronous=FULL every commit is already
+        durable, and SQLite checkpoints the WAL on its own
+        """
+
+    def reload(self):
+        """Nothing is cached: a failed transaction is rolled back as a whole"""
+
+    @storage_write
+    def update(self, post):
+        return self._update(ensure_derived(dict(post)))
+
+    def _update(self, post):
+        with self.database.transaction() as conn:
+            cursor = conn.execute(
+                'UPDATE posts SET title = ?, body = ?, author = ?, is_published = ?, '
+                'created_at = ?, updated_at = ?, body_html = ?, excerpt = ?, word_count = ?, '
+                'reading_time = ? WHERE id = ?',
+                (post['title'], post['body'], post['author'], int(bool(post['is_published'])),
+                 post['created_at'], post['updated_at'], post['body_html'], post['excerpt'],
+                 post['word_count'], post['reading_time'], post['id']))
+            if cursor.rowcount == 0:
+                return False
+            self._set_tags(conn, post['id'], post.get('tags') or [])
+            return True
+
+    @storage_write
+    def modify(self, post_id, change):
+        with self.database.transaction():
+            old = self.get(post_id)
+            if old is None:
+                return None
+            post = ensure_derived(change(dict(old)), old)
+            self._update(post)
+            return post
+
+    @storage_write
+    def delete(self, post_id):
+        with self.database.transaction() as conn:
+            cursor = conn.execute('DELETE FROM posts WHERE id = ?', (int(post_id),))
+            return cursor.rowcount > 0
+
+    def close(self):
+        global _database
+        if _database is self.database:
+            _database = None
+        self.database.close()
+
+_database = None
+
+def get_database():
+    """Return the SQLite database when the sqlite backend is active, else None"""
+    return _database
+
+def init_database(path):
+    """Open the SQLite database at `path` and make it the active store"""
+    global _database
+    _database = SqliteDatabase(path)
+    return _database
+
+def import_flat_files(database, posts_file=None, tags_file=None, users_file=None):
+    """
+    Copy posts.json, tags.json and users.txt into the database.
+    Existing rows with the same key are overwritten. Returns row counts.
+    """
+    counts = {'posts': 0, 'tags': 0, 'users': 0}
+    repository = SqlitePostRepository(database)
+    with database.transaction() as conn:
+        if posts_file and os.path.exists(posts_file):
+            with open(posts_file, 'r') as f:
+                posts = json.load(f)
+            for post in posts:
+                conn.execute('DELETE FROM posts WHERE id = ?', (post['id'],))
+                repository._insert(conn, post)
+                repository._bump_sequence(conn, post['id'])
+            counts['posts'] = len(posts)
+        if tags_file and os.path.exists(tags_file):
+            with open(tags_file, 'r') as f:
+                tags = json.load(f)
+            conn.executemany('INSERT OR IGNORE INTO tags (name) VALUES (?)', [(tag,) for tag in tags])
+            counts['tags'] = len(tags)
+        if users_file and os.path.exists(users_file):
+            with open(users_file, 'r') as f:
+                for line in f:
+                    parts = line.strip().split(',')
+                    if len(parts) >= 3:
+                        conn.execute(
+                            'INSERT OR REPLACE INTO users (username, email, password, version) '
+                            'VALUES (?, ?, ?, ?)',
+                            (parts[0], parts[1], parts[2], _next_user_version(conn)))
+                        counts['users'] += 1
+    return counts
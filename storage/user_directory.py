@@ -0,0 +1,185 @@
+import os
+import threading
+from storage.backends import stat_signature
+from storage.instrumentation import count_read, count_written, storage_read, storage_write
+from storage.locking import FileLock, atomic_write
+from storage.post_repository import IdSequence
+
+class UserDirectory:
+    """
+    In-memory index of users.txt with hash lookups by email and username.
+
+    New accounts are appended to users.txt (one
+    `username,email,password,version` line per account), so when the file
+    has only grown since the last look just the new lines are parsed; a
+    replaced or truncated file is re-read in full. A password change
+    rewrites the file atomically, so the old password (or plaintext) does
+    not stay behind in an earlier line. Lookups cost one stat() plus a
+    dict access however many accounts exist.
+
+    The version ends the account's sessions when it changes. It comes from
+    a persisted counter (`users.txt.seq`), taken when the account is
+    created or its password changed, so a deleted and re-created account
+    never gets an old value back. Rehashing the same password keeps it.
+    Lines written before versions existed count as version 0.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = FileLock(path)
+        self._sequence = IdSequence(path + '.seq')
+        self._lock = threading.RLock()
+        self._by_email = {}
+        self._by_username = {}
+        self._versions = {}
+        self._signature = None
+        self._offset = 0
+
+    def _refresh(self):
+        signature = stat_signature(self.path)
+        if signature == self._signature:
+            return
+        if signature is None:
+            self._reset()
+            self._signature = None
+            return
+        if self._signature is None or signature[0] != self._signature[0] or signature[1] < self._offset:
+            self._reset()
+        with self.lock.shared(), open(self.path, 'rb') as f:
+            f.seek(self._offset)
+            data = f.read()
+            signature = stat_signature(self.path)
+        count_read(len(data))
+        # Only complete lines; a partial tail is picked up once finished
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].decode('utf-8').splitlines():
+            self._index_line(line)
+        self._offset += end
+        self._signature = signature
+
+    def _reset(self):
+        self._by_email = {}
+        self._by_username = {}
+        self._versions = {}
+        self._offset = 0
+
+    def _index_line(self, line):
+        line = line.strip()
+        if line and ',' in line:
+            parts = line.split(',')
+            if len(parts) >= 3:
+                version = int(parts[3]) if len(parts) > 3 and parts[3].isdigit() else 0
+                self._index({'username': parts[0], 'email': parts[1], 'password': parts[2]}, version)
+
+    def _index(self, user, version):
+        previous = self._by_email.get(user['email'])
+        if previous is not None and self._by_username.get(previous['username']) is previous:
+            del self._by_username[previous['username']]
+        self._by_email[user['email']] = user
+        self._by_username[user['username']] = user
+        self._versions[user['email']] = version
+
+    @storage_read
+    def get(self, email):
+        """Return the user dict for `email`, or None"""
+        with self._lock:
+            self._refresh()
+            user = self._by_email.get(email)
+            return None if user is None else dict(user)
+
+    @storage_read
+    def get_by_username(self, username):
+        """Return the user dict for `username`, or None"""
+        with self._lock:
+            self._refresh()
+            user = self._by_username.get(username)
+            return None if user is None else dict(user)
+
+    @storage_read
+    def version(self, email):
+        """Return the version of the account for `email`, or None if there is none"""
+        with self._lock:
+            self._refresh()
+            return self._versions.get(email)
+
+    @storage_read
+    def all(self):
+        """Return {email: user dict} for every account"""
+        with self._lock:
+            self._refresh()
+            return {email: dict(user) for email, user in self._by_email.items()}
+
+    def set_password(self, email, password, rehash=False):
+        """
+        Record a new password for an existing account. Returns False if
+        missing. A rehash (the same password under new hash settings)
+        keeps the account's version, so its sessions stay valid.
+        """
+        return self.set_passwords({email: password}, rehash) == 1
+
+    @storage_write
+    def set_passwords(self, passwords, rehash=False, expected=None):
+        """
+        Replace the passwords of several accounts ({email: password}) with
+        one rewrite of users.txt. Unknown emails are skipped, as are those
+        whose stored password is no longer `expected[email]` when
+        `expected` is given. Returns how many accounts were changed.
+        """
+        with self._lock, self.lock.exclusive():
+            self._refresh()
+            changed = 0
+            for email, password in passwords.items():
+                user = self._by_email.get(email)
+                if user is None or (expected is not None and user['password'] != expected.get(email)):
+                    continue
+                version = self._versions[email] if rehash else self._next_version()
+                self._index(dict(user, password=password), version)
+                changed += 1
+            if changed:
+                self._rewrite()
+            return changed
+
+    @storage_write
+    def add(self, username, email, password):
+        """
+        Append a new account. Raises ValueError if the email or username is
+        already taken (checked under the exclusive lock, so across processes).
+        """
+        with self._lock, self.lock.exclusive():
+            self._refresh()
+            if email in self._by_email:
+                raise ValueError(f'Email {email} is already registered')
+            if username in self._by_username:
+                raise ValueError(f'Username {username} already exists')
+            self._append(username, email, password, self._next_version())
+
+    def _next_version(self):
+        # Under the exclusive lock; also above any version already on file
+        self._sequence.ensure_above(max(self._versions.values(), default=0))
+        return self._sequence.allocate()
+
+    def _rewrite(self):
+        # Under the exclusive lock: one line per account, latest password only
+        data = ''.join(f"{user['username']},{email},{user['password']},{self._versions[email]}\n"
+                       for email, user in self._by_email.items()).encode('utf-8')
+        try:
+            atomic_write(self.path, data, 'wb')
+        except BaseException:
+            # Memory already holds the change; re-read the file next time
+            self._signature = None
+            raise
+        count_written(len(data))
+        # Memory already matches the new file
+        self._offset = len(data)
+        self._signature = stat_signature(self.path)
+
+    def _append(self, username, email, password, version):
+        # A single line appended under the exclusive lock is the commit;
+        # readers hold the shared lock so they never see a partial line
+        line = f'{username},{email},{password},{version}\n'.encode('utf-8')
+        with open(self.path, 'ab') as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        count_written(len(line))
+        # Picks up just the appended line
+        self._refresh()
@@ -0,0 +1,288 @@
+import os
+import json
+import time
+import atexit
+import logging
+import threading
+from storage.backends import StorageBackend, apply_record, stat_signature
+from storage.instrumentation import count_read, count_written
+from storage.locking import FileLock, fsync_directory
+
+logger = logging.getLogger(__name__)
+
+class WriteAheadLogBackend(StorageBackend):
+    """
+    Append-only storage engine for posts.
+
+    Every write appends its change records as one JSON line per record to
+    `<base>.wal`. The log is flushed to the OS on each commit and fsynced in
+    batches (every `sync_every` records, or after `sync_interval` seconds).
+    Once the log grows past `compact_bytes` a background thread writes the
+    current state to `<base>.snapshot.json` and trims the log to the records
+    that came after it. On startup the state is the snapshot plus the log
+    tail; an existing posts.json is imported when neither exists yet, under
+    the exclusive lock.
+    """
+    def __init__(self, base_path, import_path=None, sync_every=32, sync_interval=0.05,
+                 compact_bytes=4 * 1024 * 1024):
+        self.log_path = base_path + '.wal'
+        self.snapshot_path = base_path + '.snapshot.json'
+        self.sequence_path = base_path + '.seq'
+        self.search_path = base_path + '.search.json'
+        self.lock = FileLock(base_path)
+        self.import_path = import_path
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.compact_bytes = compact_bytes
+
+        self._lock = threading.RLock()
+        self._log = None
+        self._seq = 0               # sequence number of the last record seen
+        self._read_offset = 0       # log offset up to which records are applied
+        self._log_inode = None
+        self._snapshot_signature = None
+        self._generation = 0        # bumped whenever the log is rewritten or reloaded
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self._compacting = False
+        self._closed = False
+        self._import()
+
+        self._flusher = threading.Thread(target=self._flush_loop, name='wal-flusher', daemon=True)
+        self._flusher.start()
+        atexit.register(self.close)
+
+    def signature(self):
+        return (stat_signature(self.snapshot_path), stat_signature(self.log_path))
+
+    def version(self):
+        # Records are numbered consecutively and the snapshot keeps the
+        # number it covers, so seq only ever grows
+        return self._seq
+
+    def modified_at(self):
+        times = [signature[2] for signature in self.signature() if signature]
+        return max(times) / 1e9 if times else None
+
+    def _open_log(self):
+        if self._log is None or self._log.closed:
+            self._log = open(self.log_path, 'ab')
+        return self._log
+
+    def _read_snapshot(self):
+        try:
+            with open(self.snapshot_path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return 0, []
+        snapshot = json.loads(data)
+        count_read(len(data), len(snapshot['posts']))
+        return snapshot['seq'], snapshot['posts']
+
+    def _import(self):
+        """First start on an existing posts.json: take it as the initial snapshot"""
+        if not (self.import_path and os.path.exists(self.import_path)):
+            return
+        # Readers only take the shared lock, so the import must not run in load()
+        with self.lock.exclusive(), self._lock:
+            if os.path.exists(self.snapshot_path) or os.path.exists(self.log_path):
+                return
+            with open(self.import_path, 'r') as f:
+                posts = json.load(f)
+            self._write_snapshot(0, posts)
+            logger.info('Imported %d posts from %s', len(posts), self.import_path)
+
+    def _read_records(self, offset):
+        """Return (records, end_offset) for complete log lines after `offset`"""
+        try:
+            with open(self.log_path, 'rb') as f:
+                f.seek(offset)
+                data = f.read()
+        except FileNotFoundError:
+            return [], 0
+        records = []
+        end = offset
+        for line in data.splitlines(keepends=True):
+            if not line.endswith(b'\n'):
+                break  # torn write at the tail; ignored until completed
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                break
+            end += len(line)
+        count_read(end - offset, len(records))
+        return records, end
+
+    def load(self):
+        with self._lock:
+            snapshot_seq, posts = self._read_snapshot()
+            self._snapshot_signature = stat_signature(self.snapshot_path)
+            records, end = self._read_records(0)
+            if end < self._log_size():
+                # Drop a partially written record left by a crash so new
+                # appends start on a clean line
+                with open(self.log_path, 'r+b') as f:
+                    f.truncate(end)
+            by_id = {post['id']: post for post in posts}
+            self._seq = snapshot_seq
+            for record in records:
+                if record['seq'] <= snapshot_seq:
+                    continue
+                post = apply_record(by_id.get(record['id']), record)
+                if post is None:
+                    by_id.pop(record['id'], None)
+                else:
+                    by_id[record['id']] = post
+                self._seq = record['seq']
+            self._read_offset = end
+            if self._log is not None:
+                # Reopen on next append in case the log file was replaced
+                self._sync()
+                self._log.close()
+            log_signature = stat_signature(self.log_path)
+            self._log_inode = log_signature[0] if log_signature else None
+            self._generation += 1
+            return list(by_id.values())
+
+    def _log_size(self):
+        try:
+            return os.path.getsize(self.log_path)
+        except FileNotFoundError:
+            return 0
+
+    def read_changes(self):
+        with self._lock:
+            log_signature = stat_signature(self.log_path)
+            if (log_signature is None or log_signature[0] != self._log_inode
+                    or stat_signature(self.snapshot_path) != self._snapshot_signature):
+                return None  # log was compacted or replaced by another process
+            records, end = self._read_records(self._read_offset)
+            self._read_offset = end
+            records = [record for record in records if record['seq'] > self._seq]
+            if records:
+                self._seq = records[-1]['seq']
+            return records
+
+    def commit(self, posts, records):
+        if records is None:
+            self.replace(posts)
+            return
+        with self._lock:
+            lines = []
+            for record in records:
+                self._seq += 1
+                lines.append(json.dumps(dict(record, seq=self._seq), separators=(',', ':')))
+            data = ('\n'.join(lines) + '\n').encode('utf-8')
+            log = self._open_log()
+            if self._log_inode is None:
+                self._log_inode = os.fstat(log.fileno()).st_ino
+            log.write(data)
+            log.flush()
+            count_written(len(data))
+            self._read_offset += len(data)
+            self._unsynced += len(records)
+            if self._unsynced >= self.sync_every:
+                self._sync()
+            if self._read_offset >= self.compact_bytes and not self._compacting:
+                self._start_compaction(posts)
+
+    def replace(self, posts):
+        with self._lock:
+            self._sync()
+            self._seq += 1
+            self._replace_snapshot(self._write_snapshot_tmp(self._seq, posts))
+            self._truncate_log_to(self._read_offset)
+
+    def sync(self):
+        with self._lock:
+            self._sync()
+
+    def _sync(self):
+        if self._unsynced and self._log is not None and not self._log.closed:
+            os.fsync(self._log.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def _flush_loop(self):
+        """Background fsync so a quiet log still becomes durable promptly"""
+        while not self._closed:
+            time.sleep(self.sync_interval)
+            with self._lock:
+                if self._unsynced and time.monotonic() - self._last_sync >= self.sync_interval:
+                    try:
+                        self._sync()
+                    except OSError as e:
+                        logger.error('Error syncing post log: %s', e)
+
+    def _write_snapshot_tmp(self, seq, posts):
+        tmp_path = f'{self.snapshot_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'seq': seq, 'posts': posts}, f, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        return tmp_path
+
+    def _replace_snapshot(self, tmp_path):
+        os.replace(tmp_path, self.snapshot_path)
+        fsync_directory(os.path.dirname(os.path.abspath(self.snapshot_path)))
+        self._snapshot_signature = stat_signature(self.snapshot_path)
+
+    def _write_snapshot(self, seq, posts):
+        self._replace_snapshot(self._write_snapshot_tmp(seq, posts))
+
+    def _truncate_log_to(self, offset):
+        """Drop log records before `offset`, keeping everything appended after it"""
+        with open(self.log_path, 'ab+') as f:
+            f.seek(offset)
+            tail = f.read()
+        tmp_path = self.log_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(tail)
+            f.flush()
+            os.fsync(f.fileno())
+        if self._log is not None:
+            self._log.close()
+        os.replace(tmp_path, self.log_path)
+        fsync_directory(os.path.dirname(os.path.abspath(self.log_path)))
+        self._log = open(self.log_path, 'ab')
+        self._log_inode = os.fstat(self._log.fileno()).st_ino
+        self._read_offset = max(0, self._read_offset - offset)
+        self._generation += 1
+
+    def _start_compaction(self, posts):
+        # The repository replaces post dicts rather than mutating them, so a
+        # shallow copy of the list is a consistent point-in-time snapshot
+        snapshot = list(posts)
+        seq, offset, generation = self._seq, self._read_offset, self._generation
+        self._compacting = True
+        thread = threading.Thread(target=self._compact,
+                                  args=(snapshot, seq, offset, generation, self._log_inode),
+                                  name='wal-compactor', daemon=True)
+        thread.start()
+
+    def _compact(self, posts, seq, offset, generation, log_inode):
+        try:
+            # Serialize outside the lock so writers are not blocked meanwhile
+            tmp_path = self._write_snapshot_tmp(seq, posts)
+            with self.lock.exclusive(), self._lock:
+                log_signature = stat_signature(self.log_path)
+                if (generation != self._generation or log_signature is None
+                        or log_signature[0] != log_inode):
+                    # The store was replaced or compacted elsewhere meanwhile
+                    os.remove(tmp_path)
+                    return
+                self._sync()
+                self._replace_snapshot(tmp_path)
+                self._truncate_log_to(offset)
+        except Exception as e:
+            logger.error('Error compacting post log: %s', e)
+        finally:
+            self._compacting = False
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            if self._log is not None and not self._log.closed:
+                self._sync()
+                self._log.close()
+        self.lock.close()
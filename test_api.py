@@ -0,0 +1,144 @@
+"""
+Tests of the JSON API: field projection, filters, cursors and batch writes.
+"""
+
+import threading
+import pytest
+from app import create_app
+from controllers import api_controller, auth_controller
+from storage.post_repository import set_post_repository
+from storage.user_directory import UserDirectory
+
+@pytest.fixture(params=['json', 'split'])
+def client(request, tmp_path, monkeypatch):
+    users_file = tmp_path / 'users.txt'
+    users_file.write_text('admin,admin@example.com,admin123\njane,jane@example.com,janepass\n')
+    monkeypatch.setattr(auth_controller, '_user_directory', UserDirectory(str(users_file)))
+    app = create_app({
+        'STORAGE_BACKEND': request.param,
+        'POSTS_FILE': str(tmp_path / 'posts.json'),
+        'WTF_CSRF_ENABLED': False,
+        'PAGE_CACHE_BYTES': 0,
+        'PASSWORD_HASH_METHOD': 'pbkdf2_sha256',
+        'PASSWORD_HASH_COST': '1000'
+    })
+    client = app.test_client()
+    yield client
+    set_post_repository(None)
+
+def login(client, email='admin@example.com', password='admin123'):
+    client.post('/login', data={'email': email, 'password': password})
+
+def create(client, *posts, fields=None):
+    operations = [{'op': 'create', 'post': post} for post in posts]
+    query = f'?fields={fields}' if fields else ''
+    return client.post('/api/posts/batch' + query, json={'operations': operations})
+
+def post(n, **fields):
+    return dict({'title': f'Post {n}', 'body': f'Body of post {n}', 'is_published': True,
+                 'created_at': f'2025-01-01T00:{n:02d}:00'}, **fields)
+
+def test_batch_create_projects_stored_fields(client):
+    """Derived fields of new posts are computed by the store and can be selected"""
+    login(client)
+    response = create(client, post(1), post(2, body='Second body'), fields='id,excerpt,word_count')
+    assert response.status_code == 201
+    assert response.get_json() == {'results': [
+        {'id': 1, 'excerpt': 'Body of post 1', 'word_count': 4},
+        {'id': 2, 'excerpt': 'Second body', 'word_count': 2}
+    ]}
+
+def test_batch_is_all_or_nothing(client):
+    login(client)
+    create(client, post(1, is_published=False))
+    response = client.post('/api/posts/batch', json={'operations': [
+        {'op': 'publish', 'id': 1},
+        {'op': 'update', 'id': 1, 'post': {'title': ''}}
+    ]})
+    assert response.status_code == 422
+    assert client.get('/api/posts/1?fields=title,is_published').get_json() == {
+        'title': 'Post 1', 'is_published': False}
+
+def test_batch_updates_and_publishes(client):
+    login(client)
+    create(client, post(1, is_published=False), post(2))
+    response = client.post('/api/posts/batch?fields=id,title,is_published', json={'operations': [
+        {'op': 'update', 'id': 2, 'post': {'title': 'Renamed'}},
+        {'op': 'publish', 'id': 1},
+        {'op': 'unpublish', 'id': 2}
+    ]})
+    assert response.get_json()['results'] == [
+        {'id': 2, 'title': 'Renamed', 'is_published': True},
+        {'id': 1, 'title': 'Post 1', 'is_published': True},
+        {'id': 2, 'title': 'Renamed', 'is_published': False}
+    ]
+
+def test_batch_is_committed_by_the_group_writer(client, monkeypatch):
+    """Ids are allocated once, inside the batch, by the writer thread that syncs it"""
+    login(client)
+    repository = api_controller.get_post_repository().repository
+    committed_by = []
+    commit = repository.backend.commit
+    monkeypatch.setattr(repository.backend, 'commit',
+                        lambda *args: committed_by.append(threading.current_thread().name) or commit(*args))
+    response = create(client, post(1), post(2), fields='id')
+    assert response.get_json()['results'] == [{'id': 1}, {'id': 2}]
+    assert committed_by == ['group-commit']
+    assert create(client, post(3), fields='id').get_json()['results'] == [{'id': 3}]
+
+def test_writes_need_a_login(client):
+    assert create(client, post(1)).status_code == 401
+    assert client.get('/api/posts?published=false').status_code == 401
+
+def test_unknown_fields_are_rejected(client):
+    response = client.get('/api/posts?fields=id,password')
+    assert response.status_code == 400
+    assert 'password' in response.get_json()['error']
+
+def test_list_follows_cursors(client):
+    login(client)
+    create(client, *(post(n) for n in range(1, 8)))
+    seen, cursor = [], None
+    while True:
+        page = client.get('/api/posts?limit=3&fields=id' + (f'&cursor={cursor}' if cursor else '')).get_json()
+        seen.append([item['id'] for item in page['posts']])
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+    assert seen == [[7, 6, 5], [4, 3, 2], [1]]
+    assert client.get('/api/posts?cursor=not-a-cursor').status_code == 400
+
+def test_list_filters_by_author_and_tag(client):
+    login(client)
+    create(client, post(1, tags=['Python']), post(2), post(3, tags=['Python'], is_published=False))
+    client.get('/logout')
+    login(client, 'jane@example.com', 'janepass')
+    create(client, post(4, tags=['Python']), post(5, tags=['Python'], is_published=False))
+
+    def listed(query):
+        return [item['id'] for item in client.get('/api/posts?fields=id&' + query).get_json()['posts']]
+    assert listed('author=admin') == [2, 1]
+    assert listed('author=jane&tag=Python') == [4]
+    assert listed('tag=Python') == [4, 1]
+    assert listed('published=false&tag=Python') == [5, 3]
+    assert listed('published=false&author=admin') == [3]
+
+def test_filtered_scan_is_capped(client, monkeypatch):
+    """Past MAX_SCAN posts a page comes back short, and its cursor resumes the scan"""
+    monkeypatch.setattr(api_controller, 'MAX_SCAN', 4)
+    login(client)
+    create(client, *(post(n, is_published=False, tags=['Python'] if n in (1, 2) else []) for n in range(1, 11)))
+    page = client.get('/api/posts?published=false&tag=Python&fields=id').get_json()
+    assert page['posts'] == [] and page['next_cursor']
+    found = []
+    while page['next_cursor']:
+        page = client.get(f'/api/posts?published=false&tag=Python&fields=id&cursor={page["next_cursor"]}').get_json()
+        found += [item['id'] for item in page['posts']]
+    assert found == [2, 1]
+
+def test_get_hides_drafts_from_anonymous_readers(client):
+    login(client)
+    create(client, post(1, is_published=False))
+    assert client.get('/api/posts/1?fields=id').get_json() == {'id': 1}
+    client.get('/logout')
+    assert client.get('/api/posts/1').status_code == 404
@@ -0,0 +1,61 @@
+"""
+Tests of the ASGI adapter: the WSGI environ it builds and the order of the
+messages it sends.
+"""
+
+import asyncio
+from asgi import AsgiAdapter
+
+def scope(path, root_path=''):
+    return {'type': 'http', 'method': 'GET', 'path': path, 'root_path': root_path,
+            'query_string': b'', 'headers': [(b'host', b'localhost')]}
+
+def call(wsgi_app, request_scope):
+    """Run one request through the adapter; returns the ASGI messages sent"""
+    adapter = AsgiAdapter(wsgi_app, workers=2)
+    messages = iter(({'type': 'http.request', 'body': b'', 'more_body': False},))
+    sent = []
+
+    async def receive():
+        return next(messages, {'type': 'http.disconnect'})
+
+    async def send(message):
+        sent.append(message)
+    try:
+        asyncio.run(adapter(request_scope, receive, send))
+    finally:
+        adapter.executor.shutdown()
+    return sent
+
+def echo_paths(environ, start_response):
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    return [f"{environ['SCRIPT_NAME']}|{environ['PATH_INFO']}".encode()]
+
+def body(sent):
+    return b''.join(message.get('body', b'') for message in sent if message['type'] == 'http.response.body')
+
+def test_root_path_moves_to_script_name():
+    assert body(call(echo_paths, scope('/blog/posts/1', '/blog'))) == b'/blog|/posts/1'
+    assert body(call(echo_paths, scope('/blog', '/blog/'))) == b'/blog|'
+    assert body(call(echo_paths, scope('/posts/1'))) == b'|/posts/1'
+    # Only a whole path segment is a prefix
+    assert body(call(echo_paths, scope('/blogroll', '/blog'))) == b'/blog|/blogroll'
+
+def test_write_callable_sends_headers_first():
+    def legacy_app(environ, start_response):
+        write = start_response('201 Created', [('Content-Type', 'text/plain')])
+        write(b'early ')
+        return [b'', b'late']
+    sent = call(legacy_app, scope('/'))
+    assert [message['type'] for message in sent] == ['http.response.start'] + ['http.response.body'] * 3
+    assert sent[0]['status'] == 201
+    assert body(sent) == b'early late'
+    assert sent[-1]['more_body'] is False
+
+def test_empty_response_still_starts():
+    def empty_app(environ, start_response):
+        start_response('204 No Content', [])
+        return []
+    sent = call(empty_app, scope('/'))
+    assert sent[0] == {'type': 'http.response.start', 'status': 204, 'headers': []}
+    assert body(sent) == b''
@@ -0,0 +1,85 @@
+"""
+Tests of the posts import and export commands.
+"""
+
+import json
+import pytest
+from app import create_app
+from storage.post_repository import get_post_repository, set_post_repository
+
+def record(n, **fields):
+    return dict({'id': n, 'title': f'Post {n}', 'body': f'Body of post {n}', 'author': 'admin',
+                 'is_published': True, 'tags': ['Python'],
+                 'created_at': f'2025-01-01T00:{n:02d}:00'}, **fields)
+
+@pytest.fixture(params=['json', 'sqlite'])
+def app(request, tmp_path):
+    app = create_app({
+        'STORAGE_BACKEND': request.param,
+        'POSTS_FILE': str(tmp_path / 'posts.json'),
+        'SQLITE_PATH': str(tmp_path / 'blog.db')
+    })
+    yield app
+    set_post_repository(None)
+
+def run(app, *args):
+    return app.test_cli_runner(mix_stderr=False).invoke(args=['posts', *args])
+
+def write_ndjson(path, records):
+    path.write_text(''.join(json.dumps(item) + '\n' for item in records))
+    return str(path)
+
+def stored(app):
+    with app.app_context():
+        return {post['id']: post for post in get_post_repository().all()}
+
+def test_import_numbers_posts_and_skips_bad_records(app, tmp_path):
+    source = write_ndjson(tmp_path / 'in.ndjson', [record(7), {'title': 'No body'}, record(3)])
+    (tmp_path / 'in.ndjson').write_text((tmp_path / 'in.ndjson').read_text() + 'not json\n')
+    result = run(app, 'import', source, '--batch-size', '1')
+    assert result.exit_code == 0, result.stderr
+    assert 'Imported 2 posts (2 skipped)' in result.stderr
+    posts = stored(app)
+    assert sorted(posts) == [1, 2]
+    assert [posts[1]['title'], posts[2]['title']] == ['Post 7', 'Post 3']
+    with app.app_context():
+        # Ids were allocated once, by the writes themselves
+        assert get_post_repository().next_id() == 3
+
+def test_import_keeps_ids_from_a_json_array(app, tmp_path):
+    source = tmp_path / 'in.json'
+    source.write_text(json.dumps([record(5), record(9)], indent=2))
+    assert run(app, 'import', str(source), '--keep-ids').exit_code == 0
+    assert sorted(stored(app)) == [5, 9]
+    with app.app_context():
+        assert get_post_repository().insert(record(1, id=None, updated_at='2025-01-01T00:01:00'))['id'] == 10
+    result = run(app, 'import', str(source), '--keep-ids')
+    assert result.exit_code != 0 and 'already exists' in result.stderr
+
+def test_strict_import_stops_at_the_first_bad_record(app, tmp_path):
+    source = write_ndjson(tmp_path / 'in.ndjson', [record(1), record(2, title=''), record(3)])
+    result = run(app, 'import', source, '--strict')
+    assert result.exit_code != 0 and 'Record 2' in result.stderr
+    assert stored(app) == {}
+
+def test_timestamps_are_normalised_and_must_agree(app, tmp_path):
+    source = write_ndjson(tmp_path / 'in.ndjson', [
+        record(1, created_at='2025-01-01T10:00'),
+        record(2, created_at='2025-01-01T10:00:00+00:00', updated_at='2025-01-02T10:00:00')
+    ])
+    result = run(app, 'import', source)
+    assert 'both have a timezone or both lack one' in result.stderr
+    post = stored(app)[1]
+    assert post['created_at'] == post['updated_at'] == '2025-01-01T10:00:00'
+
+@pytest.mark.parametrize('file_format', ['ndjson', 'json'])
+def test_export_round_trips(app, tmp_path, file_format):
+    source = write_ndjson(tmp_path / 'in.ndjson', [record(n, is_published=n % 2 == 0) for n in range(1, 6)])
+    run(app, 'import', source, '--keep-ids')
+    exported = tmp_path / f'out.{file_format}'
+    assert run(app, 'export', str(exported), '--format', file_format, '--batch-size', '2').exit_code == 0
+    before = stored(app)
+
+    copy = create_app({'STORAGE_BACKEND': 'json', 'POSTS_FILE': str(tmp_path / 'copy.json')})
+    assert run(copy, 'import', str(exported), '--keep-ids').exit_code == 0
+    assert stored(copy) == before
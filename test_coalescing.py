@@ -0,0 +1,101 @@
+"""
+Tests of single-flight coalescing: shared results and errors, and page
+renders shared by concurrent cache misses.
+"""
+
+import time
+import threading
+import pytest
+from app import create_app
+from controllers.page_cache import page_builds
+from routes import post_routes
+from storage.coalescing import SingleFlight
+from storage.post_repository import set_post_repository
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+def run_threads(count, target):
+    outcomes = [None] * count
+
+    def run(index):
+        try:
+            outcomes[index] = target()
+        except Exception as e:
+            outcomes[index] = e
+    threads = [threading.Thread(target=run, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, outcomes
+
+def test_waiting_callers_share_one_call():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def load():
+        calls.append(1)
+        release.wait()
+        return ['post']
+    threads, outcomes = run_threads(5, lambda: flight.do('key', load))
+    wait_for(lambda: flight.leaders + flight.coalesced == 5)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert sorted(leader for _, leader in outcomes) == [False] * 4 + [True]
+    assert all(result == ['post'] for result, _ in outcomes)
+    # Finished calls are not remembered
+    assert flight.do('key', lambda: 'again') == ('again', True)
+
+def test_error_is_shared_and_not_remembered():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def fail():
+        release.wait()
+        raise OSError('read failed')
+    threads, outcomes = run_threads(3, lambda: flight.do('key', fail))
+    wait_for(lambda: flight.leaders + flight.coalesced == 3)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert all(isinstance(outcome, OSError) for outcome in outcomes)
+    assert flight.do('key', lambda: 'ok') == ('ok', True)
+
+def test_different_keys_run_separately():
+    flight = SingleFlight()
+    assert flight.do('a', lambda: 1) == (1, True)
+    assert flight.do('b', lambda: 2) == (2, True)
+    assert flight.coalesced == 0
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app({
+        'STORAGE_BACKEND': 'json',
+        'POSTS_FILE': str(tmp_path / 'posts.json'),
+        'WTF_CSRF_ENABLED': False
+    })
+    yield app
+    set_post_repository(None)
+
+def test_concurrent_misses_render_a_page_once(app, monkeypatch):
+    renders = []
+    coalesced = page_builds.coalesced
+    get_tag_counts = post_routes.get_tag_counts
+
+    def slow_tag_counts():
+        renders.append(1)
+        # Hold the render until the other requests wait for it
+        wait_for(lambda: page_builds.coalesced - coalesced == 3)
+        return get_tag_counts()
+    monkeypatch.setattr(post_routes, 'get_tag_counts', slow_tag_counts)
+    threads, outcomes = run_threads(4, lambda: app.test_client().get('/posts/'))
+    for thread in threads:
+        thread.join()
+    assert len(renders) == 1
+    assert all(response.status_code == 200 for response in outcomes)
+    assert len({response.data for response in outcomes}) == 1
@@ -0,0 +1,76 @@
+"""
+Tests of the group-commit writer: batching, per-mutation errors and
+commit failures.
+"""
+
+import threading
+import pytest
+from storage.post_repository import PostRepository
+from storage.backends import JsonFileBackend
+from storage.group_commit import GroupCommitWriter
+
+def make_post(n, **fields):
+    created_at = f'2025-01-01T00:{n:02d}:00'
+    return dict({'title': f'Post {n}', 'body': f'Body of post {n}', 'author': 'admin',
+                 'is_published': True, 'tags': [], 'created_at': created_at,
+                 'updated_at': created_at}, **fields)
+
+def run_together(*calls):
+    """Run each call in its own thread; returns each call's result or exception"""
+    outcomes = [None] * len(calls)
+
+    def run(index, call):
+        try:
+            outcomes[index] = call()
+        except Exception as e:
+            outcomes[index] = e
+    threads = [threading.Thread(target=run, args=(index, call)) for index, call in enumerate(calls)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return outcomes
+
+@pytest.fixture
+def writer(tmp_path):
+    # Each batch waits for all three callers
+    writer = GroupCommitWriter(PostRepository(JsonFileBackend(str(tmp_path / 'posts.json'))),
+                               max_delay=1.0, max_batch=3)
+    yield writer
+    writer.close()
+
+def test_concurrent_writes_share_one_commit(writer, monkeypatch):
+    commits = []
+    commit = JsonFileBackend.commit
+    monkeypatch.setattr(JsonFileBackend, 'commit', lambda self, *args: commits.append(1) or commit(self, *args))
+    outcomes = run_together(*(lambda n=n: writer.insert(make_post(n)) for n in range(1, 4)))
+    assert sorted(post['id'] for post in outcomes) == [1, 2, 3]
+    assert len(commits) == 1
+
+def test_rejected_mutation_fails_alone(writer):
+    writer.insert(make_post(1, id=1))
+    outcomes = run_together(lambda: writer.insert(make_post(2)),
+                            lambda: writer.insert(make_post(3, id=1)),
+                            lambda: writer.modify(1, lambda post: dict(post, title='Edited')))
+    assert outcomes[0]['title'] == 'Post 2'
+    assert isinstance(outcomes[1], ValueError)
+    assert outcomes[2]['title'] == 'Edited'
+    assert sorted(post['id'] for post in writer.all()) == [1, 2]
+
+def test_failure_after_rename_is_not_written_twice(writer, tmp_path, monkeypatch):
+    """A commit that fails once the file is in place fails every caller, without duplicates"""
+    commit = JsonFileBackend.commit
+
+    def commit_then_fail(self, *args):
+        commit(self, *args)
+        raise OSError('fsync failed')
+    monkeypatch.setattr(JsonFileBackend, 'commit', commit_then_fail)
+    outcomes = run_together(*(lambda n=n: writer.insert(make_post(n)) for n in range(1, 4)))
+    assert all(isinstance(outcome, OSError) for outcome in outcomes)
+    monkeypatch.setattr(JsonFileBackend, 'commit', commit)
+
+    assert sorted(post['title'] for post in writer.all()) == ['Post 1', 'Post 2', 'Post 3']
+    assert writer.insert(make_post(4))['id'] == 4
+    reopened = PostRepository(JsonFileBackend(str(tmp_path / 'posts.json')))
+    assert sorted(post['id'] for post in reopened.all()) == [1, 2, 3, 4]
+    reopened.close()
@@ -0,0 +1,102 @@
+"""
+Tests of the request instrumentation: Server-Timing headers, /metrics and
+the storage counters behind them.
+"""
+
+import re
+import pytest
+from app import create_app
+from controllers import auth_controller
+from controllers.metrics import metrics_registry
+from storage import instrumentation
+from storage.instrumentation import storage_read
+from storage.post_repository import set_post_repository
+from storage.user_directory import UserDirectory
+
+def make_app(tmp_path, **config):
+    return create_app(dict({
+        'STORAGE_BACKEND': 'json',
+        'POSTS_FILE': str(tmp_path / 'posts.json'),
+        'WTF_CSRF_ENABLED': False,
+        'PAGE_CACHE_BYTES': 0,
+        'PASSWORD_HASH_METHOD': 'pbkdf2_sha256',
+        'PASSWORD_HASH_COST': '1000'
+    }, **config))
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    users_file = tmp_path / 'users.txt'
+    users_file.write_text('admin,admin@example.com,admin123\n')
+    monkeypatch.setattr(auth_controller, '_user_directory', UserDirectory(str(users_file)))
+    metrics_registry.clear()
+    client = make_app(tmp_path).test_client()
+    client.post('/login', data={'email': 'admin@example.com', 'password': 'admin123'})
+    yield client
+    set_post_repository(None)
+
+def timing(response):
+    """Server-Timing entries as {name: duration or description}"""
+    return dict(re.findall(r'([\w-]+);(?:dur=|desc=")([\d.]+)', response.headers['Server-Timing']))
+
+def create_posts(client, count):
+    operations = [{'op': 'create', 'post': {'title': f'Post {n}', 'body': f'Body of post {n}',
+                                            'is_published': True}} for n in range(count)]
+    response = client.post('/api/posts/batch', json={'operations': operations})
+    # Recorded once the response is closed, as a server does after sending it
+    response.close()
+    return response
+
+def metric(text, name, endpoint):
+    match = re.search(rf'^{name}{{endpoint="{endpoint}"(?:,le="\+Inf")?}} ([\d.e-]+)$', text, re.M)
+    return float(match.group(1)) if match else None
+
+def test_write_reports_bytes_written(client):
+    entries = timing(create_posts(client, 3))
+    assert int(entries['bytes-written']) > 0
+    assert float(entries['storage-write']) > 0
+    assert float(entries['app']) >= float(entries['storage-write'])
+
+def test_streamed_page_is_recorded_once_sent(client):
+    create_posts(client, 3)
+    response = client.get('/posts/', buffered=False)
+    assert 'render' in timing(response)
+    text = client.get('/metrics').get_data(as_text=True)
+    assert metric(text, 'blog_request_duration_seconds_count', 'posts.show_posts') is None
+    response.get_data()
+    response.close()
+    text = client.get('/metrics').get_data(as_text=True)
+    assert metric(text, 'blog_request_duration_seconds_count', 'posts.show_posts') == 1
+    assert metric(text, 'blog_request_duration_seconds_bucket', 'posts.show_posts') == 1
+
+def test_metrics_add_up_by_endpoint(client):
+    written = sum(int(timing(create_posts(client, 2))['bytes-written']) for _ in range(3))
+    text = client.get('/metrics').get_data(as_text=True)
+    assert metric(text, 'blog_request_duration_seconds_count', 'api.batch') == 3
+    assert metric(text, 'blog_storage_written_bytes_total', 'api.batch') == written
+    assert 'blog_singleflight_leader_total{flight="page_render"}' in text
+
+def test_metrics_can_be_turned_off(tmp_path):
+    client = make_app(tmp_path, METRICS_ENABLED=False).test_client()
+    assert 'Server-Timing' not in client.get('/posts/').headers
+    assert client.get('/metrics').status_code == 404
+    set_post_repository(None)
+
+def test_nested_storage_calls_are_timed_once():
+    @storage_read
+    def outer():
+        return inner()
+
+    @storage_read
+    def inner():
+        instrumentation.count_read(10, posts=1)
+        return 'done'
+    stats = instrumentation.begin()
+    try:
+        assert outer() == 'done'
+    finally:
+        instrumentation.end(stats)
+    assert stats.bytes_read == 10 and stats.posts_loaded == 1
+    assert stats.read_time > 0 and stats._depth == 0
+    assert instrumentation.current() is None
+    # Outside a request nothing is collected
+    assert outer() == 'done'
@@ -0,0 +1,181 @@
+"""
+Tests of the HTML pages: store versions, conditional GETs, the page cache
+and streaming.
+"""
+
+import re
+import pytest
+from app import create_app
+from controllers import auth_controller
+from controllers.post_controller import PostStream
+from controllers.page_cache import CSRF_PLACEHOLDER
+from routes import post_routes
+from storage.post_repository import PostRepository, set_post_repository
+from storage.backends import JsonFileBackend
+from storage.split import SplitFileBackend
+from storage.user_directory import UserDirectory
+
+def make_post(n, **fields):
+    created_at = f'2025-01-01T00:{n:02d}:00'
+    return dict({'title': f'Post {n}', 'body': f'Body of post {n}', 'author': 'admin',
+                 'is_published': True, 'tags': [], 'created_at': created_at,
+                 'updated_at': created_at}, **fields)
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    users_file = tmp_path / 'users.txt'
+    users_file.write_text('admin,admin@example.com,admin123\n')
+    monkeypatch.setattr(auth_controller, '_user_directory', UserDirectory(str(users_file)))
+    app = create_app({
+        'STORAGE_BACKEND': 'json',
+        'POSTS_FILE': str(tmp_path / 'posts.json'),
+        'WTF_CSRF_ENABLED': False,
+        'PASSWORD_HASH_METHOD': 'pbkdf2_sha256',
+        'PASSWORD_HASH_COST': '1000'
+    })
+    yield app
+    set_post_repository(None)
+
+def login(client):
+    client.post('/login', data={'email': 'admin@example.com', 'password': 'admin123'})
+    # Shows (and drops) the welcome message: pages with flashes carry no validators
+    client.get('/posts/')
+
+def create(client, *posts):
+    operations = [{'op': 'create', 'post': post} for post in posts]
+    return client.post('/api/posts/batch', json={'operations': operations})
+
+def test_json_version_counts_commits(tmp_path):
+    """Same-size rewrites within one mtime tick still get a new version, seen by every process"""
+    path = str(tmp_path / 'posts.json')
+    repository = PostRepository(JsonFileBackend(path))
+    other = PostRepository(JsonFileBackend(path))
+    assert repository.version() == 0
+    repository.insert(make_post(1))
+    for title in ('Post A', 'Post B', 'Post A'):
+        before = repository.version()
+        repository.modify(1, lambda post: dict(post, title=title))
+        assert repository.version() == before + 1
+        assert other.version() == repository.version()
+    other.insert(make_post(2))
+    assert repository.version() == 5
+    repository.close()
+    other.close()
+
+    reopened = PostRepository(JsonFileBackend(path))
+    assert reopened.version() == 5
+    reopened.close()
+
+def test_split_version_counts_commits(tmp_path):
+    base = str(tmp_path / 'posts')
+    repository = PostRepository(SplitFileBackend(base))
+    other = PostRepository(SplitFileBackend(base))
+    repository.insert(make_post(1))
+    for title in ('Post A', 'Post B'):
+        repository.modify(1, lambda post: dict(post, title=title))
+    assert repository.version() == other.version() == 3
+    repository.close()
+    other.close()
+
+    reopened = PostRepository(SplitFileBackend(base))
+    assert reopened.version() == 3
+    reopened.close()
+
+@pytest.fixture
+def renders(monkeypatch):
+    """Counts listing renders (each asks for the tag counts once)"""
+    calls = []
+    get_tag_counts = post_routes.get_tag_counts
+    monkeypatch.setattr(post_routes, 'get_tag_counts', lambda: calls.append(1) or get_tag_counts())
+    return calls
+
+def csrf_tokens(page):
+    return set(re.findall(rb'name="csrf_token" value="([^"]*)"', page))
+
+def test_anonymous_listing_is_rendered_once_per_version(app, renders):
+    writer = app.test_client()
+    login(writer)
+    create(writer, make_post(1))
+    renders.clear()
+
+    first, second = app.test_client(), app.test_client()
+    first_tokens = csrf_tokens(first.get('/posts/').data)
+    second_tokens = csrf_tokens(second.get('/posts/').data)
+    assert len(renders) == 1
+    # Each visitor gets their own token in the shared page
+    assert len(first_tokens) == len(second_tokens) == 1
+    assert first_tokens != second_tokens
+    assert CSRF_PLACEHOLDER not in first_tokens | second_tokens
+
+    create(writer, make_post(2))
+    assert b'Post 2' in first.get('/posts/').data
+    assert len(renders) == 2
+
+def test_logged_in_pages_are_not_cached(app, renders):
+    client = app.test_client()
+    login(client)
+    renders.clear()
+    client.get('/posts/')
+    client.get('/posts/')
+    assert len(renders) == 2
+
+def test_cached_page_follows_writes_of_other_processes(app, tmp_path):
+    client = app.test_client()
+    assert b'Post 1' not in client.get('/posts/').data
+    other = PostRepository(JsonFileBackend(str(tmp_path / 'posts.json')))
+    other.insert(make_post(1))
+    other.close()
+    assert b'Post 1' in client.get('/posts/').data
+
+def test_listing_answers_conditional_get(app):
+    client = app.test_client()
+    first = client.get('/posts/')
+    etag = first.headers['ETag']
+    assert first.status_code == 200 and 'Last-Modified' not in first.headers
+    assert client.get('/posts/', headers={'If-None-Match': etag}).status_code == 304
+
+    writer = app.test_client()
+    login(writer)
+    create(writer, make_post(1))
+    changed = client.get('/posts/', headers={'If-None-Match': etag})
+    assert changed.status_code == 200 and b'Post 1' in changed.data
+    assert changed.headers['ETag'] != etag
+    assert changed.headers['Last-Modified']
+
+def test_etags_are_not_shared_across_logins(app):
+    anonymous, member = app.test_client(), app.test_client()
+    login(member)
+    etag = member.get('/posts/').headers['ETag']
+    assert member.get('/posts/', headers={'If-None-Match': etag}).status_code == 304
+    assert anonymous.get('/posts/', headers={'If-None-Match': etag}).status_code == 200
+
+def test_post_detail_revalidates_on_edit(app):
+    client = app.test_client()
+    login(client)
+    create(client, make_post(1))
+    etag = client.get('/posts/1').headers['ETag']
+    assert client.get('/posts/1', headers={'If-None-Match': etag}).status_code == 304
+    client.post('/api/posts/batch', json={'operations': [
+        {'op': 'update', 'id': 1, 'post': {'title': 'Renamed'}}]})
+    edited = client.get('/posts/1', headers={'If-None-Match': etag})
+    assert edited.status_code == 200 and b'Renamed' in edited.data
+
+def test_stream_sends_the_top_of_the_page_before_reading_posts(app, monkeypatch):
+    client = app.test_client()
+    login(client)
+    create(client, *(make_post(n) for n in range(1, 31)))
+    fetches = []
+    fetch = PostStream._fetch
+    monkeypatch.setattr(PostStream, '_fetch', lambda self: fetches.append(1) or fetch(self))
+
+    response = client.get('/posts/', buffered=False)
+    chunks = iter(response.response)
+    first = next(chunks)
+    assert b'<h1>Published Posts</h1>' in first
+    assert not re.search(rb'/posts/\d+', first)
+    assert fetches == []
+    rest = b''.join(chunks)
+    response.close()
+    # A full page, read a few posts at a time
+    assert len(set(re.findall(rb'href="/posts/(\d+)"', rest))) == 20
+    assert len(fetches) > 1
@@ -0,0 +1,75 @@
+"""
+Tests of the BM25 search index: ranking, incremental updates and paging.
+"""
+
+import random
+from storage.search import SearchIndex
+
+def post(post_id, title='', body=''):
+    return {'id': post_id, 'title': title, 'body': body}
+
+def ids(index, query, limit=20, offset=0):
+    return index.search(query, limit, offset)[0]
+
+def test_title_match_outranks_body_match():
+    index = SearchIndex()
+    index.add(post(1, 'Cooking notes', 'A long day with flask and coffee'))
+    index.add(post(2, 'Flask tips', 'A long day with notes and coffee'))
+    assert ids(index, 'flask') == [2, 1]
+
+def test_rare_term_outweighs_common_term():
+    index = SearchIndex()
+    for post_id in range(1, 9):
+        index.add(post(post_id, 'Daily log', 'python ' * (post_id == 1) + 'server update'))
+    index.add(post(9, 'Daily log', 'server update server update asyncio'))
+    # Both match one query term; the rarer one decides the order
+    assert ids(index, 'server asyncio')[0] == 9
+
+def test_shorter_document_ranks_higher_for_equal_frequency():
+    index = SearchIndex()
+    index.add(post(1, 'Post', 'flask ' + 'filler words ' * 40))
+    index.add(post(2, 'Post', 'flask filler'))
+    assert ids(index, 'flask') == [2, 1]
+
+def test_stop_words_and_case_are_ignored():
+    index = SearchIndex()
+    index.add(post(1, 'The Flask Guide', 'Serving Python'))
+    assert ids(index, 'FLASK') == [1]
+    assert index.search('the and of', 20) == ([], 0)
+
+def test_removed_and_replaced_posts():
+    index = SearchIndex()
+    first = post(1, 'Flask', 'old text')
+    index.add(first)
+    index.add(post(2, 'Django', 'other text'))
+    index.remove(first)
+    index.add(post(1, 'Rewritten', 'nothing here'))
+    assert ids(index, 'flask') == []
+    assert ids(index, 'rewritten') == [1]
+    assert index.search('text', 20) == ([2], 1)
+
+def test_top_results_match_a_full_ranking():
+    """The early-stopping top-k agrees with ranking every match, at any page"""
+    rng = random.Random(3)
+    words = ['alpha', 'beta', 'gamma', 'delta', 'epsilon', 'zeta', 'eta', 'theta']
+    index = SearchIndex()
+    for post_id in range(1, 301):
+        index.add(post(post_id, ' '.join(rng.choices(words, k=2)), ' '.join(rng.choices(words, k=rng.randint(5, 60)))))
+    for query in ('alpha', 'alpha beta', 'gamma delta epsilon', 'zeta theta'):
+        full, total = index.search(query, 1000)
+        assert len(full) == total
+        for limit, offset in ((1, 0), (10, 0), (10, 10), (25, 40)):
+            assert index.search(query, limit, offset) == (full[offset:offset + limit], total)
+
+def test_saved_index_restores_for_the_same_signature(tmp_path):
+    path = str(tmp_path / 'posts.search.json')
+    index = SearchIndex(path)
+    index.add(post(1, 'Flask', 'body'))
+    index.add(post(2, 'Other', 'flask body'))
+    index.save(['v', 1])
+    assert not index.dirty
+
+    restored = SearchIndex(path)
+    assert not restored.restore(['v', 2])
+    assert restored.restore(['v', 1])
+    assert restored.search('flask', 20) == index.search('flask', 20)
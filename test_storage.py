@@ -0,0 +1,244 @@
+"""
+Tests of the storage engines: write-ahead log recovery and compaction,
+keyset pagination, and split-file body compaction.
+"""
+
+import os
+import json
+import time
+import pytest
+from storage.post_repository import PostRepository, create_repository
+from storage.backends import JsonFileBackend
+from storage.sqlite_store import SqlitePostRepository, SqliteDatabase
+from storage.split import SplitFileBackend
+from storage.wal import WriteAheadLogBackend
+
+def make_post(n, published=True, created_at=None, tags=(), body=None):
+    """A complete post dict without id; post n is created at minute n"""
+    created_at = created_at or f'2025-01-01T00:{n:02d}:00'
+    return {'title': f'Post {n}', 'body': body or f'Body of post {n}', 'author': 'admin',
+            'is_published': published, 'tags': list(tags),
+            'created_at': created_at, 'updated_at': created_at}
+
+def snapshot(repository):
+    """{id: (title, body, is_published)} of every stored post"""
+    return {post['id']: (post['title'], post['body'], post['is_published']) for post in repository.all()}
+
+def wal_repository(path, **options):
+    return PostRepository(WriteAheadLogBackend(str(path / 'posts'), **options))
+
+def wait_for_compaction(backend, timeout=5):
+    deadline = time.monotonic() + timeout
+    while backend._compacting and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not backend._compacting
+
+def test_wal_replays_log_after_restart(tmp_path):
+    """Creates, edits and deletes are all rebuilt from the log on the next start"""
+    repository = wal_repository(tmp_path)
+    repository.insert_many([make_post(n) for n in range(1, 5)])
+    repository.modify(2, lambda post: dict(post, title='Edited', is_published=False))
+    repository.delete(3)
+    expected = snapshot(repository)
+    repository.close()
+
+    reopened = wal_repository(tmp_path)
+    assert snapshot(reopened) == expected
+    assert reopened.get(2)['title'] == 'Edited'
+    assert reopened.get(3) is None
+    reopened.close()
+
+def test_wal_drops_torn_tail(tmp_path):
+    """A record cut short by a crash is ignored and trimmed, and later appends replay"""
+    repository = wal_repository(tmp_path)
+    repository.insert_many([make_post(1), make_post(2)])
+    expected = snapshot(repository)
+    repository.close()
+
+    log_path = tmp_path / 'posts.wal'
+    intact = log_path.stat().st_size
+    with open(log_path, 'ab') as f:
+        f.write(b'{"op":"create","id":9,"post":{"title":"Half')
+
+    recovered = wal_repository(tmp_path)
+    assert snapshot(recovered) == expected
+    assert log_path.stat().st_size == intact
+    recovered.insert(make_post(3))
+    expected = snapshot(recovered)
+    recovered.close()
+
+    reopened = wal_repository(tmp_path)
+    assert snapshot(reopened) == expected
+    assert len(expected) == 3
+    reopened.close()
+
+def test_wal_compaction_keeps_state(tmp_path):
+    """Compaction moves the log into the snapshot without losing or repeating writes"""
+    repository = wal_repository(tmp_path, compact_bytes=2048)
+    repository.insert_many([make_post(n) for n in range(1, 11)])
+    for n in range(1, 11):
+        repository.modify(n, lambda post: dict(post, body=post['body'] + ' edited ' * 20))
+    wait_for_compaction(repository.backend)
+    with open(tmp_path / 'posts.snapshot.json') as f:
+        covered = json.load(f)['seq']
+    assert covered > 0
+    # The log keeps only records the snapshot does not cover
+    with open(tmp_path / 'posts.wal') as f:
+        assert all(json.loads(line)['seq'] > covered for line in f)
+    repository.delete(10)
+    expected = snapshot(repository)
+    repository.close()
+
+    reopened = wal_repository(tmp_path)
+    assert snapshot(reopened) == expected
+    assert reopened.get(10) is None
+    reopened.close()
+
+@pytest.mark.parametrize('storage, backend, files', [
+    ('json', JsonFileBackend, ['posts.json']),
+    ('wal', WriteAheadLogBackend, ['posts.wal']),
+    ('split', SplitFileBackend, ['posts.0.bodies', 'posts.meta.json'])
+])
+def test_storage_backend_setting(tmp_path, storage, backend, files):
+    """STORAGE_BACKEND picks the engine, which keeps its files next to POSTS_FILE"""
+    repository = create_repository({'STORAGE_BACKEND': storage, 'POSTS_FILE': str(tmp_path / 'posts.json')})
+    assert type(repository.backend) is backend
+    repository.insert(make_post(1))
+    repository.close()
+    assert set(files) <= set(os.listdir(tmp_path))
+
+def test_unknown_storage_backend_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        create_repository({'STORAGE_BACKEND': 'posts', 'POSTS_FILE': str(tmp_path / 'posts.json')})
+
+def test_wal_imports_posts_json(tmp_path):
+    """An existing posts.json becomes the first snapshot"""
+    source = PostRepository(JsonFileBackend(str(tmp_path / 'posts.json')))
+    source.insert_many([make_post(1), make_post(2)])
+    expected = snapshot(source)
+    source.close()
+
+    repository = wal_repository(tmp_path, import_path=str(tmp_path / 'posts.json'))
+    assert snapshot(repository) == expected
+    repository.close()
+
+def test_wal_imports_posts_json_once(tmp_path):
+    source = PostRepository(JsonFileBackend(str(tmp_path / 'posts.json')))
+    source.insert_many([make_post(1), make_post(2)])
+    source.close()
+
+    import_path = str(tmp_path / 'posts.json')
+    first = wal_repository(tmp_path, import_path=import_path)
+    first.modify(1, lambda post: dict(post, title='Changed'))
+    # A second process starting later must not import over the change
+    second = wal_repository(tmp_path, import_path=import_path)
+    assert second.get(1)['title'] == 'Changed'
+    assert sorted(snapshot(second)) == [1, 2]
+    first.close()
+    second.close()
+
+def test_sqlite_commits_are_durable_without_sync(tmp_path):
+    database = SqliteDatabase(str(tmp_path / 'blog.db'))
+    # 2 is FULL: the WAL is fsynced on every commit, not only at checkpoints
+    assert database.connection().execute('PRAGMA synchronous').fetchone()[0] == 2
+    database.close()
+
+@pytest.fixture(params=['json', 'sqlite'])
+def repository(request, tmp_path):
+    if request.param == 'json':
+        repository = PostRepository(JsonFileBackend(str(tmp_path / 'posts.json')))
+    else:
+        repository = SqlitePostRepository(SqliteDatabase(str(tmp_path / 'blog.db')))
+    yield repository
+    repository.close()
+
+def all_pages(fetch, limit):
+    """Follow cursors to the end; returns the ids of every page"""
+    pages, cursor = [], None
+    while True:
+        posts, cursor = fetch(limit, cursor)
+        pages.append([post['id'] for post in posts])
+        if cursor is None:
+            return pages
+
+def test_page_of_empty_store(repository):
+    assert repository.page(True, 5) == ([], None)
+    assert repository.page_by_tag('Python', 5) == ([], None)
+
+def test_pages_end_exactly_on_the_last_post(repository):
+    """No empty trailing page when the post count is a multiple of the limit"""
+    repository.insert_many([make_post(n) for n in range(1, 7)])
+    pages = all_pages(lambda limit, cursor: repository.page(True, limit, cursor), 3)
+    assert pages == [[6, 5, 4], [3, 2, 1]]
+    pages = all_pages(lambda limit, cursor: repository.page(True, limit, cursor), 6)
+    assert pages == [[6, 5, 4, 3, 2, 1]]
+
+def test_pages_break_timestamp_ties_by_id(repository):
+    """Posts created at the same moment are neither skipped nor repeated"""
+    repository.insert_many([make_post(n, created_at='2025-01-01T00:00:00') for n in range(1, 6)])
+    repository.insert(make_post(6))
+    pages = all_pages(lambda limit, cursor: repository.page(True, limit, cursor), 2)
+    assert pages == [[6, 5], [4, 3], [2, 1]]
+
+def test_pages_by_status_and_tag(repository):
+    repository.insert_many([make_post(n, published=n % 2 == 0, tags=['Python'] if n % 3 == 0 else [])
+                            for n in range(1, 13)])
+    assert all_pages(lambda limit, cursor: repository.page(False, limit, cursor), 4) == [[11, 9, 7, 5], [3, 1]]
+    # Only published posts are in the tag index
+    assert all_pages(lambda limit, cursor: repository.page_by_tag('Python', limit, cursor), 1) == [[12], [6]]
+    # A cursor past the oldest post is an empty last page
+    assert repository.page(True, 5, ('2024-01-01T00:00:00', 1)) == ([], None)
+    assert repository.page_by_tag('Python', 5, 1) == ([], None)
+
+def test_pages_by_author(repository):
+    posts = [make_post(n, published=n <= 6) for n in range(1, 10)]
+    for n, post in enumerate(posts, 1):
+        post['author'] = 'jane' if n % 2 else 'john'
+    repository.insert_many(posts)
+    repository.modify(3, lambda post: dict(post, author='john'))
+    pages = all_pages(lambda limit, cursor: repository.page(True, limit, cursor, author='jane'), 1)
+    assert pages == [[5], [1]]
+    pages = all_pages(lambda limit, cursor: repository.page(True, limit, cursor, author='john'), 5)
+    assert pages == [[6, 4, 3, 2]]
+
+def body_files(path):
+    return sorted(name for name in os.listdir(path) if name.endswith('.bodies'))
+
+def test_split_compaction_keeps_bodies(tmp_path):
+    """Replaced bodies are compacted into the next file; live ones stay readable"""
+    backend = SplitFileBackend(str(tmp_path / 'posts'), compact_bytes=1024)
+    repository = PostRepository(backend)
+    repository.insert_many([make_post(n) for n in range(1, 4)])
+    first = backend._file
+    for edition in range(10):
+        for n in range(1, 4):
+            repository.modify(n, lambda post: dict(post, body=f'Round {edition} of post {post["id"]} ' * 10))
+    assert body_files(tmp_path) != ['posts.0.bodies']
+    assert len(body_files(tmp_path)) == 1
+    # The file replaced by compaction is closed once nothing refers to it
+    assert first._file.closed
+    expected = snapshot(repository)
+    assert expected[2][1].startswith('Round 9 of post 2')
+    repository.close()
+
+    reopened = PostRepository(SplitFileBackend(str(tmp_path / 'posts'), compact_bytes=1024))
+    assert snapshot(reopened) == expected
+    summary, _ = reopened.page(True, 3, summary=True)
+    assert all('body' not in post for post in summary)
+    reopened.close()
+
+def test_split_imports_posts_json_once(tmp_path):
+    source = PostRepository(JsonFileBackend(str(tmp_path / 'posts.json')))
+    source.insert_many([make_post(1), make_post(2)])
+    expected = snapshot(source)
+    source.close()
+
+    base, import_path = str(tmp_path / 'posts'), str(tmp_path / 'posts.json')
+    first = PostRepository(SplitFileBackend(base, import_path=import_path))
+    first.modify(1, lambda post: dict(post, title='Changed'))
+    # A second process starting later must not import over the change
+    second = PostRepository(SplitFileBackend(base, import_path=import_path))
+    assert second.get(1)['title'] == 'Changed'
+    assert snapshot(second)[2] == expected[2]
+    first.close()
+    second.close()
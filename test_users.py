@@ -0,0 +1,187 @@
+"""
+Tests of the user accounts: the users.txt index, session identity claims
+and password hashing.
+"""
+
+import threading
+import pytest
+from app import create_app
+from controllers import auth_controller
+from controllers.passwords import (HashingBusy, HashingPool, hash_password, is_hashed,
+                                   needs_rehash, verify_password)
+from storage.post_repository import set_post_repository
+from storage.user_directory import UserDirectory
+
+@pytest.fixture
+def users_file(tmp_path):
+    path = tmp_path / 'users.txt'
+    path.write_text('admin,admin@example.com,admin123\njane,jane@example.com,janepass,4\n')
+    return path
+
+def test_lookups_by_email_and_username(users_file):
+    directory = UserDirectory(str(users_file))
+    assert directory.get('jane@example.com') == {'username': 'jane', 'email': 'jane@example.com',
+                                                 'password': 'janepass'}
+    assert directory.get_by_username('admin')['email'] == 'admin@example.com'
+    assert directory.get('nobody@example.com') is None
+    # Lines from before versions existed count as version 0
+    assert directory.version('admin@example.com') == 0
+    assert directory.version('jane@example.com') == 4
+    assert sorted(directory.all()) == ['admin@example.com', 'jane@example.com']
+
+def test_accounts_added_elsewhere_are_picked_up(users_file):
+    directory = UserDirectory(str(users_file))
+    other = UserDirectory(str(users_file))
+    assert directory.get('bob@example.com') is None
+    other.add('bob', 'bob@example.com', 'bobpass')
+    assert directory.get_by_username('bob')['email'] == 'bob@example.com'
+    # Re-created accounts never get an earlier version back
+    assert directory.version('bob@example.com') > 4
+
+def test_partial_line_is_read_once_complete(users_file):
+    directory = UserDirectory(str(users_file))
+    directory.get('admin@example.com')
+    with open(users_file, 'a') as f:
+        f.write('bob,bob@exam')
+    assert directory.get_by_username('bob') is None
+    with open(users_file, 'a') as f:
+        f.write('ple.com,bobpass,7\n')
+    assert directory.get('bob@example.com')['password'] == 'bobpass'
+
+def test_taken_email_or_username_is_rejected(users_file):
+    directory = UserDirectory(str(users_file))
+    with pytest.raises(ValueError):
+        directory.add('other', 'jane@example.com', 'x')
+    with pytest.raises(ValueError):
+        directory.add('jane', 'other@example.com', 'x')
+    assert users_file.read_text().count('\n') == 2
+
+def test_replaced_file_is_read_again(users_file):
+    directory = UserDirectory(str(users_file))
+    directory.get('admin@example.com')
+    replacement = users_file.parent / 'users.new'
+    replacement.write_text('carol,carol@example.com,carolpass,1\n')
+    replacement.replace(users_file)
+    assert directory.get('admin@example.com') is None
+    assert directory.get_by_username('carol')['email'] == 'carol@example.com'
+
+@pytest.fixture
+def directory(users_file, monkeypatch):
+    directory = UserDirectory(str(users_file))
+    monkeypatch.setattr(auth_controller, '_user_directory', directory)
+    monkeypatch.setattr(auth_controller, '_identity_versions', {})
+    return directory
+
+@pytest.fixture
+def app(directory, tmp_path):
+    app = create_app({
+        'STORAGE_BACKEND': 'json',
+        'POSTS_FILE': str(tmp_path / 'posts.json'),
+        'WTF_CSRF_ENABLED': False,
+        'PASSWORD_HASH_METHOD': 'pbkdf2_sha256',
+        'PASSWORD_HASH_COST': '1000',
+        'IDENTITY_RECHECK_SECONDS': 0
+    })
+    yield app
+    set_post_repository(None)
+
+def login(client, email='admin@example.com', password='admin123'):
+    return client.post('/login', data={'email': email, 'password': password})
+
+def logged_in(client):
+    """Drafts are only listed for a logged-in user"""
+    return client.get('/api/posts?published=false').status_code == 200
+
+def test_session_identity_does_not_read_accounts(app, directory, monkeypatch):
+    client = app.test_client()
+    login(client)
+    lookups = []
+    get = directory.get
+    monkeypatch.setattr(directory, 'get', lambda email: lookups.append(email) or get(email))
+    assert logged_in(client) and logged_in(client)
+    assert lookups == []
+
+def test_password_change_elsewhere_ends_sessions(app, users_file):
+    client = app.test_client()
+    login(client)
+    assert logged_in(client)
+    UserDirectory(str(users_file)).set_password('admin@example.com', 'changed')
+    assert not logged_in(client)
+    with client.session_transaction() as session:
+        assert 'user_id' not in session
+
+def test_rehash_keeps_sessions(app, users_file):
+    client = app.test_client()
+    login(client)
+    UserDirectory(str(users_file)).set_password('admin@example.com', 'admin123', rehash=True)
+    assert logged_in(client)
+
+def test_claim_for_another_account_is_rejected(app):
+    client = app.test_client()
+    login(client)
+    with client.session_transaction() as session:
+        session['user_id'] = 'jane@example.com'
+    assert not logged_in(client)
+
+def test_tampered_claim_is_rejected(app):
+    client = app.test_client()
+    login(client)
+    with client.session_transaction() as session:
+        session['identity'] = session['identity'][:-2] + 'xx'
+    assert not logged_in(client)
+
+@pytest.mark.parametrize('method, cost', [('scrypt', 10), ('pbkdf2_sha256', 1000)])
+def test_hashes_verify_and_are_salted(method, cost):
+    stored = hash_password('secret', method, cost)
+    assert stored.startswith(f'{method}${cost}$') and ',' not in stored
+    assert verify_password('secret', stored)
+    assert not verify_password('Secret', stored)
+    assert hash_password('secret', method, cost) != stored
+    assert not needs_rehash(stored, method, cost)
+    assert needs_rehash(stored, method, cost + 1)
+
+def test_plaintext_passwords_still_verify_and_need_rehash():
+    assert verify_password('admin123', 'admin123')
+    assert not verify_password('admin12', 'admin123')
+    assert not is_hashed('admin123')
+    assert needs_rehash('admin123', 'pbkdf2_sha256', 1000)
+
+def test_login_upgrades_plaintext_and_keeps_version(app, directory):
+    client = app.test_client()
+    login(client, 'jane@example.com', 'janepass')
+    stored = directory.get('jane@example.com')['password']
+    assert stored.startswith('pbkdf2_sha256$1000$') and verify_password('janepass', stored)
+    assert directory.version('jane@example.com') == 4
+    assert directory.get('admin@example.com')['password'] == 'admin123'
+    assert logged_in(client)
+
+def test_wrong_password_or_unknown_account_is_refused(app):
+    client = app.test_client()
+    login(client, 'jane@example.com', 'admin123')
+    assert not logged_in(client)
+    login(client, 'nobody@example.com', 'admin123')
+    assert not logged_in(client)
+
+def test_full_hashing_pool_fails_fast():
+    pool = HashingPool(workers=1, max_queue=1)
+    started, release = threading.Event(), threading.Event()
+    worker = threading.Thread(target=pool.run, args=(lambda: started.set() or release.wait(),))
+    worker.start()
+    started.wait()
+    with pytest.raises(HashingBusy):
+        pool.run(lambda: None)
+    release.set()
+    worker.join()
+    assert pool.run(lambda: 'done') == 'done'
+    pool.shutdown()
+
+def test_leftover_plaintext_is_hashed_in_place(app, directory):
+    with app.app_context():
+        changed = auth_controller.hash_plaintext_passwords(
+            lambda password: hash_password(password, 'pbkdf2_sha256', 1000))
+    assert changed == 2
+    users = directory.all()
+    assert all(is_hashed(user['password']) for user in users.values())
+    assert verify_password('janepass', users['jane@example.com']['password'])
+    # Sessions survive: versions are unchanged
+    assert directory.version('jane@example.com') == 4